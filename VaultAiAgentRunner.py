@@ -1,3 +1,6 @@
+import contextlib
+import copy
+import io
 import json
 import os
 import re
@@ -7,12 +10,19 @@ import subprocess
 import time
 import uuid
 import hashlib
+import itertools
+import queue
+import secrets
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from enum import Enum
 from typing import Dict, Optional, Any, List, Tuple
 from user.UserInteractionHandler import UserInteractionHandler
 from security.SecurityValidator import SecurityValidator
 from context.ContextManager import ContextManager
-from ai.AICommunicationHandler import AICommunicationHandler
+from ai.AICommunicationHandler import AICommunicationHandler, single_to_double_quotes
 from ai.PromptFilter import compress_prompt, estimate_token_savings
 from ai.LogCompressor import LogCompressor, DynamicLogCompressor, should_compress,should_compress_adaptive
 from ai.detect_output_type import detect_output_type, summarize_table 
@@ -46,6 +56,13 @@ try:
 except ImportError:
     CRITIC_SUB_AGENT_AVAILABLE = False
 
+# Optional fast JSON parser (falls back to the stdlib json module)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Import our enhanced JSON validator
 try:
     from json_validator.JsonValidator import create_validator
@@ -53,9 +70,313 @@ try:
 except ImportError:
     JSON_VALIDATOR_AVAILABLE = False
 
+# Fenced ```json block; non-greedy so concatenated replies stop at the first closing fence
+_JSON_FENCE_RE = re.compile(r'```json\s*(\{.*?\}|\[.*?\])\s*```', re.DOTALL)
+_JSON_SPAN_RE = re.compile(r'[\{\[]')
+
+
+def _find_json_span(text: str) -> Optional[str]:
+    """
+    Return the first balanced JSON object/array in text, or None.
+
+    Single linear pass from the first '{' or '[' that tracks nesting depth and
+    skips brackets inside string literals (honouring backslash escapes).
+    """
+    match = _JSON_SPAN_RE.search(text)
+    if not match:
+        return None
+    start = match.start()
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '{' or ch == '[':
+            depth += 1
+        elif ch == '}' or ch == ']':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+_CODE_FENCE_RE = re.compile(r'```[A-Za-z0-9_-]*\s*(.*?)\s*```', re.DOTALL)
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """
+    Drop commas directly followed (after whitespace) by '}' or ']'.
+
+    String literals are skipped (honouring backslash escapes), so a value such
+    as "echo {a,}" reaches the tool exactly as the model wrote it.
+    """
+    out = []
+    in_string = False
+    escaped = False
+    n = len(text)
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == ',':
+            j = i + 1
+            while j < n and text[j].isspace():
+                j += 1
+            if j < n and text[j] in '}]':
+                continue
+        out.append(ch)
+    return ''.join(out)
+
+
+def _local_salvage_json(text: str) -> Optional[Any]:
+    """
+    Try to repair a malformed AI reply locally before asking the model again.
+
+    Steps, each followed by a parse attempt: strip code fences, take the first
+    balanced JSON span, drop trailing commas, convert single-quoted strings.
+    Returns the parsed dict/list or None. A truncated reply is never closed up
+    here: its action list may be cut short, so it goes back to the model.
+    """
+    if not text:
+        return None
+
+    def _try(candidate):
+        try:
+            data = _json_loads(candidate)
+        except (ValueError, TypeError):
+            return None
+        return data if isinstance(data, (dict, list)) else None
+
+    candidate = text.strip()
+    fence = _CODE_FENCE_RE.search(candidate)
+    if fence:
+        candidate = fence.group(1)
+        data = _try(candidate)
+        if data is not None:
+            return data
+
+    span = _find_json_span(candidate)
+    if span is None:
+        return None
+    data = _try(span)
+    if data is not None:
+        return data
+
+    span = _strip_trailing_commas(span)
+    data = _try(span)
+    if data is not None:
+        return data
+
+    if "'" not in span:
+        return None
+    return _try(single_to_double_quotes(span))
+
+
+class HandlerResult(Enum):
+    """Outcome of a tool handler for the action loop."""
+    CONTINUE = "continue"   # proceed with the next action
+    STOP = "stop"           # stop processing actions and end the agent turn
+    FINISH = "finish"       # task finished; stop the agent
+
+
+# Per-step request ids only correlate log lines, so a process-wide tag plus a
+# counter is enough; avoids a UUID object and urandom read per step
+_RUN_TAG = secrets.token_hex(4)
+_REQUEST_IDS = itertools.count()
+
+
+def _next_request_id() -> str:
+    return f"{_RUN_TAG}-{next(_REQUEST_IDS):x}"
+
+
+# Static parts of the refusal justification prompt
+_PROMPT_JUSTIFY_PREFIX = "\nVaultAI> Provide justification for refusing"
+_PROMPT_JUSTIFY_SUFFIX = " and press Ctrl+S to submit.\n"
+
+
+def _json_loads(text: str) -> Any:
+    """Parse JSON text with orjson when available; raises json.JSONDecodeError on invalid input."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _json_dumps(data: Any) -> str:
+    """Serialize data to a compact JSON string (non-ASCII kept as is), using orjson when available."""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(data).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+# Commands that only inspect the system; used to spot bash actions that are safe to reorder
+_READONLY_CMDS = frozenset({
+    "ls", "cat", "grep", "stat", "find", "head", "tail", "wc", "file", "which", "echo",
+})
+# Shell syntax that can redirect, chain or substitute, making any command a potential write
+_SHELL_META_RE = re.compile(r"[;&|<>`$\n]")
+# find predicates and options that only test or print; anything else (-exec, -delete, -fprint...) may write
+_FIND_READONLY_FLAGS = frozenset({
+    "-name", "-iname", "-path", "-ipath", "-wholename", "-iwholename", "-regex", "-iregex", "-regextype",
+    "-lname", "-ilname", "-type", "-xtype", "-size", "-empty", "-perm", "-user", "-group", "-uid", "-gid",
+    "-nouser", "-nogroup", "-links", "-inum", "-samefile", "-newer", "-mtime", "-mmin", "-atime", "-amin",
+    "-ctime", "-cmin", "-daystart", "-readable", "-writable", "-executable", "-fstype", "-maxdepth",
+    "-mindepth", "-depth", "-xdev", "-mount", "-noleaf", "-follow", "-prune", "-quit", "-true", "-false",
+    "-not", "-and", "-or", "-a", "-o", "-print", "-print0", "-printf", "-ls", "-H", "-L", "-P",
+})
+
+
+def _is_readonly(command: Any) -> bool:
+    """True for a single read-only command with no redirection, pipes or substitution."""
+    if not isinstance(command, str) or _SHELL_META_RE.search(command):
+        return False
+    words = command.split()
+    if not words or words[0] not in _READONLY_CMDS:
+        return False
+    if words[0] == "find":
+        # Numeric arguments such as "-mtime -1" or "-size -10k" are not predicates
+        return all(
+            w in _FIND_READONLY_FLAGS
+            for w in words[1:]
+            if w.startswith("-") and not w[1:2].isdigit() and w[1:2] != "+"
+        )
+    if words[0] == "tail":
+        # Following a file never terminates
+        return not any(
+            w.startswith("--follow") or (w.startswith("-") and not w.startswith("--") and ("f" in w or "F" in w))
+            for w in words[1:]
+        )
+    return True
+
+
+def _coerce_positive_number(value: Any) -> Optional[float]:
+    """Positive int/float, also from a numeric string; None when invalid."""
+    if isinstance(value, str):
+        try:
+            value = float(value.strip())
+        except ValueError:
+            return None
+        if value.is_integer():
+            value = int(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value < float("inf"):
+        return None
+    return value
+
+
+def _coerce_choice(value: Any, choices: Any) -> Optional[str]:
+    """value as one of choices, ignoring case and surrounding whitespace; None when invalid."""
+    if not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    return value if value in choices else None
+
+
+def _summarize_output(out: str, max_head: int = 2000, max_tail: int = 1000) -> str:
+    """
+    Shrink raw command output before it goes into the context: collapse runs of
+    identical lines (progress bars, repeated warnings) and, if still too long,
+    keep only the head and tail around an elision marker.
+    """
+    if not out:
+        return out
+    lines = out.splitlines()
+    collapsed = []
+    for line, group in itertools.groupby(lines):
+        repeats = sum(1 for _ in group)
+        collapsed.append(line)
+        if repeats > 1:
+            collapsed.append(f"... [previous line repeated {repeats - 1} more times]")
+    if len(collapsed) < len(lines):
+        out = "\n".join(collapsed)
+    if len(out) > max_head + max_tail + 200:
+        elided = len(out) - max_head - max_tail
+        out = f"{out[:max_head]}\n... [{elided} chars elided] ...\n{out[-max_tail:]}"
+    return out
+
+
 class VaultAIAgentRunner:
     # Maximum number of steps per task execution before stopping
     MAX_STEPS_DEFAULT = 100
+    # Most recent executed-step lines kept in self.steps
+    STEP_LOG_SIZE = 500
+
+    # Read-through cache for web search results (entries, seconds)
+    WEB_SEARCH_CACHE_SIZE = 64
+    WEB_SEARCH_CACHE_TTL = 600
+    # Max concurrent searches when prefetching a batch of web_search_agent actions
+    WEB_SEARCH_PREFETCH_WORKERS = 4
+    # Max concurrent read-only bash commands when prefetching a batch of actions
+    COMMAND_PREFETCH_WORKERS = 4
+    # Tools that change nothing on the target, so read-only commands may run ahead of them
+    _NON_MUTATING_TOOLS = frozenset({
+        "read_file", "list_directory", "search_in_file", "update_plan_step",
+        "create_action_plan", "web_search_agent",
+    })
+
+    # Tools accepted in the agent loop (in the order they are listed to the AI)
+    _VALID_TOOLS = (
+        "create_action_plan", "bash", "read_file", "write_file", "edit_file",
+        "list_directory", "search_in_file", "copy_file", "delete_file", "analysis_data",
+        "update_plan_step", "ask_user", "web_search_agent", "finish",
+    )
+
+    # Backward compatibility tool names
+    _TOOL_ALIASES = {"analyze_data": "analysis_data", "final": "finish"}
+
+    # Required fields per tool; a tuple entry means any one of the names is enough
+    _REQUIRED_FIELDS = {
+        "bash": ("command",),
+        "read_file": ("path",),
+        "write_file": ("path", "content"),
+        "edit_file": ("path", "action"),
+        "list_directory": (("path", "command_or_path"),),
+        "search_in_file": ("path", "query"),
+        "copy_file": ("source", "destination"),
+        "delete_file": ("path",),
+        "update_plan_step": ("step_number", "status"),
+        "web_search_agent": ("query",),
+    }
+
+    # Fields where an empty string is a valid value (e.g. writing an empty file)
+    _EMPTY_ALLOWED_FIELDS = frozenset(("content",))
+
+    # Plan step statuses the AI may set through update_plan_step
+    _PLAN_STEP_STATUSES = {
+        "completed": StepStatus.COMPLETED,
+        "failed": StepStatus.FAILED,
+        "skipped": StepStatus.SKIPPED,
+        "in_progress": StepStatus.IN_PROGRESS,
+    }
+
+    # Value checks per tool: (field, coerce, requirement); coerce returns the normalized
+    # value or None when it is invalid. Absent fields are not checked, and an action
+    # with an invalid value is skipped on its own rather than failing the whole turn.
+    _FIELD_CHECKS = {
+        "bash": (
+            ("timeout", _coerce_positive_number, "must be a positive number"),
+        ),
+        "update_plan_step": (
+            ("status", lambda v: _coerce_choice(v, VaultAIAgentRunner._PLAN_STEP_STATUSES),
+             "must be one of: completed, failed, skipped, in_progress"),
+        ),
+    }
 
     def __init__(self, 
                 terminal, 
@@ -81,6 +402,10 @@ class VaultAIAgentRunner:
             self.input_text = f"{user+'@' if user else ''}{host}{':'+str(terminal.port) if terminal.port else ''}"
             self.linux_distro, self.linux_version = terminal.remote_linux_distro
 
+        # Input prompt prefixes; input_text is fixed for the lifetime of the runner
+        self._input_prompt = f"{self.input_text}> "
+        self._input_prompt_indented = f"{self.input_text}>  "
+
         if self.linux_distro == "Unknown":
             terminal.print_console("Could not detect Linux distribution. Please ensure you are running this on a Linux system.")
             raise RuntimeError("Linux distribution detection failed.")
@@ -148,15 +473,25 @@ class VaultAIAgentRunner:
         try:
             self.logger = terminal.logger
         except Exception:
-            import logging
             self.logger = logging.getLogger("VaultAIAgentRunner")
+        # Cached debug flag for the step loop; refreshed at the start of run()
+        self._debug = self.logger.isEnabledFor(logging.DEBUG)
 
         self.user = user
         self.host = host
         self.window_size = window_size
 
         # Initialize ContextManager for conversation context and sliding window functionality
-        self.context_manager = ContextManager(window_size=window_size, logger=self.logger, runner=self)
+        self.context_manager = ContextManager(
+            window_size=window_size,
+            logger=self.logger,
+            runner=self,
+            # Approximate token budget (chars/4) for verbatim window messages; 0 disables
+            max_window_tokens=int(os.getenv("CONTEXT_MAX_WINDOW_TOKENS", "24000")),
+            # Messages folded into the rolling summary per summarizer call; 0 folds the whole backlog
+            summary_chunk_size=int(os.getenv("CONTEXT_SUMMARY_CHUNK_SIZE", "0")),
+            transcript_path=self._transcript_path(),
+        )
 
         # Initialize context with system prompt and user goal
         self.context_manager.add_system_message(self.system_prompt_agent)
@@ -166,7 +501,8 @@ class VaultAIAgentRunner:
         filtered_goal = compress_prompt(user_goal)
         self.context_manager.add_user_message(f"Your goal: {filtered_goal}.")
 
-        self.steps = []
+        self.steps = deque(maxlen=self.STEP_LOG_SIZE)
+        self._step_counter = 0  # Step labels keep counting after old lines are evicted
         self.command_results = []  # Store command execution results for critic evaluation
         self.summary = ""
         self.goal_success = False
@@ -219,11 +555,17 @@ class VaultAIAgentRunner:
             except Exception as e:
                 self.logger.warning(f"Failed to initialize enhanced JSON validator: {e}")
                 self.json_validator = None
+        # Plan progress updates buffered during one batch of actions
+        self._pending_plan_updates: List[Tuple[str, bool]] = []
+
         # Configurable max steps limit (prevents infinite loops)
         self.max_steps = max_steps if max_steps is not None else self.MAX_STEPS_DEFAULT
 
         # Initialize WebSearchAgent as singleton (avoids re-creating per call)
         self.web_search_agent = None
+        self._web_search_cache: "OrderedDict[tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # (command, timeout) -> (output, exit code) of read-only commands run ahead by the prefetch
+        self._prefetched_commands: Dict[Tuple[str, Any], Tuple[str, int]] = {}
         if WEB_SEARCH_AGENT_AVAILABLE:
             try:
                 self.web_search_agent = WebSearchAgent(
@@ -798,9 +1140,272 @@ class VaultAIAgentRunner:
             request_format="text"  # Summarization doesn't need JSON
         )
 
+    def _send_agent_request(self, prompt_text: str) -> Optional[str]:
+        """
+        Send the agent-loop request from a worker thread while the main thread waits.
+
+        The main thread polls the result every 0.5s, so Ctrl+C is handled
+        immediately instead of after the HTTP call returns, and shows a
+        spinner meanwhile. The worker is a daemon thread: a cancelled request
+        is abandoned and cannot keep the process alive at exit.
+
+        Raises:
+            KeyboardInterrupt: The user cancelled while waiting for the reply.
+        """
+        result_queue = queue.Queue(maxsize=1)
+
+        def target_function():
+            try:
+                result_queue.put((self.ai_handler.send_request(
+                    system_prompt=self.system_prompt_agent,
+                    user_prompt=prompt_text,
+                    request_format="json"
+                ), None))
+            except Exception as e:
+                result_queue.put((None, e))
+
+        threading.Thread(target=target_function, daemon=True).start()
+
+        console = getattr(self.terminal, "console", None)
+        if console is not None and threading.current_thread() is threading.main_thread():
+            status = console.status("VaultAI> Waiting for AI response... (Ctrl+C to cancel)")
+        else:
+            status = contextlib.nullcontext()
+        with status:
+            while True:
+                try:
+                    reply, error = result_queue.get(timeout=0.5)
+                    break
+                except queue.Empty:
+                    continue
+        if error is not None:
+            raise error
+        return reply
+
+    def _cached_web_search(self, query: str, max_sources: Any, deep_search: Any) -> Dict[str, Any]:
+        """
+        Run a web search through the singleton WebSearchAgent, reusing recent results.
+
+        Successful results are kept in an LRU cache keyed by
+        (query, engine, max_sources, deep_search) for WEB_SEARCH_CACHE_TTL seconds.
+        """
+        key = self._web_search_cache_key(query, max_sources, deep_search)
+        now = time.monotonic()
+
+        cached = self._web_search_cache.get(key)
+        if cached is not None:
+            stored_at, result = cached
+            if now - stored_at < self.WEB_SEARCH_CACHE_TTL:
+                self._web_search_cache.move_to_end(key)
+                self.logger.debug("Web search cache hit: query='%s', engine=%s", query, key[1])
+                return result
+            del self._web_search_cache[key]
+
+        result = self.web_search_agent.execute(
+            query=query,
+            max_sources=max_sources,
+            deep_search=deep_search
+        )
+        if result.get('success'):
+            self._web_search_cache[key] = (now, result)
+            if len(self._web_search_cache) > self.WEB_SEARCH_CACHE_SIZE:
+                self._web_search_cache.popitem(last=False)
+        return result
+
+    def _web_search_cache_key(self, query: str, max_sources: Any, deep_search: Any) -> tuple:
+        return (query, self.web_search_agent.config.get("engine"), max_sources, deep_search)
+
+    def _run_isolated_web_search(self, query: str, max_sources: Any, deep_search: Any) -> Dict[str, Any]:
+        # WebSearchAgent keeps per-search results on the instance, so each worker gets a
+        # shallow copy of the configured agent with fresh result state instead of sharing it
+        agent = copy.copy(self.web_search_agent)
+        agent.aggregated_sources = []
+        agent.iteration_count = 0
+        return agent.execute(query=query, max_sources=max_sources, deep_search=deep_search)
+
+    def _prefetch_web_searches(self, actions_to_process: List[Dict[str, Any]]) -> None:
+        """
+        Run the distinct web searches of one batch concurrently and store them in the cache.
+
+        Only used in auto-accept mode, where no confirmation prompt sits between
+        actions; the dispatch loop then picks the results up from the cache in order.
+        """
+        if not self.terminal.auto_accept or self.web_search_agent is None:
+            return
+
+        pending = set()
+        for action_item in actions_to_process:
+            if action_item.get("tool") != "web_search_agent" or not isinstance(action_item.get("query"), str):
+                continue
+            key = self._web_search_cache_key(
+                action_item.get("query"),
+                action_item.get("max_sources", 5),
+                action_item.get("deep_search", True),
+            )
+            try:
+                cached = key in self._web_search_cache
+            except TypeError:
+                continue  # unhashable arguments; left to the dispatch loop
+            if not cached:
+                pending.add(key)
+        if len(pending) < 2:
+            return
+
+        self.logger.info("Prefetching %d web searches concurrently", len(pending))
+        workers = min(len(pending), self.WEB_SEARCH_PREFETCH_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                key: executor.submit(self._run_isolated_web_search, key[0], key[2], key[3])
+                for key in pending
+            }
+
+        now = time.monotonic()
+        for key, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                # The search is retried serially by the dispatch loop
+                self.logger.warning("Web search prefetch failed for query '%s': %s", key[0], e)
+                continue
+            if result.get('success'):
+                self._web_search_cache[key] = (now, result)
+                if len(self._web_search_cache) > self.WEB_SEARCH_CACHE_SIZE:
+                    self._web_search_cache.popitem(last=False)
+
+    def _run_command(self, command: str, timeout: Any) -> Tuple[str, int]:
+        """Run a bash command locally or on the SSH target and return (output, exit code)."""
+        if self.terminal.ssh_connection:
+            remote = f"{self.terminal.user}@{self.terminal.host}" if self.terminal.user and self.terminal.host else self.terminal.host
+            password = getattr(self.terminal, "ssh_password", None)
+            return self.terminal.execute_remote_pexpect(command, remote, password=password, timeout=timeout)
+        return self.terminal.execute_local(command, timeout=timeout)
+
+    def _prefetch_readonly_commands(self, actions_to_process: List[Dict[str, Any]]) -> None:
+        """
+        Run the read-only bash commands at the head of one batch concurrently.
+
+        Commands are collected up to the first action that may change the target
+        (any other bash command, file writes, ask_user, finish, ...), so running
+        them early cannot observe a different state than running them in order.
+        Only used in auto-accept mode; over SSH only once a password is cached, so
+        no two threads can end up prompting for it. _handle_bash then takes the
+        results from _prefetched_commands in the original order.
+        """
+        terminal = self.terminal
+        if not terminal.auto_accept:
+            return
+        if terminal.ssh_connection and not getattr(terminal, "ssh_password", None):
+            return
+
+        pending = []
+        for action_item in actions_to_process:
+            tool = action_item.get("tool")
+            if tool in self._NON_MUTATING_TOOLS:
+                continue
+            if tool != "bash" or not _is_readonly(action_item.get("command")):
+                break
+            key = (action_item["command"], action_item.get("timeout"))
+            if not isinstance(key[1], (int, float, type(None))):
+                break
+            if key in pending:
+                continue
+            if terminal.block_dangerous_commands and not self.security_validator.validate_command(key[0])[0]:
+                continue
+            pending.append(key)
+        if len(pending) < 2:
+            return
+
+        self.logger.info("Prefetching %d read-only commands concurrently", len(pending))
+        workers = min(len(pending), self.COMMAND_PREFETCH_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {key: executor.submit(self._run_command, key[0], key[1]) for key in pending}
+
+        for key, future in futures.items():
+            try:
+                self._prefetched_commands[key] = future.result()
+            except Exception as e:
+                # The command is run again serially by _handle_bash
+                self.logger.warning("Command prefetch failed for '%s': %s", key[0], e)
+
     def _get_user_input(self, prompt_text: str, multiline: bool = False) -> str:
         return self.user_interaction_handler._get_user_input(prompt_text, multiline)
 
+    def _is_field_missing(self, action_item: Dict[str, Any], field: str) -> bool:
+        value = action_item.get(field)
+        if value is None:
+            return True
+        return value == "" and field not in self._EMPTY_ALLOWED_FIELDS
+
+    def _validate_actions(self, actions_to_process: List[Any]) -> List[str]:
+        """
+        Check every action of a turn before any of them is executed.
+
+        Returns:
+            List of validation error messages (empty when all actions are valid)
+        """
+        errors = []
+        for idx, action_item in enumerate(actions_to_process, start=1):
+            if not isinstance(action_item, dict):
+                errors.append(f"Action item {idx} is not a dictionary: {action_item}.")
+                continue
+
+            tool = action_item.get("tool")
+            if tool is None:
+                errors.append(f"Action item {idx} is missing the required 'tool' field: {action_item}.")
+                continue
+
+            if not isinstance(tool, str):
+                errors.append(f"Action item {idx} uses an invalid tool: {tool!r} in {action_item}.")
+                continue
+            tool = self._TOOL_ALIASES.get(tool, tool)
+            if tool not in self._VALID_TOOLS:
+                errors.append(f"Action item {idx} uses an invalid tool: '{tool}' in {action_item}.")
+                continue
+
+            missing = []
+            for required in self._REQUIRED_FIELDS.get(tool, ()):
+                if isinstance(required, tuple):
+                    if all(self._is_field_missing(action_item, name) for name in required):
+                        missing.append(" or ".join(f"'{name}'" for name in required))
+                elif self._is_field_missing(action_item, required):
+                    missing.append(f"'{required}'")
+            if missing:
+                errors.append(f"Action item {idx} ('{tool}') is missing {', '.join(missing)}: {action_item}.")
+        return errors
+
+    def _apply_field_checks(self, actions_to_process: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Normalize checked field values in place (e.g. a "30" timeout becomes 30).
+
+        Returns:
+            (actions to run, messages for the actions skipped because of an invalid value)
+        """
+        kept, skipped = [], []
+        for idx, action_item in enumerate(actions_to_process, start=1):
+            tool = self._TOOL_ALIASES.get(action_item.get("tool"), action_item.get("tool"))
+            problem = None
+            for field, coerce, requirement in self._FIELD_CHECKS.get(tool, ()):
+                value = action_item.get(field)
+                if value is None:
+                    continue
+                normalized = coerce(value)
+                if normalized is None:
+                    problem = f"Action item {idx} ('{tool}') has invalid '{field}' {value!r}: {requirement}."
+                    break
+                action_item[field] = normalized
+            if problem is None:
+                kept.append(action_item)
+            else:
+                skipped.append(problem)
+        return kept, skipped
+
+    def _ask_refusal_justification(self, subject: str = "") -> str:
+        """Ask the user why an action was refused; only called on the refusal path."""
+        return self._get_user_input(
+            f"{_PROMPT_JUSTIFY_PREFIX}{subject}{_PROMPT_JUSTIFY_SUFFIX}{self._input_prompt_indented}",
+            multiline=True,
+        ).strip()
+
     def _validate_analysis_data_arguments(
         self, action_item: Dict[str, Any]
     ) -> Tuple[bool, Optional[Dict[str, Any]], str]:
@@ -1194,28 +1799,39 @@ class VaultAIAgentRunner:
 
     def _update_plan_progress(self, action_description: str, success: bool = True):
         """
-        Update plan progress after action execution using ActionPlanManager.
+        Queue a plan progress update after action execution.
+        
+        Updates are buffered for the current batch of actions and applied by
+        _flush_plan_updates() in a single ActionPlanManager call.
         
         Args:
             action_description: Description of executed action
             success: Whether action completed successfully
         """
+        if not self.plan_manager.steps:
+            return
+        self._pending_plan_updates.append((action_description, success))
+
+    def _flush_plan_updates(self):
+        """Apply buffered plan progress updates and display compact progress once."""
+        if not self._pending_plan_updates:
+            return
+        pending = self._pending_plan_updates
+        self._pending_plan_updates = []
         if not self.plan_manager.steps:
             return
         
-        # Find first pending or in-progress step
-        current_step = self.plan_manager.get_current_step()
-        if current_step:
-            # Use the proper ActionPlanManager method
-            status = StepStatus.COMPLETED if success else StepStatus.FAILED
-            self.plan_manager.mark_step_status(current_step.number, status, action_description)
-        else:
-            # If no step in progress, mark next pending one
-            next_step = self.plan_manager.get_next_pending_step()
-            if next_step:
-                # Use the proper ActionPlanManager method
-                status = StepStatus.COMPLETED if success else StepStatus.FAILED
-                self.plan_manager.mark_step_status(next_step.number, status, action_description)
+        # Same order as repeated get_current_step()/get_next_pending_step() calls:
+        # steps in progress first, then pending steps
+        steps = self.plan_manager.steps
+        targets = [s for s in steps if s.status == StepStatus.IN_PROGRESS]
+        targets.extend(s for s in steps if s.status == StepStatus.PENDING)
+        
+        updates = [
+            (step.number, StepStatus.COMPLETED if success else StepStatus.FAILED, description)
+            for step, (description, success) in zip(targets, pending)
+        ]
+        self.plan_manager.mark_steps_bulk(updates)
         
         # Display compact progress
         self.plan_manager.display_compact()
@@ -1254,6 +1870,17 @@ class VaultAIAgentRunner:
         
         return "\n".join(lines)
 
+    @staticmethod
+    def _transcript_path() -> Optional[str]:
+        """Per-run JSONL transcript file under CONTEXT_TRANSCRIPT_DIR, or None when unset."""
+        transcript_dir = os.getenv("CONTEXT_TRANSCRIPT_DIR", "").strip()
+        if not transcript_dir:
+            return None
+        return os.path.join(
+            transcript_dir,
+            f"transcript-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl",
+        )
+
     def _sliding_window_context(self):
         """
         Build a sliding-window context combining summarization and persistent state.
@@ -1261,7 +1888,7 @@ class VaultAIAgentRunner:
         Behavior:
         - Always keep the first two messages (system + user goal).
         - If there are older messages beyond the sliding window, summarize them
-          into a single system message (generated by _summarize).
+          into a single assistant "[Conversation memory]" message (generated by _summarize).
         - Keep the last `self.window_size` messages verbatim.
         - Inject the current persistent state (`self.state`) as a final system message.
 
@@ -1272,6 +1899,42 @@ class VaultAIAgentRunner:
         state = getattr(self, "state", None)
         return self.context_manager.get_sliding_window_context(state)
 
+    def _iter_sliding_window_context(self):
+        """(role, content) generator over the sliding window, for streaming into a prompt."""
+        return self.context_manager.iter_sliding_window_context(getattr(self, "state", None))
+
+    @staticmethod
+    def _render_prompt_text(window_context, extra_system: Optional[str] = None) -> str:
+        """
+        Render non-system context messages as "role: content" lines.
+
+        Writes straight into one buffer instead of building a per-message
+        f-string and joining them afterwards.
+
+        Args:
+            window_context: (role, content) pairs from _iter_sliding_window_context().
+            extra_system: Optional text appended as a trailing "system:" line.
+
+        Returns:
+            str: Newline-separated prompt text (no trailing newline).
+        """
+        out = io.StringIO()
+        write = out.write
+        sep = ""
+        for role, content in window_context:
+            if role == "system":  # System prompt is handled by connect methods or prepended
+                continue
+            write(sep)
+            write(role)
+            write(": ")
+            write(content)
+            sep = "\n"
+        if extra_system:
+            write(sep)
+            write("system: ")
+            write(extra_system)
+        return out.getvalue()
+
     # ------------------------------------------------------------------
     # Compact pipeline helpers
     # ------------------------------------------------------------------
@@ -1418,7 +2081,7 @@ class VaultAIAgentRunner:
         if response is None:
             return None
         try:
-            data = json.loads(response)
+            data = _json_loads(response)
         except Exception:
             return None
         if not isinstance(data, dict):
@@ -1482,8 +2145,8 @@ class VaultAIAgentRunner:
 
             if not terminal.auto_accept:
                 confirm_prompt_text = f"\nVaultAI> Execute command: '{command}'? [y/N]: "
-                confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                if confirm != 'y':
+                confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+                if confirm[:1] not in ('y', 'Y'):
                     return False, "User refused command execution"
 
             terminal.print_console(f"\nVaultAI> Executing: {command}")
@@ -1511,8 +2174,8 @@ class VaultAIAgentRunner:
 
             if not terminal.auto_accept:
                 confirm_prompt_text = f"\nVaultAI> Read file '{path}'? [y/N]: "
-                confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                if confirm != 'y':
+                confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+                if confirm[:1] not in ('y', 'Y'):
                     return False, "User refused file read"
 
             result = self.file_operator.read_file(path, start_line or None, end_line or None, "")
@@ -1541,8 +2204,8 @@ class VaultAIAgentRunner:
 
             if not terminal.auto_accept:
                 confirm_prompt_text = f"\nVaultAI> Write file '{path}'? [y/N]: "
-                confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                if confirm != 'y':
+                confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+                if confirm[:1] not in ('y', 'Y'):
                     return False, "User refused file write"
 
             success = self.file_operator.write_file(path, content, "")
@@ -1562,8 +2225,8 @@ class VaultAIAgentRunner:
 
             if not terminal.auto_accept:
                 confirm_prompt_text = f"\nVaultAI> Edit file '{path}'? [y/N]: "
-                confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                if confirm != 'y':
+                confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+                if confirm[:1] not in ('y', 'Y'):
                     return False, "User refused file edit"
 
             success = self.file_operator.edit_file(path, edit_action, search, replace, line, "")
@@ -1581,8 +2244,8 @@ class VaultAIAgentRunner:
 
             if not terminal.auto_accept:
                 confirm_prompt_text = f"\nVaultAI> List directory '{path}'? [y/N]: "
-                confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                if confirm != 'y':
+                confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+                if confirm[:1] not in ('y', 'Y'):
                     return False, "User refused directory listing"
 
             result = self.file_operator.list_directory(path, recursive, pattern or None, "")
@@ -1615,8 +2278,8 @@ class VaultAIAgentRunner:
 
             if not terminal.auto_accept:
                 confirm_prompt_text = f"\nVaultAI> Copy '{source}' to '{destination}'? [y/N]: "
-                confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                if confirm != 'y':
+                confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+                if confirm[:1] not in ('y', 'Y'):
                     return False, "User refused copy"
 
             result = self.file_operator.copy_file(source, destination, overwrite, "")
@@ -1640,8 +2303,8 @@ class VaultAIAgentRunner:
 
             if not terminal.auto_accept:
                 confirm_prompt_text = f"\nVaultAI> Delete '{path}'? [y/N]: "
-                confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                if confirm != 'y':
+                confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+                if confirm[:1] not in ('y', 'Y'):
                     return False, "User refused delete"
 
             result = self.file_operator.delete_file(path, backup, "")
@@ -1857,6 +2520,17 @@ class VaultAIAgentRunner:
         # Start timing JSON validation
         json_timing_id = self._start_timing("JSON_VALIDATION")
         
+        # Fast path: well-formed replies are a bare JSON object/array and need no repair strategies
+        stripped_reply = ai_reply.strip()
+        if stripped_reply[:1] in ('{', '['):
+            try:
+                data = _json_loads(stripped_reply)
+            except ValueError:
+                data = None
+            if isinstance(data, (dict, list)):
+                self._end_timing(json_timing_id, "JSON_VALIDATION", True)
+                return True, data, stripped_reply, False, ""
+        
         if not self.json_validator:
             # Fallback to original parsing if enhanced validator is not available
             result = self._parse_ai_response_original(ai_reply, request_id)
@@ -1869,7 +2543,7 @@ class VaultAIAgentRunner:
             
             if success:
                 # Successfully parsed with enhanced validator - always serialize to JSON string
-                ai_reply_json_string = json.dumps(data, ensure_ascii=False)
+                ai_reply_json_string = _json_dumps(data)
                 self.logger.debug(f"Enhanced JSON validator successfully parsed response. request_id={request_id}")
                 # End timing JSON validation (success with enhanced validator)
                 self._end_timing(json_timing_id, "JSON_VALIDATION", True)
@@ -1889,6 +2563,13 @@ class VaultAIAgentRunner:
             self._end_timing(json_timing_id, "JSON_VALIDATION", result[0])
             return result
 
+    def _extract_json_candidate(self, text: str) -> Optional[str]:
+        """Return the JSON text from a ```json fence, else the first balanced JSON span."""
+        json_match = _JSON_FENCE_RE.search(text)
+        if json_match:
+            return json_match.group(1)
+        return _find_json_span(text)
+
     def _parse_ai_response_original(self, ai_reply: str, request_id: str) -> tuple:
         """
         Original AI response parsing logic (kept for fallback compatibility).
@@ -1899,21 +2580,24 @@ class VaultAIAgentRunner:
         error_message = ""
 
         try:
-            json_match = re.search(r'```json\s*(\{.*\}|\[.*\])\s*```', ai_reply, re.DOTALL)
-            if not json_match:
-                json_match = re.search(r'(\{.*\}|\[.*\])', ai_reply, re.DOTALL)
+            potential_json_str = self._extract_json_candidate(ai_reply)
 
-            if json_match:
-                potential_json_str = json_match.group(1)
-                data = json.loads(potential_json_str)
+            if potential_json_str is not None:
+                data = _json_loads(potential_json_str)
                 ai_reply_json_string = potential_json_str
                 self.terminal.logger.debug(f"Successfully parsed extracted JSON: {potential_json_str}")
             else:
-                data = json.loads(ai_reply)
+                data = _json_loads(ai_reply)
                 ai_reply_json_string = ai_reply
                 self.terminal.logger.debug("Successfully parsed JSON from full AI reply.")
         
         except json.JSONDecodeError as e:
+            # Repair common formatting slips locally before spending an LLM round-trip
+            salvaged = _local_salvage_json(ai_reply)
+            if salvaged is not None:
+                self.terminal.logger.debug("Recovered JSON from AI reply by local salvage; request_id=%s", request_id)
+                return True, salvaged, _json_dumps(salvaged), False, ""
+
             # Implement multiple correction attempts (up to 3 attempts)
             max_correction_attempts = 3
             correction_attempt = 0
@@ -1926,10 +2610,7 @@ class VaultAIAgentRunner:
                 correction_attempt += 1
                 self.terminal.print_console(f"AI did not return valid JSON (attempt {correction_attempt}): {e}. Asking for correction...")
                 self.terminal.logger.warning(f"Invalid JSON from AI (attempt {correction_attempt}): %s; request_id=%s", ai_reply, request_id)
-                try:
-                    self.logger.warning("JSON decode error from AI on attempt %s: %s; request_id=%s", correction_attempt, e, request_id)
-                except Exception:
-                    pass
+                self.logger.warning("JSON decode error from AI on attempt %s: %s; request_id=%s", correction_attempt, e, request_id)
 
                 correction_prompt_content = (
                     f"Your previous response was not valid JSON:\n```\n{ai_reply}\n```\n"
@@ -1938,12 +2619,7 @@ class VaultAIAgentRunner:
                 )
                 self.context_manager.add_user_message(correction_prompt_content)
 
-                correction_window_for_prompt = self._sliding_window_context()
-                correction_llm_prompt_parts = []
-                for m_corr in correction_window_for_prompt:
-                    if m_corr["role"] == "system": continue
-                    correction_llm_prompt_parts.append(f"{m_corr['role']}: {m_corr['content']}")
-                correction_llm_prompt_text = "\n".join(correction_llm_prompt_parts)
+                correction_llm_prompt_text = self._render_prompt_text(self._iter_sliding_window_context())
 
                 # Start timing JSON correction attempt
                 correction_timing_id = self._start_timing("JSON_CORRECTION")
@@ -1961,28 +2637,23 @@ class VaultAIAgentRunner:
 
                 if corrected_ai_reply:
                     try:
-                        json_match_corr = re.search(r'```json\s*(\{.*\}|\[.*\])\s*```', corrected_ai_reply, re.DOTALL)
-                        if not json_match_corr:
-                            json_match_corr = re.search(r'(\{.*\}|\[.*\])', corrected_ai_reply, re.DOTALL)
+                        potential_json_corr_str = self._extract_json_candidate(corrected_ai_reply)
 
-                        if json_match_corr:
-                            potential_json_corr_str = json_match_corr.group(1)
-                            data = json.loads(potential_json_corr_str)
+                        if potential_json_corr_str is not None:
+                            data = _json_loads(potential_json_corr_str)
                             ai_reply_json_string = potential_json_corr_str
                             self.terminal.logger.debug(f"Successfully parsed extracted corrected JSON: {potential_json_corr_str}")
                         else:
-                            data = json.loads(corrected_ai_reply)
+                            data = _json_loads(corrected_ai_reply)
                             ai_reply_json_string = corrected_ai_reply
                             self.terminal.logger.debug("Successfully parsed corrected JSON from full reply.")
 
                         self.terminal.print_console(f"Successfully parsed corrected JSON after {correction_attempt} attempt(s).")
-                        try:
-                            self.logger.debug("Successfully parsed corrected JSON for assistant reply. request_id=%s", request_id)
-                        except Exception:
-                            pass
-                        # Remove the correction request and original failed reply from context
+                        self.logger.debug("Successfully parsed corrected JSON for assistant reply. request_id=%s", request_id)
+                        # Remove the original failed reply and the correction requests from context
                         # Uses encapsulated method instead of direct deque manipulation
-                        self.context_manager.remove_last_n_messages(2)
+                        # (one failed reply plus one correction request per attempt)
+                        self.context_manager.truncate_to(self.context_manager.get_context_length() - 1 - correction_attempt)
                         corrected_successfully = True
                         break  # Exit the correction loop on success
                     except json.JSONDecodeError as e2:
@@ -1997,10 +2668,7 @@ class VaultAIAgentRunner:
                             break
                 else: # No corrected reply
                     self.terminal.print_console(f"AI did not provide a correction on attempt {correction_attempt}.")
-                    try:
-                        self.logger.warning("AI did not respond with corrected JSON to correction request. request_id=%s", request_id)
-                    except Exception:
-                        pass
+                    self.logger.warning("AI did not respond with corrected JSON to correction request. request_id=%s", request_id)
                     # If this is the last attempt, we'll handle it after the loop
                     if correction_attempt == max_correction_attempts:
                         error_message = f"Failed to get corrected JSON after {max_correction_attempts} attempts"
@@ -2069,147 +2737,1521 @@ class VaultAIAgentRunner:
                     logger.error(f"LogCompressor also failed in auto mode: {e2}. Using original text.")
                     return text
 
-    def run(self):
+    def _handle_create_action_plan(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'create_action_plan' tool."""
         terminal = self.terminal
-        keep_running = True
+        # Create action plan tool - agent decides when task is complex
+        goal = action_item.get("goal", self.user_goal)
+        explain = action_item.get("explain", "")
 
-        if self.force_plan:
-            self.compact_mode = False
-            self.hybrid_mode = False
+        terminal.print_console(f"\nVaultAI> Creating action plan for: {goal}")
+        if explain:
+            terminal.print_console(f"Reason: {explain}")
 
-        if self.compact_mode:
-            self._run_compact_pipeline()
+        # Start timing plan creation
+        plan_timing_id = self._start_timing(f"PLAN_CREATION_{goal[:50]}")
 
-            if not self.hybrid_mode or not self._compact_should_fallback():
-                summary_text = self.summary or "Agent reported task finished."
-                self.terminal.print_console(
-                    f"\nVaultAI> Agent finished its task.\nSummary: {summary_text}"
-                )
-                if self.show_performance_summary and (
-                    self.timings
-                    or (hasattr(self.ai_handler, 'token_usage') and self.ai_handler.token_usage)
-                ):
-                    self.terminal.print_console("\n" + "="*60)
-                    self.terminal.print_console("PERFORMANCE SUMMARY")
-                    self.terminal.print_console("="*60)
-                    if hasattr(self.ai_handler, 'token_usage') and self.ai_handler.token_usage:
-                        self._display_cost_optimization_recommendations()
-                    if self.timings:
-                        self._display_timing_summary()
-                    if hasattr(self.ai_handler, 'token_usage') and self.ai_handler.token_usage:
-                        self._display_token_summary()
-                    # Display summarize operations summary
-                    self._display_summarize_stats_summary()
-                    self.terminal.print_console("="*60)
-                return
-            self.terminal.print_console("\n VaultAI> Compact mode fallback to normal mode.")
-            self.summary = ""
-            self.goal_success = False
+        # Check if plan already exists
+        if self.plan_manager.steps:
+            terminal.print_console("[WARN] A plan already exists. Clearing old plan.")
+            self.plan_manager.clear()
 
         try:
-            self.logger.info("Starting VaultAIAgentRunner.run for goal: %s", self.user_goal)
-        except Exception:
-            pass
+            steps = self.plan_manager.create_plan_with_ai(goal)
 
-        # Check if plan should be forced (via --plan flag or [plan] keyword)
-        if self.force_plan:
-            self._initialize_plan()
+            if steps:
+                terminal.print_console(f"[OK] Created plan with {len(steps)} steps")
+                self.plan_manager.display_plan()
 
-        while keep_running:
-            task_finished_successfully = False
-            agent_should_stop_this_turn = False
+                # In interactive mode, ask for plan acceptance
+                if not terminal.auto_accept:
+                    self._interactive_plan_acceptance()
 
-            for step_count in range(self.max_steps):  # Configurable step limit
-                try:
-                    # Generate a unique request id for this step to trace the flow
-                    request_id = uuid.uuid4().hex
-                    self.logger.debug("Step %s starting; request_id=%s; current context len=%s", step_count, request_id, self.context_manager.get_context_length())
-                except Exception:
-                    pass
-                window_context = self._sliding_window_context()
-
-                prompt_text_parts = []
-                for m in window_context:
-                    if m["role"] == "system": # System prompt is handled by connect methods or prepended
-                        continue
-                    prompt_text_parts.append(f"{m['role']}: {m['content']}")
-                
-                # Add current plan status to the prompt if plan exists
-                # This ensures AI is always aware of plan progress
-                if self._plan_exists():
-                    plan_status = self._get_plan_status_for_ai()
-                    if plan_status:
-                        prompt_text_parts.append(f"system: {plan_status}")
-                
-                prompt_text = "\n".join(prompt_text_parts)
+                # Add plan to AI context - THIS IS CRITICAL FOR AI TO SEE THE PLAN
+                plan_context = self.plan_manager.get_context_for_ai()
+                self.context_manager.add_system_message(
+                    f"Action plan created successfully. "
+                    f"Execute steps sequentially and update the status of each step after completion.\n\n{plan_context}"
+                )
+                self.context_manager.add_user_message(
+                    f"Action plan created with {len(steps)} steps. Begin execution with step 1."
+                )
+                self.logger.info(f"[PLAN ADDED TO CONTEXT] Dynamic plan with {len(steps)} steps added to AI context during execution")
 
-                # Start timing AI response generation
-                ai_timing_id = self._start_timing("AI_RESPONSE_GENERATION")
-                
-                ai_reply = self.ai_handler.send_request(
-                    system_prompt=self.system_prompt_agent, 
-                    user_prompt=prompt_text,
-                    request_format="json"
+                # End timing plan creation (success)
+                self._end_timing(plan_timing_id, f"PLAN_CREATION_{goal[:50]}", True)
+            else:
+                terminal.print_console("[WARN] Failed to create action plan. Proceeding without plan.")
+                self.context_manager.add_user_message(
+                    "Failed to create action plan. You can proceed without a plan or try again. "
+                    "For simple tasks, just execute commands directly."
                 )
-                
-                # End timing AI response generation
-                ai_duration = self._end_timing(ai_timing_id, "AI_RESPONSE_GENERATION", ai_reply is not None)
 
-                try:
-                    self.logger.debug("AI reply received (nil? %s) request_id=%s", ai_reply is None, request_id)
-                except Exception:
-                    pass
+                # End timing plan creation (failed)
+                self._end_timing(plan_timing_id, f"PLAN_CREATION_{goal[:50]}", False)
+        except Exception as e:
+            terminal.print_console(f"[ERROR] Failed to create action plan: {e}")
+            self.context_manager.add_user_message(
+                f"Failed to create action plan due to error: {e}. "
+                "You can proceed without a plan for simple tasks."
+            )
 
-                if ai_reply is None:
-                    self.summary = "Agent stopped: Failed to get response from AI after multiple retries."
-                    agent_should_stop_this_turn = True
-                    break
-                
-                data = None
-                ai_reply_json_string = None
-                corrected_successfully = False
+            # End timing plan creation (exception)
+            self._end_timing(plan_timing_id, f"PLAN_CREATION_{goal[:50]}", False)
+        return HandlerResult.CONTINUE
 
-                if ai_reply:
-                    # Use enhanced JSON validator if available, otherwise fall back to original parsing
-                    success, data, ai_reply_json_string, corrected_successfully, error_message = self._parse_ai_response_with_enhanced_validator(ai_reply, request_id)
-                    
-                    if not success:
-                        # Enhanced validator and fallback both failed
-                        terminal.print_console(f"JSON parsing failed: {error_message}. Continuing with task using alternative approach.")
-                        self.summary = f"Agent continued: JSON parsing failed ({error_message}), trying alternative approach."
-                        # Add the failed response to context
-                        self.context_manager.add_assistant_message(ai_reply or "")
-                        self.context_manager.add_user_message(f"Your response could not be parsed as JSON: {error_message}. Please provide a new response with valid JSON format.")
-                        # Set data to None to trigger the fallback behavior
-                        data = None
+    def _handle_finish(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'finish' tool."""
+        terminal = self.terminal
+        summary_text = action_item.get("summary", "Agent reported task finished.")
+        goal_success = action_item.get("goal_success", False)
+        if isinstance(goal_success, bool):
+            self.goal_success = goal_success
+        else:
+            self.logger.warning(f"Invalid or missing 'goal_success' value in finish tool: {goal_success}. Expected a boolean. Defaulting to False. request_id={request_id}")
+            self.goal_success = False
 
-                if data is None:
-                    terminal.print_console("JSON parsing failed. Continuing with task using alternative approach.")
-                    self.summary = "Agent continued: JSON parsing failed, trying alternative approach."
-                    try:
-                        self.logger.warning("Data is None after parsing attempts. ai_reply=%s", ai_reply)
-                    except Exception:
-                        pass
-                    if ai_reply and not ai_reply_json_string: # If original reply exists but wasn't parsed
-                        self.context_manager.add_assistant_message(ai_reply)
-                        self.context_manager.add_user_message("Your response could not be parsed as JSON. Please provide a new response with valid JSON format.")
-                    # Continue with the loop instead of breaking
-                    continue
+        # Check if plan exists and if all steps are completed before allowing finish
+        if self.plan_manager.steps:
+            progress = self.plan_manager.get_progress()
+            if progress['pending'] > 0 or progress['in_progress'] > 0:
+                incomplete_steps = progress['pending'] + progress['in_progress']
+                terminal.print_console(f"\n[WARN] Agent tried to finish but {incomplete_steps} plan step(s) are still pending.")
+                self.context_manager.add_user_message(
+                    f"You tried to finish the task, but the action plan is not complete. "
+                    f"You still have {incomplete_steps} step(s) pending or in progress. "
+                    f"Please complete all plan steps before calling 'finish'. "
+                    f"If a step cannot be completed, mark it as failed with a reason. "
+                    f"Current plan status: {progress['completed']}/{progress['total']} completed."
+                )
+                return HandlerResult.CONTINUE
+        # If no plan exists, allow finish without checking plan status
+
+        should_gate_finish_with_critic = (
+            self.goal_success
+            and self.enable_critic_sub_agent
+            and self.loop_critic_sub_agent
+            and self.critic_sub_agent is not None
+        )
+        if (
+            self.goal_success
+            and self.enable_critic_sub_agent
+            and self.critic_sub_agent is None
+            and self.loop_critic_sub_agent
+        ):
+            self.logger.warning(
+                "LOOP_CRITIC_SUB_AGENT is enabled but CriticSubAgent is unavailable; "
+                "continuing without critic gate."
+            )
 
-                if ai_reply_json_string: # This is the string of the successfully parsed JSON (original or corrected)
+        # --- CriticSubAgent: Correctness Score / optional finish gate ---
+        if (
+            self.goal_success
+            and self.enable_critic_sub_agent
+            and self.critic_sub_agent is not None
+        ):
+            try:
+                # Pass command results to critic for better evaluation
+                # Limit to last 5 results to avoid token overflow
+                agent_results = self.command_results[-5:] if self.command_results else None
+                critic_result = self.critic_sub_agent.run(
+                    user_goal=self.user_goal,
+                    agent_summary=summary_text,
+                    agent_results=agent_results,
+                )
+                self.critic_rating = critic_result.get("rating", 0)
+                self.critic_verdict = critic_result.get("verdict", "")
+                self.critic_rationale = critic_result.get("rationale", "")
+            except Exception as e:
+                terminal.print_console(f"\n[WARN] Critic Sub-Agent encountered an error: {e}")
+                self.logger.warning("CriticSubAgent.run failed: %s", e)
+        # --- End CriticSubAgent ---
+
+        if should_gate_finish_with_critic:
+            critic_verdict = self.critic_verdict.strip()
+            if not self._is_critic_verdict_acceptable(critic_verdict):
+                terminal.print_console(
+                    "\n[WARN] Finish blocked by Critic Sub-Agent verdict "
+                    f"'{critic_verdict or 'Unknown'}'."
+                )
+                self.context_manager.add_user_message(
+                    "Your 'finish' action was rejected by CriticSubAgent. "
+                    f"Critic rating: {self.critic_rating}/10. "
+                    f"Verdict: {critic_verdict or 'Unknown'}. "
+                    f"Rationale: {self.critic_rationale or 'No rationale provided.'} "
+                    "Please continue working and call 'finish' only after fully addressing "
+                    "the user goal."
+                )
+                self.logger.info(
+                    "Finish rejected by critic verdict=%s rating=%s request_id=%s",
+                    critic_verdict or "Unknown",
+                    self.critic_rating,
+                    request_id,
+                )
+                return HandlerResult.CONTINUE
+
+        # Track which model created the summary
+        model_used = getattr(self.ai_handler, 'ai_engines', [getattr(self.ai_handler, 'ai_engine', 'unknown')])[0]
+        self.summary_model_creator = model_used
+
+        terminal.print_console(f"\nVaultAI> Agent finished its task.\nSummary: {summary_text}")
+        self.summary = summary_text
+        # Log finish along with the request id for traceability
+        self.logger.info("Agent signaled finish with summary: %s; request_id=%s; model=%s", summary_text, request_id, model_used)
+
+        # Display model information in summary
+        terminal.print_console(f"Summary created by: {model_used}")
+
+        # --- FinishSubAgent: Deep Analysis ---
+        # Ask user whether to run the deep analysis sub-agent
+        if self.finish_sub_agent is not None and self.show_finish_sub_agent:
+            run_analysis = self._get_user_input(
+                "\nVaultAI> Run Deep Analysis Sub-Agent for a detailed session report? [y/N]: ",
+                multiline=False
+            ).strip()
+
+            if run_analysis[:1] in ('y', 'Y'):
+                try:
+                    self.finish_sub_agent.run(
+                        user_goal=self.user_goal,
+                        agent_summary=summary_text,
+                        context_manager=self.context_manager,
+                        plan_manager=self.plan_manager,
+                        steps=list(self.steps),
+                    )
+                except Exception as e:
+                    terminal.print_console(f"\n[WARN] Deep Analysis Sub-Agent encountered an error: {e}")
+                    self.logger.warning("FinishSubAgent.run failed: %s", e)
+            else:
+                terminal.print_console("Deep Analysis skipped.")
+        # --- End FinishSubAgent ---
+
+        return HandlerResult.FINISH
+
+    def _handle_bash(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'bash' tool."""
+        terminal = self.terminal
+        command = action_item.get("command")
+        timeout = action_item.get("timeout")
+        explain = action_item.get("explain", "")
+
+        # Security: Validate command before execution
+        if terminal.block_dangerous_commands:
+            is_valid, reason = self.security_validator.validate_command(command)
+            if not is_valid:
+                terminal.print_console(f"Command validation failed: {reason}. Skipping.")
+                self.context_manager.add_user_message(f"Command '{command}' failed security validation: {reason}. I am skipping it.")
+                return HandlerResult.CONTINUE
+
+        auto_accept = terminal.auto_accept
+        if not auto_accept:
+            if self.terminal.auto_explain_command and explain:
+                confirm_prompt_text = f"\nVaultAI> Agent suggests to run command: '{command}' which is intended to: {explain}. Execute? [y/N]: "
+            else:
+                confirm_prompt_text = f"\nVaultAI> Agent suggests to run command: '{command}'. Execute? [y/N]: "
+
+            confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+            if confirm[:1] not in ('y', 'Y'):
+                justification = self._ask_refusal_justification(" the command")
+                terminal.print_console(f"\nVaultAI> Command refused by user. Justification: {justification}\n")
+                self.context_manager.add_user_message(f"User refused to execute command '{command}' with justification: {justification}. Based on this, what should be the next step?")
+                return HandlerResult.CONTINUE
+
+        # Auto-accepted read-only scans skip the banner so long runs of ls/cat/grep stream faster
+        if not (auto_accept and _is_readonly(command)):
+            terminal.print_console(f"\nVaultAI> Executing: {command}")
+            self.logger.info("\nVaultAI> Executing bash command: %s; request_id=%s", command, request_id)
+        elif self._debug:
+            self.logger.debug("Executing read-only command: %s; request_id=%s", command, request_id)
+
+        # Start timing command execution
+        cmd_timing_id = self._start_timing(f"COMMAND_EXECUTION_{command[:50]}")
+
+        prefetched = None
+        if self._prefetched_commands and isinstance(timeout, (int, float, type(None))):
+            prefetched = self._prefetched_commands.pop((command, timeout), None)
+        if prefetched is not None:
+            out, code = prefetched
+        else:
+            out, code = self._run_command(command, timeout)
+
+        # End timing command execution
+        cmd_duration = self._end_timing(cmd_timing_id, f"COMMAND_EXECUTION_{command[:50]}", code == 0)
+
+        self._step_counter += 1
+        self.steps.append(f"Step {self._step_counter}: executed '{command}' (code {code})")
+
+        # Store command result for critic evaluation (compact version to save memory)
+        out_str = out if isinstance(out, str) else str(out)
+
+        self.command_results.append({
+            "tool": "bash",
+            "command": command,
+            "code": int(code),
+            "out": f"{summarize_generic_table(out_str)}",
+        })
+
+        #terminal.print_console(f"Result (exit code: {code}):\n{out}")
+        terminal.print_console(f"\n{out}")
+        if self._debug:
+            self.logger.debug("Command result: code=%s, out_len=%s; request_id=%s", code, len(out) if isinstance(out, str) else 0, request_id)
+
+        # Check for SSH connection error (code 255)
+        # Note: code 255 may also occur due to remote command failures or traps,
+        # so we only stop for true connection issues when output indicates connection problems
+        if self.terminal.ssh_connection and code == 255 and ("Connection refused" in out or "No route to host" in out or "Connection timed out" in out or "Permission denied" in out or "Operation timed out" in out):
+            terminal.print_console(
+                "[ERROR] SSH connection failed (host may be offline or unreachable). "
+                "Agent is stopping."
+            )
+            self.summary = "Agent stopped: SSH connection failed (host offline or unreachable)."
+            return HandlerResult.STOP
+        elif self.terminal.ssh_connection and code == 255:
+            # Likely a command failure misinterpreted as connection error, continue
+            terminal.print_console(
+                "[WARNING] Received exit code 255 from remote command, "
+                "but no connection error detected. Treating as command failure."
+            )
+
+        # Build smart feedback based on exit code
+
+        # Use output type detection if enabled, otherwise default to "text"
+        if self.enable_output_type_detection:
+            output_type = detect_output_type(out, command)
+        else:
+            output_type = "text"
+        if output_type == "empty":
+            original_feedback = (
+                f"Command '{command}' executed with exit code {code} and no output.\n"
+                f"The command {'succeeded' if code == 0 else 'failed'} with no output. "
+                f"You can mark this step as {'completed' if code == 0 else 'failed'} and proceed to the next step."
+            )
+        elif output_type == "json":
+            # pretty / truncate JSON output for feedback
+            original_len = len(out)
+            summarized_json_out = summarize_json(out)
+            summarized_len = len(summarized_json_out)
+            # Track summarize stats
+            self.summarize_stats["json"]["original"] += original_len
+            self.summarize_stats["json"]["summarized"] += summarized_len
+            self.summarize_stats["json"]["count"] += 1
+            self.summarize_stats["total_original"] += original_len
+            self.summarize_stats["total_summarized"] += summarized_len
+            self.summarize_stats["total_saved"] += (original_len - summarized_len)
+            self.summarize_stats["total_count"] += 1
+            self.logger.debug(f"JSON Command output from {original_len} chars to {summarized_len} chars for feedback (saved {original_len - summarized_len})")
+            if code == 0:
+                original_feedback = (
+                    f"Command '{command}' executed successfully with exit code 0 and produced JSON output.\n"
+                    f"Output:\n\n{summarized_json_out}\n\n"
+                    "The command succeeded. You can mark this step as completed and proceed to the next step."
+                )
+            else:
+                    original_feedback = (
+                        f"Command '{command}' failed with exit code {code} but produced JSON output.\n"
+                        f"Output:\n\n{summarized_json_out}\n\n"
+                        f"The command failed. Analyze the error and decide:\n"
+                        f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
+                        f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
+                        f"- SKIP: If this step is non-critical and you can proceed without it\n"
+                        f"- FAIL: If this is a critical error that blocks progress\n"
+                        f"What is your decision?"
+                    )
+        elif output_type == "stacktrace":
+            original_len = len(out)
+            summarized_stacktrace_out = summarize_stacktrace(out)
+            summarized_len = len(summarized_stacktrace_out)
+            # Track summarize stats
+            self.summarize_stats["stacktrace"]["original"] += original_len
+            self.summarize_stats["stacktrace"]["summarized"] += summarized_len
+            self.summarize_stats["stacktrace"]["count"] += 1
+            self.summarize_stats["total_original"] += original_len
+            self.summarize_stats["total_summarized"] += summarized_len
+            self.summarize_stats["total_saved"] += (original_len - summarized_len)
+            self.summarize_stats["total_count"] += 1
+            self.logger.debug(f"Stacktrace Command output from {original_len} chars to {summarized_len} chars for feedback (saved {original_len - summarized_len})")
+            if code == 0:
+                original_feedback = (
+                    f"Command '{command}' executed successfully with exit code 0 but produced a stacktrace output.\n"
+                    f"Output:\n\n{summarized_stacktrace_out}\n\n"
+                    "The command succeeded but produced a stacktrace. Analyze the output to determine if there are any warnings or non-critical errors. You can mark this step as completed and proceed to the next step if the stacktrace does not indicate a critical issue."
+                )
+            else:
+                original_feedback = (
+                    f"Command '{command}' failed with exit code {code} and produced a stacktrace output.\n"
+                    f"Output:\n\n{summarized_stacktrace_out}\n\n"
+                    f"The command failed and produced a stacktrace. Analyze the stacktrace to identify the error. Based on the analysis, decide:\n"
+                    f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
+                    f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
+                    f"- SKIP: If this step is non-critical and you can proceed without it\n"
+                    f"- FAIL: If this is a critical error that blocks progress\n"
+                    f"What is your decision?"
+                )
+        elif output_type == "log":
+            if  should_compress_adaptive(out):
+                compressed_out = self._compress_with_fallback(out, self.logger)
+                self.logger.debug(f"Compressed command output from {len(out)} chars to {len(compressed_out)} chars for command: {command}")
+                out = compressed_out
+                text_for_feedback = f"Compressed Output:\n\n{out}\n\n"
+            else:
+                out = _summarize_output(out)
+                text_for_feedback = f"Output:\n\n{out}\n\n"
+            if code == 0:
+                original_feedback = (
+                    f"Command '{command}' executed successfully with exit code 0 and produced log output.\n"
+                    f"{text_for_feedback}"
+                    "The command succeeded. You can mark this step as completed and proceed to the next step."
+                )
+            else:
+                original_feedback = (
+                    f"Command '{command}' failed with exit code {code} but produced log output.\n"
+                    f"{text_for_feedback}"
+                    f"The command failed. Analyze the log output to identify any error messages or warnings. Based on the analysis, decide:\n"
+                    f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
+                    f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
+                    f"- SKIP: If this step is non-critical and you can proceed without it\n"
+                    f"- FAIL: If this is a critical error that blocks progress\n"
+                    f"What is your decision?"
+                )
+        elif output_type == "table":
+            # Summarize table output using the new summarization functions
+            try:
+                original_len = len(out)
+                summarized_output = summarize_table(out)
+                summarized_len = len(summarized_output)
+                # Track summarize stats
+                self.summarize_stats["table"]["original"] += original_len
+                self.summarize_stats["table"]["summarized"] += summarized_len
+                self.summarize_stats["table"]["count"] += 1
+                self.summarize_stats["total_original"] += original_len
+                self.summarize_stats["total_summarized"] += summarized_len
+                self.summarize_stats["total_saved"] += (original_len - summarized_len)
+                self.summarize_stats["total_count"] += 1
+                self.logger.debug(f"Table Command output from {original_len} chars to {summarized_len} chars for feedback (saved {original_len - summarized_len})")
+                if code == 0:
+                    original_feedback = (
+                        f"Command '{command}' executed successfully with exit code 0 and produced table output.\n"
+                        f"Summary:\n{summarized_output}\n"
+                        "The command succeeded. You can mark this step as completed and proceed to the next step."
+                    )
+                else:
+                    original_feedback = (
+                        f"Command '{command}' failed with exit code {code} but produced table output.\n"
+                        f"Summary:\n{summarized_output}\n"
+                        f"The command failed. Analyze the table output to identify any error messages or warnings. Based on the analysis, decide:\n"
+                        f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
+                        f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
+                        f"- SKIP: If this step is non-critical and you can proceed without it\n"
+                        f"- FAIL: If this is a critical error that blocks progress\n"
+                        f"What is your decision?"
+                    )
+            except Exception as e:
+                # Fallback to original behavior if summarization fails
+                self.logger.warning(f"Table summarization failed for command '{command}': {e}")
+                out = _summarize_output(out)
+                if code == 0:
+                    original_feedback = (
+                        f"Command '{command}' executed successfully with exit code 0 and produced table output.\n"
+                        f"Output:\n\n{out}\n\n"
+                        "The command succeeded. You can mark this step as completed and proceed to the next step."
+                    )
+                else:
+                    original_feedback = (
+                        f"Command '{command}' failed with exit code {code} but produced table output.\n"
+                        f"Output:\n\n{out}\n\n"
+                        f"The command failed. Analyze the table output to identify any error messages or warnings. Based on the analysis, decide:\n"
+                        f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
+                        f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
+                        f"- SKIP: If this step is non-critical and you can proceed without it\n"
+                        f"- FAIL: If this is a critical error that blocks progress\n"
+                        f"What is your decision?"
+                    )
+        elif output_type == "kv":
+            original_len = len(out)
+            summarize_kv_out = summarize_kv(out)
+            summarized_len = len(summarize_kv_out)
+            # Track summarize stats
+            self.summarize_stats["kv"]["original"] += original_len
+            self.summarize_stats["kv"]["summarized"] += summarized_len
+            self.summarize_stats["kv"]["count"] += 1
+            self.summarize_stats["total_original"] += original_len
+            self.summarize_stats["total_summarized"] += summarized_len
+            self.summarize_stats["total_saved"] += (original_len - summarized_len)
+            self.summarize_stats["total_count"] += 1
+            self.logger.debug(f"KV Command output from {original_len} chars to {summarized_len} chars for feedback (saved {original_len - summarized_len})")
+            if code == 0:
+                original_feedback = (
+                    f"Command '{command}' executed successfully with exit code 0 and produced key-value output.\n"
+                    f"Output:\n\n{summarize_kv_out}\n\n"
+                    "The command succeeded. You can mark this step as completed and proceed to the next step."
+                )
+            else:
+                original_feedback = (
+                    f"Command '{command}' failed with exit code {code} but produced key-value output.\n"
+                    f"Output:\n\n{summarize_kv_out}\n\n"
+                    f"The command failed. Analyze the key-value output to identify any error messages or warnings. Based on the analysis, decide:\n"
+                    f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
+                    f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
+                    f"- SKIP: If this step is non-critical and you can proceed without it\n"
+                    f"- FAIL: If this is a critical error that blocks progress\n"
+                    f"What is your decision?"
+                )
+        elif output_type == "single_line":
+            out = _summarize_output(out)
+            if code == 0:
+                original_feedback = (
+                    f"Command '{command}' executed successfully with exit code 0 and produced single-line output.\n"
+                    f"Output: {out}\n\n"
+                    "The command succeeded. You can mark this step as completed and proceed to the next step."
+                )
+            else:
+                original_feedback = (
+                    f"Command '{command}' failed with exit code {code} but produced single-line output.\n"
+                    f"Output: {out}\n\n"
+                    f"The command failed. Analyze the output to identify any error messages or warnings. Based on the analysis, decide:\n"
+                    f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
+                    f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
+                    f"- SKIP: If this step is non-critical and you can proceed without it\n"
+                    f"- FAIL: If this is a critical error that blocks progress\n"
+                    f"What is your decision?"
+                )
+        elif output_type == "text" or output_type == "unknown":
+            # truncate if too long
+            original_len = len(out)
+            out = _summarize_output(out)
+            if len(out) < original_len:
+                self.logger.debug("Text command output from %d chars to %d chars for feedback", original_len, len(out))
+            if code == 0:
+                original_feedback = (
+                    f"Command '{command}' executed successfully with exit code 0 and produced text output.\n"
+                    f"Output:\n\n{out}\n\n"
+                    "The command succeeded. You can mark this step as completed and proceed to the next step."
+                )
+            else:
+                original_feedback = (
+                    f"Command '{command}' failed with exit code {code} and produced text output.\n"
+                    f"Output:\n\n{out}\n\n"
+                    f"The command failed. Analyze the output to identify any error messages or warnings. Based on the analysis, decide:\n"
+                    f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
+                    f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
+                    f"- SKIP: If this step is non-critical and you can proceed without it\n"
+                    f"- FAIL: If this is a critical error that blocks progress\n"
+                    f"What is your decision?"
+                )
+
+        user_feedback_content = compress_prompt(original_feedback)
+        self._log_prompt_filter_savings(original_feedback, user_feedback_content)
+
+        if has_more_actions:
+            user_feedback_content += "\nI will now proceed to the next action you provided."
+
+        # Update plan progress first; the feedback below reports the resulting plan status
+        action_desc = f"Executed: {command} (exit code: {code})"
+        self._update_plan_progress(action_desc, success=(code == 0))
+        self._flush_plan_updates()
+
+        # Add plan status to feedback
+        plan_status = self._get_plan_status_for_ai()
+        user_feedback_content += f"\n\n{plan_status}"
+
+        self.context_manager.add_user_message(user_feedback_content)
+        return HandlerResult.CONTINUE
+
+    def _handle_analysis_data(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'analysis_data' tool."""
+        terminal = self.terminal
+        explain = action_item.get("explain", "")
+        is_valid, analysis_args, validation_error = self._validate_analysis_data_arguments(action_item)
+        if not is_valid:
+            self.logger.warning(
+                "analysis_data validation failed: %s; action=%s; request_id=%s",
+                validation_error,
+                action_item,
+                request_id,
+            )
+            terminal.print_console(
+                f"[WARN] Invalid analysis_data action: {validation_error}. Skipping."
+            )
+            self.context_manager.add_user_message(
+                f"You provided an invalid 'analysis_data' action: {validation_error}. "
+                f"Action: {action_item}. I am skipping it."
+            )
+            self._update_plan_progress("analysis_data validation failed", success=False)
+            return HandlerResult.CONTINUE
+
+        analysis_type = analysis_args["type"]
+        output_format = analysis_args["output_format"]
+        self.logger.info(
+            "analysis_data requested: type=%s format=%s request_id=%s",
+            analysis_type,
+            output_format,
+            request_id,
+        )
+        requested_max_tokens = analysis_args["constraints"]["max_tokens"]
+        max_tokens = requested_max_tokens
+        # Some reasoning models may spend small budgets on hidden reasoning only.
+        # Keep practical lower bounds so structured outputs are actually returned.
+        if output_format == "json":
+            json_min_tokens = 3000 if analysis_type == "calculate" else 1200
+            if max_tokens < json_min_tokens:
+                max_tokens = json_min_tokens
+        elif output_format == "number" and max_tokens < 512:
+            max_tokens = 512
+
+        if not terminal.auto_accept:
+            if self.terminal.auto_explain_command and explain:
+                confirm_prompt_text = (
+                    f"\nVaultAI> Agent suggests to run analysis_data "
+                    f"(type='{analysis_type}', format='{output_format}') "
+                    f"which is intended to: {explain}. Execute? [y/N]: "
+                )
+            else:
+                confirm_prompt_text = (
+                    f"\nVaultAI> Agent suggests to run analysis_data "
+                    f"(type='{analysis_type}', format='{output_format}'). "
+                    f"Execute? [y/N]: "
+                )
+            confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+            if confirm[:1] not in ('y', 'Y'):
+                justification = self._ask_refusal_justification(" analysis_data")
+                self.logger.info(
+                    "analysis_data refused by user: type=%s format=%s justification=%s request_id=%s",
+                    analysis_type,
+                    output_format,
+                    justification,
+                    request_id,
+                )
+                terminal.print_console(
+                    f"\nVaultAI> analysis_data refused by user. Justification: {justification}\n"
+                )
+                self.context_manager.add_user_message(
+                    "User refused to execute analysis_data "
+                    f"(type='{analysis_type}', format='{output_format}') "
+                    f"with justification: {justification}. "
+                    "Based on this, what should be the next step?"
+                )
+                return HandlerResult.CONTINUE
+
+        terminal.print_console(
+            f"\nVaultAI> Executing analysis_data: type={analysis_type}, "
+            f"format={output_format}"
+        )
+        analysis_timing_id = self._start_timing(
+            f"ANALYSIS_DATA_{analysis_type.upper()}"
+        )
+
+        request_format = "json" if output_format == "json" else "text"
+        prompt_args = dict(analysis_args)
+        prompt_constraints = dict(analysis_args.get("constraints", {}))
+        prompt_constraints["max_tokens"] = max_tokens
+        prompt_args["constraints"] = prompt_constraints
+        analysis_system_prompt, analysis_user_prompt = self._build_analysis_data_prompts(
+            prompt_args
+        )
+        analysis_result = self.ai_handler.send_request(
+            system_prompt=analysis_system_prompt,
+            user_prompt=analysis_user_prompt,
+            request_format=request_format,
+            operation=f"analysis_data_tool_{analysis_type}",
+            max_tokens=max_tokens,
+        )
+        self.logger.debug(
+            "analysis_data primary call done: type=%s format=%s has_result=%s request_id=%s",
+            analysis_type,
+            output_format,
+            analysis_result is not None,
+            request_id,
+        )
+        used_lightweight_fallback = False
+        used_local_calculate_fallback = False
+
+        self._end_timing(
+            analysis_timing_id,
+            f"ANALYSIS_DATA_{analysis_type.upper()}",
+            analysis_result is not None,
+        )
+
+        if analysis_result is None:
+            # Some models can consume the whole budget on hidden reasoning for large
+            # calculate tasks and return empty output. Retry with a lighter text-only
+            # variant to keep the workflow moving.
+            if analysis_type == "calculate":
+                self.logger.warning(
+                    "analysis_data empty response on calculate, starting fallback flow; request_id=%s",
+                    request_id,
+                )
+                terminal.print_console(
+                    "[WARN] analysis_data returned no response for calculate; "
+                    "trying lightweight text fallback."
+                )
+                lightweight_system = ""
+                lightweight_user = (
+                    "ROLE: precise data analysis assistant.\n"
+                    "Return final answer directly without preamble.\n\n"
+                    f"ANALYSIS_TYPE: {analysis_type}\n"
+                    "OUTPUT_FORMAT: text\n"
+                    f"PRECISION: {analysis_args['constraints'].get('precision', 'medium')}\n"
+                    "MAX_TOKENS_BUDGET: 900\n"
+                    f"INSTRUCTIONS: {analysis_args.get('instructions') or 'None'}\n"
+                    f"CONTEXT: {analysis_args.get('context') or 'None'}\n"
+                    f"INPUT:\n{analysis_args.get('input', '')}\n\n"
+                    "OUTPUT RULE: Return concise final answer only. "
+                    "No reasoning trace."
+                )
+                fallback_result = self.ai_handler.send_request(
+                    system_prompt=lightweight_system,
+                    user_prompt=lightweight_user,
+                    request_format="text",
+                    operation=f"analysis_data_tool_{analysis_type}_fallback_text",
+                    max_tokens=900,
+                )
+                if fallback_result is not None:
+                    analysis_result = fallback_result
+                    used_lightweight_fallback = True
+                    self.logger.info(
+                        "analysis_data lightweight fallback succeeded: type=%s request_id=%s",
+                        analysis_type,
+                        request_id,
+                    )
+                else:
+                    local_fallback = self._local_calculate_analysis_data(analysis_args)
+                    if local_fallback is not None:
+                        analysis_result = json.dumps(local_fallback, ensure_ascii=False)
+                        used_local_calculate_fallback = True
+                        self.logger.info(
+                            "analysis_data local calculate fallback succeeded: type=%s request_id=%s",
+                            analysis_type,
+                            request_id,
+                        )
+            else:
+                self.logger.warning(
+                    "analysis_data empty response, starting lightweight fallback: type=%s request_id=%s",
+                    analysis_type,
+                    request_id,
+                )
+                terminal.print_console(
+                    "[WARN] analysis_data returned no response; "
+                    "trying lightweight text fallback."
+                )
+                lightweight_system = ""
+                lightweight_user = (
+                    "ROLE: precise data analysis assistant.\n"
+                    "Return concise final answer only.\n\n"
+                    f"ANALYSIS_TYPE: {analysis_type}\n"
+                    "OUTPUT_FORMAT: text\n"
+                    f"PRECISION: {analysis_args['constraints'].get('precision', 'medium')}\n"
+                    "MAX_TOKENS_BUDGET: 700\n"
+                    f"INSTRUCTIONS: {analysis_args.get('instructions') or 'None'}\n"
+                    f"CONTEXT: {analysis_args.get('context') or 'None'}\n"
+                    f"INPUT:\n{analysis_args.get('input', '')}\n\n"
+                    "OUTPUT RULE: Return concise final answer only. "
+                    "No reasoning trace."
+                )
+                fallback_result = self.ai_handler.send_request(
+                    system_prompt=lightweight_system,
+                    user_prompt=lightweight_user,
+                    request_format="text",
+                    operation=f"analysis_data_tool_{analysis_type}_fallback_text",
+                    max_tokens=700,
+                )
+                if fallback_result is not None:
+                    analysis_result = fallback_result
+                    used_lightweight_fallback = True
+                    self.logger.info(
+                        "analysis_data lightweight fallback succeeded: type=%s request_id=%s",
+                        analysis_type,
+                        request_id,
+                    )
+
+        if analysis_result is None:
+            self.logger.error(
+                "analysis_data failed: no AI response after fallbacks; type=%s format=%s request_id=%s",
+                analysis_type,
+                output_format,
+                request_id,
+            )
+            terminal.print_console(
+                "[ERROR] analysis_data failed: no response from AI."
+            )
+            self._update_plan_progress(
+                f"analysis_data failed: {analysis_type}", success=False
+            )
+            self.context_manager.add_user_message(
+                f"analysis_data failed for type '{analysis_type}': no AI response."
+            )
+            return HandlerResult.CONTINUE
+
+        raw_result = analysis_result if isinstance(analysis_result, str) else str(analysis_result)
+        self.logger.debug(
+            "analysis_data raw response stats: type=%s format=%s len=%d",
+            analysis_type,
+            output_format,
+            len(raw_result),
+        )
+        result_for_context = raw_result
+        result_for_display = raw_result
+        number_fallback_note = ""
+        strict_json_retry_used = False
+        strict_json_fallback_used = False
+        lightweight_json_wrap_used = False
+
+        if output_format == "json":
+            if used_lightweight_fallback:
+                fallback_obj = {
+                    "fallback": "analysis_data_calculate_lightweight_text",
+                    "analysis_type": analysis_type,
+                    "result_text": raw_result[:4000],
+                }
+                result_for_display = json.dumps(
+                    fallback_obj, ensure_ascii=False, indent=2
+                )
+                result_for_context = json.dumps(
+                    fallback_obj, ensure_ascii=False
+                )
+                lightweight_json_wrap_used = True
+            try:
+                if not used_lightweight_fallback:
+                    parsed_json = json.loads(raw_result)
+                    result_for_display = json.dumps(
+                        parsed_json, ensure_ascii=False, indent=2
+                    )
+                    result_for_context = json.dumps(
+                        parsed_json, ensure_ascii=False
+                    )
+            except Exception:
+                self.logger.warning(
+                    "analysis_data returned non-JSON output, retrying with strict JSON constraints. "
+                    "type=%s len=%d request_id=%s",
+                    analysis_type,
+                    len(raw_result),
+                    request_id,
+                )
+                strict_retry_prompt = (
+                    f"{analysis_user_prompt}\n\n"
+                    "CRITICAL OUTPUT CONSTRAINT:\n"
+                    "Return ONLY valid JSON (object or array). Do NOT include any text, markdown, "
+                    "code fences, explanations, or reasoning."
+                )
+                strict_retry_max_tokens = max(max_tokens, 1200)
+                strict_retry_result = self.ai_handler.send_request(
+                    system_prompt=analysis_system_prompt,
+                    user_prompt=strict_retry_prompt,
+                    request_format="text",
+                    operation=f"analysis_data_tool_{analysis_type}_strict_json_retry",
+                    max_tokens=strict_retry_max_tokens,
+                )
+                strict_json_retry_used = True
+
+                if strict_retry_result is not None:
+                    strict_raw = (
+                        strict_retry_result
+                        if isinstance(strict_retry_result, str)
+                        else str(strict_retry_result)
+                    )
+                    try:
+                        parsed_json = json.loads(strict_raw)
+                        result_for_display = json.dumps(
+                            parsed_json, ensure_ascii=False, indent=2
+                        )
+                        result_for_context = json.dumps(
+                            parsed_json, ensure_ascii=False
+                        )
+                    except Exception:
+                        strict_json_fallback_used = True
+                        fallback_obj = {
+                            "error": "analysis_data_invalid_json_response",
+                            "analysis_type": analysis_type,
+                            "output_format": output_format,
+                            "raw_response": strict_raw[:1200],
+                        }
+                        result_for_display = json.dumps(
+                            fallback_obj, ensure_ascii=False, indent=2
+                        )
+                        result_for_context = json.dumps(
+                            fallback_obj, ensure_ascii=False
+                        )
+                else:
+                    strict_json_fallback_used = True
+                    fallback_obj = {
+                        "error": "analysis_data_invalid_json_response",
+                        "analysis_type": analysis_type,
+                        "output_format": output_format,
+                        "raw_response": raw_result[:1200],
+                    }
+                    result_for_display = json.dumps(
+                        fallback_obj, ensure_ascii=False, indent=2
+                    )
+                    result_for_context = json.dumps(
+                        fallback_obj, ensure_ascii=False
+                    )
+        elif output_format == "number":
+            extracted_number = self._extract_first_number(raw_result)
+            if extracted_number is None:
+                number_fallback_note = (
+                    "Expected numeric output but received non-numeric text. "
+                    "Using raw response as fallback."
+                )
+            else:
+                result_for_display = extracted_number
+                result_for_context = extracted_number
+
+        terminal.print_console(
+            f"\n[OK] analysis_data completed (type={analysis_type}, format={output_format})."
+        )
+        terminal.print_console(f"\n{result_for_display}")
+        if number_fallback_note:
+            terminal.print_console(f"[WARN] {number_fallback_note}")
+        if strict_json_fallback_used:
+            terminal.print_console(
+                "[WARN] analysis_data did not return valid JSON after strict retry. "
+                "Stored fallback JSON object."
+            )
+        if lightweight_json_wrap_used:
+            terminal.print_console(
+                "[WARN] Wrapped lightweight text fallback into JSON object."
+            )
+        if used_lightweight_fallback:
+            terminal.print_console(
+                "[WARN] Used lightweight calculate fallback due to empty primary response."
+            )
+        if used_local_calculate_fallback:
+            terminal.print_console(
+                "[WARN] Used local calculate fallback due to repeated empty AI responses."
+            )
+
+        feedback_lines = [
+            f"analysis_data completed successfully.",
+            f"Type: {analysis_type}",
+            f"Output format: {output_format}",
+        ]
+        if max_tokens != requested_max_tokens:
+            feedback_lines.append(
+                f"Adjusted max_tokens from {requested_max_tokens} to {max_tokens} to ensure usable output."
+            )
+        if number_fallback_note:
+            feedback_lines.append(number_fallback_note)
+        if strict_json_retry_used:
+            feedback_lines.append(
+                "A strict JSON retry was performed because the initial response was not valid JSON."
+            )
+        if strict_json_fallback_used:
+            feedback_lines.append(
+                "Strict JSON retry still produced invalid output; fallback JSON object was generated."
+            )
+        if lightweight_json_wrap_used:
+            feedback_lines.append(
+                "Lightweight text fallback output was wrapped into JSON for compatibility."
+            )
+        if used_lightweight_fallback:
+            feedback_lines.append(
+                "Primary calculate call returned empty output; lightweight text fallback was used."
+            )
+        if used_local_calculate_fallback:
+            feedback_lines.append(
+                "Both AI calculate attempts returned empty output; local calculate fallback was used."
+            )
+        feedback_lines.append(f"Result:\n{result_for_context}")
+        analysis_feedback = "\n".join(feedback_lines)
+
+        analysis_feedback_compact = compress_prompt(analysis_feedback)
+        self._log_prompt_filter_savings(
+            analysis_feedback, analysis_feedback_compact
+        )
+        self.context_manager.add_user_message(analysis_feedback_compact)
+        self._update_plan_progress(
+            f"analysis_data: {analysis_type} ({output_format})",
+            success=True,
+        )
+        self.logger.info(
+            "analysis_data completed: type=%s format=%s request_id=%s",
+            analysis_type,
+            output_format,
+            request_id,
+        )
+        return HandlerResult.CONTINUE
+
+    def _handle_ask_user(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'ask_user' tool."""
+        terminal = self.terminal
+        # Block ask_user in autonomous mode
+        if terminal.auto_accept:
+            terminal.print_console("[WARN] Agent tried to use 'ask_user' in autonomous mode. Request rejected.")
+            self.context_manager.add_user_message(
+                "You tried to use the 'ask_user' tool, but you are running in AUTONOMOUS MODE. "
+                "In autonomous mode, you must NOT ask the user questions. "
+                "Instead, make decisions yourself based on available information and proceed with the best course of action. "
+                "Use your best judgment and continue with the task."
+            )
+            return HandlerResult.CONTINUE
+
+        # Normal ask_user handling in interactive mode
+        question = action_item.get("question")
+        if not question:
+            terminal.print_console(f"No question provided in ask_user action: {action_item}. Skipping.")
+            self.context_manager.add_user_message(f"You provided an 'ask_user' action but no question: {action_item}. I am skipping it.")
+            return HandlerResult.CONTINUE
+
+        terminal.print_console(f"Agent asks: {question}")
+        user_answer = self._get_user_input("Your answer: ", multiline=True)
+        self.context_manager.add_user_message(f"User answer to '{question}': {user_answer}")
+
+        if has_more_actions:
+            self.context_manager.add_user_message("I will now proceed to the next action you provided.")
+        return HandlerResult.CONTINUE
+
+    def _handle_read_file(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'read_file' tool."""
+        terminal = self.terminal
+        file_path = action_item.get("path")
+        start_line = action_item.get("start_line")
+        end_line = action_item.get("end_line")
+        explain = action_item.get("explain", "")
+
+        if not terminal.auto_accept:
+            line_info = ""
+            if start_line or end_line:
+                line_info = f" (lines {start_line or 'start'} to {end_line or 'end'})"
+            confirm_prompt_text = f"\nVaultAI> Agent suggests to read file: '{file_path}'{line_info}. This is intended to: {explain}. Proceed? [y/N]: "
+            confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+            if confirm[:1] not in ('y', 'Y'):
+                justification = self._ask_refusal_justification(" to read the file")
+                terminal.print_console(f"\nVaultAI> File read refused by user. Justification: {justification}\n")
+                self.context_manager.add_user_message(f"User refused to read file '{file_path}' with justification: {justification}. Based on this, what should be the next step?")
+                return HandlerResult.CONTINUE
+
+        # Start timing file read operation
+        read_timing_id = self._start_timing(f"FILE_READ_{file_path}")
+
+        result = self.file_operator.read_file(file_path, start_line or None, end_line or None, explain)
+        if result.get("success"):
+            # End timing file read operation
+            self._end_timing(read_timing_id, f"FILE_READ_{file_path}", True)
+            content = result.get("content", "")
+            total_lines = result.get("total_lines", "unknown")
+            lines_read = result.get("lines_count", 0)
+
+            # Truncate very long content for context
+            max_content_len = 10000
+            if len(content) > max_content_len:
+                content_display = content[:max_content_len] + f"\n... (truncated, {len(content)} total characters)"
+            else:
+                content_display = content
+
+            terminal.print_console(f"\n[OK] File '{file_path}' read successfully ({lines_read} lines).")
+
+            feedback = f"File '{file_path}' read successfully.\n"
+            feedback += f"Total lines: {total_lines}, Lines read: {lines_read}\n\n"
+            feedback += f"Content:\n```\n{content_display}\n```"
+
+            self._update_plan_progress(f"Read file: {file_path}", success=True)
+            self.context_manager.add_user_message(feedback)
+        else:
+            error = result.get("error", "Unknown error")
+            terminal.print_console(f"\n[ERROR] Failed to read file '{file_path}': {error}")
+            self._update_plan_progress(f"Failed to read file: {file_path}", success=False)
+            self.context_manager.add_user_message(f"Failed to read file '{file_path}': {error}")
+        return HandlerResult.CONTINUE
+
+    def _handle_write_file(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'write_file' tool."""
+        terminal = self.terminal
+        file_path = action_item.get("path")
+        explain = action_item.get("explain", "")
+        file_content = action_item.get("content")
+        if not terminal.auto_accept:
+            confirm_prompt_text = f"\nVaultAI> Agent suggests to write file: '{file_path}' which is intended to: {explain}. Proceed? [y/N]: "
+            confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+            if confirm[:1] not in ('y', 'Y'):
+                justification = self._ask_refusal_justification(" to write the file")
+                terminal.print_console(f"\nVaultAI> File write refused by user. Justification: {justification}\n")
+                self.context_manager.add_user_message(f"User refused to write file '{file_path}' with justification: {justification}. Based on this, what should be the next step?")
+                return HandlerResult.CONTINUE
+
+        success = self.file_operator.write_file(file_path, file_content, explain)
+        if success:
+            self.context_manager.add_user_message(f"File '{file_path}' written successfully.")
+            # Update plan progress
+            self._update_plan_progress(f"Created file: {file_path}", success=True)
+        else:
+            self.context_manager.add_user_message(f"Failed to write file '{file_path}'.")
+            self._update_plan_progress(f"Failed to create file: {file_path}", success=False)
+        return HandlerResult.CONTINUE
+
+    def _handle_list_directory(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'list_directory' tool."""
+        terminal = self.terminal
+        dir_path = action_item.get("path") or action_item.get("command_or_path")
+        recursive = action_item.get("recursive", False)
+        pattern = action_item.get("pattern")
+        explain = action_item.get("explain", "")
+
+        if not terminal.auto_accept:
+            pattern_info = f" (pattern: {pattern})" if pattern else ""
+            recursive_info = " recursively" if recursive else ""
+            confirm_prompt_text = f"\nVaultAI> Agent suggests to list directory: '{dir_path}'{recursive_info}{pattern_info}. This is intended to: {explain}. Proceed? [y/N]: "
+            confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+            if confirm[:1] not in ('y', 'Y'):
+                justification = self._ask_refusal_justification()
+                terminal.print_console(f"\nVaultAI> Directory listing refused by user. Justification: {justification}\n")
+                self.context_manager.add_user_message(f"User refused to list directory '{dir_path}' with justification: {justification}. Based on this, what should be the next step?")
+                return HandlerResult.CONTINUE
+
+        result = self.file_operator.list_directory(dir_path, recursive, pattern or None, explain)
+        if result.get("success"):
+            entries = result.get("entries", [])
+            total_count = result.get("total_count", 0)
+
+            terminal.print_console(f"\n[OK] Directory '{dir_path}' listed ({total_count} entries).")
+
+            # Format for display
+            feedback = f"Directory '{dir_path}' contents ({total_count} entries):\n\n"
+
+            # Limit entries in context to avoid token overflow
+            max_entries = 100
+            display_entries = entries[:max_entries]
+
+            for entry in display_entries:
+                entry_type = "📁" if entry["type"] == "directory" else "📄"
+                size_info = f" ({entry.get('size', 0)} bytes)" if entry["type"] == "file" else ""
+                feedback += f"{entry_type} {entry['name']}{size_info}\n"
+
+            if len(entries) > max_entries:
+                feedback += f"\n... and {len(entries) - max_entries} more entries"
+
+            self._update_plan_progress(f"Listed directory: {dir_path}", success=True)
+            self.context_manager.add_user_message(feedback)
+        else:
+            error = result.get("error", "Unknown error")
+            terminal.print_console(f"\n[ERROR] Failed to list directory '{dir_path}': {error}")
+            self._update_plan_progress(f"Failed to list directory: {dir_path}", success=False)
+            self.context_manager.add_user_message(f"Failed to list directory '{dir_path}': {error}")
+        return HandlerResult.CONTINUE
+
+    def _handle_copy_file(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'copy_file' tool."""
+        terminal = self.terminal
+        source = action_item.get("source")
+        destination = action_item.get("destination")
+        overwrite = action_item.get("overwrite", False)
+        explain = action_item.get("explain", "")
+
+        if not terminal.auto_accept:
+            overwrite_info = " (overwrite)" if overwrite else ""
+            confirm_prompt_text = f"\nVaultAI> Agent suggests to copy '{source}' to '{destination}'{overwrite_info}. This is intended to: {explain}. Proceed? [y/N]: "
+            confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+            if confirm[:1] not in ('y', 'Y'):
+                justification = self._ask_refusal_justification()
+                terminal.print_console(f"\nVaultAI> Copy operation refused by user. Justification: {justification}\n")
+                self.context_manager.add_user_message(f"User refused to copy '{source}' to '{destination}' with justification: {justification}. Based on this, what should be the next step?")
+                return HandlerResult.CONTINUE
+
+        result = self.file_operator.copy_file(source, destination, overwrite, explain)
+        if result.get("success"):
+            terminal.print_console(f"\n[OK] Copied '{source}' to '{destination}'.")
+            self._update_plan_progress(f"Copied: {source} -> {destination}", success=True)
+            self.context_manager.add_user_message(f"Successfully copied '{source}' to '{destination}'.")
+        else:
+            error = result.get("error", "Unknown error")
+            terminal.print_console(f"\n[ERROR] Failed to copy: {error}")
+            self._update_plan_progress(f"Failed to copy: {source} -> {destination}", success=False)
+            self.context_manager.add_user_message(f"Failed to copy '{source}' to '{destination}': {error}")
+        return HandlerResult.CONTINUE
+
+    def _handle_delete_file(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'delete_file' tool."""
+        terminal = self.terminal
+        file_path = action_item.get("path")
+        backup = action_item.get("backup", False)
+        explain = action_item.get("explain", "")
+
+        if not terminal.auto_accept:
+            backup_info = " (with backup)" if backup else ""
+            confirm_prompt_text = f"\nVaultAI> Agent suggests to delete '{file_path}'{backup_info}. This is intended to: {explain}. Proceed? [y/N]: "
+            confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+            if confirm[:1] not in ('y', 'Y'):
+                justification = self._ask_refusal_justification()
+                terminal.print_console(f"\nVaultAI> Delete operation refused by user. Justification: {justification}\n")
+                self.context_manager.add_user_message(f"User refused to delete '{file_path}' with justification: {justification}. Based on this, what should be the next step?")
+                return HandlerResult.CONTINUE
+
+        result = self.file_operator.delete_file(file_path, backup, explain)
+        if result.get("success"):
+            backup_path = result.get("backup_path")
+            terminal.print_console(f"\n[OK] Deleted '{file_path}'.")
+            if backup_path:
+                terminal.print_console(f"Backup created: {backup_path}")
+                self._update_plan_progress(f"Deleted: {file_path} (backup: {backup_path})", success=True)
+                self.context_manager.add_user_message(f"Successfully deleted '{file_path}'. Backup created at: {backup_path}")
+            else:
+                self._update_plan_progress(f"Deleted: {file_path}", success=True)
+                self.context_manager.add_user_message(f"Successfully deleted '{file_path}'.")
+        else:
+            error = result.get("error", "Unknown error")
+            terminal.print_console(f"\n[ERROR] Failed to delete: {error}")
+            self._update_plan_progress(f"Failed to delete: {file_path}", success=False)
+            self.context_manager.add_user_message(f"Failed to delete '{file_path}': {error}")
+        return HandlerResult.CONTINUE
+
+    def _handle_edit_file(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'edit_file' tool."""
+        terminal = self.terminal
+        file_path = action_item.get("path")
+        action = action_item.get("action")
+        search = action_item.get("search")
+        replace = action_item.get("replace")
+        line = action_item.get("line")
+        explain = action_item.get("explain", "")
+
+        if not terminal.auto_accept:
+            if action == "replace" and search is not None and replace is not None:
+                desc = f"replace '{search}' with '{replace}'"
+            elif action == "insert_after" and search is not None and line is not None:
+                desc = f"insert '{line}' after '{search}'"
+            elif action == "insert_before" and search is not None and line is not None:
+                desc = f"insert '{line}' before '{search}'"
+            elif action == "delete_line" and search is not None:
+                desc = f"delete lines containing '{search}'"
+            else:
+                desc = f"perform {action} action"
+            confirm_prompt_text = f"\nVaultAI> Agent suggests to edit file '{file_path}' with action: {desc}. This is intended to: {explain}. Proceed? [y/N]: "
+            confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+            if confirm[:1] not in ('y', 'Y'):
+                justification = self._ask_refusal_justification(" to edit the file")
+                terminal.print_console(f"\nVaultAI> File edit refused by user. Justification: {justification}\n")
+                self.context_manager.add_user_message(f"User refused to edit file '{file_path}' with justification: {justification}. Based on this, what should be the next step?")
+                return HandlerResult.CONTINUE
+
+        success = self.file_operator.edit_file(file_path, action, search, replace, line, explain)
+        if success:
+            self.context_manager.add_user_message(f"File '{file_path}' edited successfully.")
+            # Update plan progress
+            self._update_plan_progress(f"Edited file: {file_path} ({action})", success=True)
+        else:
+            self.context_manager.add_user_message(f"Failed to edit file '{file_path}'.")
+            self._update_plan_progress(f"Failed to edit file: {file_path}", success=False)
+        return HandlerResult.CONTINUE
+
+    def _handle_search_in_file(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'search_in_file' tool."""
+        terminal = self.terminal
+        file_path = action_item.get("path")
+        query = action_item.get("query")
+        context_lines = action_item.get("context_lines", 3)
+        max_results = action_item.get("max_results", 10)
+        explain = action_item.get("explain", "")
+
+        if not terminal.auto_accept:
+            confirm_prompt_text = f"\nVaultAI> Agent suggests to search in file '{file_path}' for '{query}'. This is intended to: {explain}. Proceed? [y/N]: "
+            confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+            if confirm[:1] not in ('y', 'Y'):
+                justification = self._ask_refusal_justification()
+                terminal.print_console(f"\nVaultAI> Search operation refused by user. Justification: {justification}\n")
+                self.context_manager.add_user_message(f"User refused to search in file '{file_path}' with justification: {justification}. Based on this, what should be the next step?")
+                return HandlerResult.CONTINUE
+
+        # Start timing search operation
+        search_timing_id = self._start_timing(f"FILE_SEARCH_{file_path}")
+
+        result = self.file_operator.search_in_file(file_path, query, context_lines, max_results, explain)
+        if result.get("success"):
+            # End timing search operation
+            self._end_timing(search_timing_id, f"FILE_SEARCH_{file_path}", True)
+            matches = result.get("matches", [])
+            total_matches = result.get("total_matches", 0)
+
+            terminal.print_console(f"\n[OK] Search in '{file_path}' completed ({total_matches} matches found).")
+
+            # Format search results for display
+            feedback = f"Search results in '{file_path}' for '{query}':\n\n"
+            feedback += f"Total matches: {total_matches}\n\n"
+
+            if matches:
+                for i, match in enumerate(matches, 1):
+                    feedback += f"Match {i} (Line {match['line_number']}):\n"
+                    feedback += f"  Content: {match['content']}\n"
+                    if match.get('context_before'):
+                        feedback += f"  Before: {match['context_before']}\n"
+                    if match.get('context_after'):
+                        feedback += f"  After: {match['context_after']}\n"
+                    feedback += "\n"
+
+            self._update_plan_progress(f"Search in file: {file_path} for '{query}'", success=True)
+            self.context_manager.add_user_message(feedback)
+        else:
+            error = result.get("error", "Unknown error")
+            terminal.print_console(f"\n[ERROR] Failed to search in file '{file_path}': {error}")
+            self._update_plan_progress(f"Failed to search in file: {file_path}", success=False)
+            self.context_manager.add_user_message(f"Failed to search in file '{file_path}': {error}")
+        return HandlerResult.CONTINUE
+
+    def _handle_update_plan_step(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'update_plan_step' tool."""
+        terminal = self.terminal
+        step_number = action_item.get("step_number")
+        status = action_item.get("status")
+        result = action_item.get("result", "")
+        step_status = self._PLAN_STEP_STATUSES[status]
+
+        # Check if plan exists before attempting to update
+        if not self.plan_manager.steps:
+            terminal.print_console(f"[WARN] No action plan exists. Cannot update step {step_number}.")
+            self.context_manager.add_user_message(
+                f"You tried to update plan step {step_number}, but no action plan exists. "
+                f"Create a plan first using the 'create_action_plan' tool, or proceed without a plan."
+            )
+            return HandlerResult.CONTINUE
+
+        # Update the plan step
+        success = self.plan_manager.mark_step_status(step_number, step_status, result)
+        if success:
+            terminal.print_console(f"[OK] Plan step {step_number} marked as {status}")
+            self.context_manager.add_user_message(f"Plan step {step_number} successfully marked as {status}. Result: {result}")
+            # Display updated plan
+            self.plan_manager.display_compact()
+        else:
+            terminal.print_console(f"[WARN] Failed to update plan step {step_number}. Step may not exist in the plan.")
+            self.context_manager.add_user_message(f"Failed to update plan step {step_number}. Step may not exist in the plan.")
+        return HandlerResult.CONTINUE
+
+    def _handle_web_search_agent(self, action_item: Dict[str, Any], request_id: str, has_more_actions: bool) -> HandlerResult:
+        """Handle the 'web_search_agent' tool."""
+        terminal = self.terminal
+        # Web search agent tool for internet research
+        query = action_item.get("query")
+        max_sources = action_item.get("max_sources", 5)
+        deep_search = action_item.get("deep_search", True)
+        explain = action_item.get("explain", "")
+
+        # Check if WebSearchAgent is available
+        if not WEB_SEARCH_AGENT_AVAILABLE:
+            terminal.print_console("[ERROR] WebSearchAgent is not available. Please install required dependencies: pip install duckduckgo-search beautifulsoup4 lxml")
+            self.context_manager.add_user_message(
+                "The 'web_search_agent' tool is not available because required dependencies are missing. "
+                "Install them with: pip install duckduckgo-search beautifulsoup4 lxml. "
+                "Try an alternative approach to complete this step."
+            )
+            return HandlerResult.CONTINUE
+
+        effective_engine = (
+            self.web_search_agent.config.get("engine") if self.web_search_agent else "duckduckgo"
+        )
+
+        if not terminal.auto_accept:
+            confirm_prompt_text = f"\nVaultAI> Agent suggests to search web for: '{query}' using {effective_engine}. This is intended to: {explain}. Proceed? [y/N]: "
+            confirm = self._get_user_input(confirm_prompt_text, multiline=False).strip()
+            if confirm[:1] not in ('y', 'Y'):
+                justification = self._ask_refusal_justification(" the search")
+                terminal.print_console(f"\nVaultAI> Web search refused by user. Justification: {justification}\n")
+                self.context_manager.add_user_message(f"User refused to search for '{query}' with justification: {justification}. Based on this, what should be the next step?")
+                return HandlerResult.CONTINUE
+
+        terminal.print_console(f"\nVaultAI> Executing web search: {query}")
+        # logging.Logger reports handler failures itself, no guard needed
+        self.logger.info("Executing web search: query='%s', engine=%s; request_id=%s", query, effective_engine, request_id)
+
+        # Start timing web search operation
+        search_timing_id = self._start_timing(f"WEB_SEARCH_{query[:50]}")
+
+        try:
+            search_result = self._cached_web_search(query, max_sources, deep_search)
+
+            if search_result.get('success'):
+                # Build feedback message
+                summary = search_result.get('summary', '')
+                sources = search_result.get('sources', [])
+                confidence = search_result.get('confidence', 0)
+                iterations = search_result.get('iterations_used', 0)
+
+                terminal.print_console(f"\n[OK] Web search completed (confidence: {confidence:.0%}, {len(sources)} sources, {iterations} iterations)")
+
+                # Format results for AI context
+                result_parts = [
+                    f"Web Search Results for: '{query}'\n\n",
+                    f"Summary:\n{summary}\n\n",
+                    f"Confidence: {confidence:.0%}\n",
+                    f"Sources found: {len(sources)}\n\n",
+                ]
+
+                if sources:
+                    result_parts.append("Sources:\n")
+                    for i, source in enumerate(sources[:5], 1):
+                        result_parts.append(f"{i}. {source.get('title', 'Untitled')}\n")
+                        result_parts.append(f"   URL: {source.get('url', '')}\n")
+                        result_parts.append(f"   Relevance: {source.get('relevance', 0):.0%}\n")
+                        content = source.get('content', '')
+                        if content:
+                            if len(content) > 500:
+                                content = content[:500] + "..."
+                            result_parts.append(f"   Content: {content}\n")
+                        result_parts.append("\n")
+                result_text = "".join(result_parts)
+
+                # End timing web search operation
+                self._end_timing(search_timing_id, f"WEB_SEARCH_{query[:50]}", True)
+
+                # Update plan progress
+                self._update_plan_progress(f"Web search: {query}", success=True)
+
+                self.context_manager.add_user_message(result_text)
+            else:
+                # End timing web search operation (failed)
+                self._end_timing(search_timing_id, f"WEB_SEARCH_{query[:50]}", False)
+
+                error_msg = search_result.get('summary', 'Unknown error')
+                terminal.print_console(f"\n[ERROR] Web search failed: {error_msg}")
+                self._update_plan_progress(f"Web search failed: {query}", success=False)
+                self.context_manager.add_user_message(f"Web search for '{query}' failed: {error_msg}. Try an alternative approach.")
+
+        except Exception as e:
+            import traceback
+            error_msg = f"Web search exception: {e}\nStack trace: {traceback.format_exc()}"
+            # End timing web search operation (exception)
+            self._end_timing(search_timing_id, f"WEB_SEARCH_{query[:50]}", False)
+
+            terminal.print_console(f"\n[ERROR] Web search exception: {e}")
+            self.logger.error(error_msg)
+            self._update_plan_progress(f"Web search error: {query}", success=False)
+            self.context_manager.add_user_message(f"Web search for '{query}' encountered an error: {str(e)}. Try an alternative approach.")
+        return HandlerResult.CONTINUE
+
+    # Tool name -> handler (plain functions; called with self explicitly)
+    _TOOL_HANDLERS = {
+        "create_action_plan": _handle_create_action_plan,
+        "finish": _handle_finish,
+        "bash": _handle_bash,
+        "analysis_data": _handle_analysis_data,
+        "ask_user": _handle_ask_user,
+        "read_file": _handle_read_file,
+        "write_file": _handle_write_file,
+        "list_directory": _handle_list_directory,
+        "copy_file": _handle_copy_file,
+        "delete_file": _handle_delete_file,
+        "edit_file": _handle_edit_file,
+        "search_in_file": _handle_search_in_file,
+        "update_plan_step": _handle_update_plan_step,
+        "web_search_agent": _handle_web_search_agent,
+    }
+
+    def run(self):
+        terminal = self.terminal
+        keep_running = True
+        self._debug = self.logger.isEnabledFor(logging.DEBUG)
+        self.context_manager.refresh_log_level()
+
+        if self.force_plan:
+            self.compact_mode = False
+            self.hybrid_mode = False
+
+        if self.compact_mode:
+            self._run_compact_pipeline()
+
+            if not self.hybrid_mode or not self._compact_should_fallback():
+                summary_text = self.summary or "Agent reported task finished."
+                self.terminal.print_console(
+                    f"\nVaultAI> Agent finished its task.\nSummary: {summary_text}"
+                )
+                if self.show_performance_summary and (
+                    self.timings
+                    or (hasattr(self.ai_handler, 'token_usage') and self.ai_handler.token_usage)
+                ):
+                    self.terminal.print_console("\n" + "="*60)
+                    self.terminal.print_console("PERFORMANCE SUMMARY")
+                    self.terminal.print_console("="*60)
+                    if hasattr(self.ai_handler, 'token_usage') and self.ai_handler.token_usage:
+                        self._display_cost_optimization_recommendations()
+                    if self.timings:
+                        self._display_timing_summary()
+                    if hasattr(self.ai_handler, 'token_usage') and self.ai_handler.token_usage:
+                        self._display_token_summary()
+                    # Display summarize operations summary
+                    self._display_summarize_stats_summary()
+                    self.terminal.print_console("="*60)
+                return
+            self.terminal.print_console("\n VaultAI> Compact mode fallback to normal mode.")
+            self.summary = ""
+            self.goal_success = False
+
+        self.logger.info("Starting VaultAIAgentRunner.run for goal: %s", self.user_goal)
+
+        # Check if plan should be forced (via --plan flag or [plan] keyword)
+        if self.force_plan:
+            self._initialize_plan()
+
+        while keep_running:
+            task_finished_successfully = False
+            agent_should_stop_this_turn = False
+
+            for step_count in range(self.max_steps):  # Configurable step limit
+                # Generate a unique request id for this step to trace the flow
+                request_id = _next_request_id()
+                if self._debug:
+                    self.logger.debug("Step %s starting; request_id=%s; current context len=%s", step_count, request_id, self.context_manager.get_context_length())
+                # Add current plan status to the prompt if plan exists
+                # This ensures AI is always aware of plan progress
+                plan_status = self._get_plan_status_for_ai() if self._plan_exists() else None
+                prompt_text = self._render_prompt_text(self._iter_sliding_window_context(), plan_status)
+
+                # Start timing AI response generation
+                ai_timing_id = self._start_timing("AI_RESPONSE_GENERATION")
+                
+                try:
+                    ai_reply = self._send_agent_request(prompt_text)
+                except KeyboardInterrupt:
+                    self._end_timing(ai_timing_id, "AI_RESPONSE_GENERATION", False)
+                    terminal.print_console("\nVaultAI> AI request cancelled by user.")
+                    self.summary = "Agent stopped: AI request cancelled by user."
+                    agent_should_stop_this_turn = True
+                    break
+                
+                # End timing AI response generation
+                ai_duration = self._end_timing(ai_timing_id, "AI_RESPONSE_GENERATION", ai_reply is not None)
+
+                if self._debug:
+                    self.logger.debug("AI reply received (nil? %s) request_id=%s", ai_reply is None, request_id)
+
+                if ai_reply is None:
+                    self.summary = "Agent stopped: Failed to get response from AI after multiple retries."
+                    agent_should_stop_this_turn = True
+                    break
+                
+                data = None
+                ai_reply_json_string = None
+                corrected_successfully = False
+
+                if ai_reply:
+                    # Use enhanced JSON validator if available, otherwise fall back to original parsing
+                    success, data, ai_reply_json_string, corrected_successfully, error_message = self._parse_ai_response_with_enhanced_validator(ai_reply, request_id)
+                    
+                    if not success:
+                        # Enhanced validator and fallback both failed
+                        terminal.print_console(f"JSON parsing failed: {error_message}. Continuing with task using alternative approach.")
+                        self.summary = f"Agent continued: JSON parsing failed ({error_message}), trying alternative approach."
+                        # Add the failed response to context
+                        self.context_manager.add_assistant_message(ai_reply or "")
+                        self.context_manager.add_user_message(f"Your response could not be parsed as JSON: {error_message}. Please provide a new response with valid JSON format.")
+                        # Set data to None to trigger the fallback behavior
+                        data = None
+
+                if data is None:
+                    terminal.print_console("JSON parsing failed. Continuing with task using alternative approach.")
+                    self.summary = "Agent continued: JSON parsing failed, trying alternative approach."
+                    self.logger.warning("Data is None after parsing attempts. ai_reply=%s", ai_reply)
+                    if ai_reply and not ai_reply_json_string: # If original reply exists but wasn't parsed
+                        self.context_manager.add_assistant_message(ai_reply)
+                        self.context_manager.add_user_message("Your response could not be parsed as JSON. Please provide a new response with valid JSON format.")
+                    # Continue with the loop instead of breaking
+                    continue
+
+                if ai_reply_json_string: # This is the string of the successfully parsed JSON (original or corrected)
                     self.context_manager.add_assistant_message(ai_reply_json_string)
                     # Record the assistant response with the request id for tracing
                     try:
                         self.context_manager.record_request(request_id, step_count, ai_reply_json_string)
-                        self.logger.debug("Recorded assistant response in request_history; request_id=%s", request_id)
+                        if self._debug:
+                            self.logger.debug("Recorded assistant response in request_history; request_id=%s", request_id)
                     except Exception:
-                        try:
-                            self.logger.exception("Failed to record request_history for request_id=%s", request_id)
-                        except Exception:
-                            pass
-
-                    # Clean up request history to prevent memory leaks
-                    self._cleanup_request_history()
+                        self.logger.exception("Failed to record request_history for request_id=%s", request_id)
+                    # request_history is a bounded deque, so no per-step cleanup is needed
                 else:
                     terminal.logger.error("Logic error: data is not None, but no JSON string was stored for context.")
                     self.summary = "Agent stopped: Internal logic error in response handling for context."
@@ -2228,1483 +4270,62 @@ class VaultAIAgentRunner:
                     agent_should_stop_this_turn = True
                     break
 
-                for action_item_idx, action_item in enumerate(actions_to_process):
-                    if agent_should_stop_this_turn: break
-
-                    if not isinstance(action_item, dict):
-                        terminal.print_console(f"Action item {action_item_idx + 1}/{len(actions_to_process)} is not a dictionary: {action_item}. Skipping.")
-                        self.context_manager.add_user_message(f"Action item {action_item_idx + 1} in your list was not a dictionary: {action_item}. I am skipping it.")
-                        continue
-
-                    tool = action_item.get("tool")
-                    # Backward compatibility alias
-                    if tool == "analyze_data":
-                        tool = "analysis_data"
-                        action_item["tool"] = "analysis_data"
-                    elif tool == "final":
-                        tool = "finish"
-                        action_item["tool"] = "finish"
-                        if "summary" not in action_item and "answer" in action_item:
-                            action_item["summary"] = action_item.get("answer")
-                        if "goal_success" not in action_item:
-                            action_item["goal_success"] = True
-                    
-                    if tool is None:
-                        terminal.print_console(f"[WARN] AI response missing 'tool' field: {action_item}")
-                        self.context_manager.add_user_message(
-                            "Your response is missing the required 'tool' field. "
-                            "Valid tools are: 'create_action_plan', 'bash', 'read_file', 'write_file', 'edit_file', "
-                            "'list_directory', 'search_in_file', 'copy_file', 'delete_file', 'analysis_data', "
-                            "'update_plan_step', 'ask_user', 'web_search_agent', 'finish'. "
-                            "Please provide a valid JSON response with the correct structure."
-                        )
-                        continue
-                    
+                validation_errors = self._validate_actions(actions_to_process)
+                if validation_errors:
+                    terminal.print_console(f"[WARN] {len(validation_errors)} invalid action(s) in AI response. Skipping this turn.")
+                    self.context_manager.add_user_message(
+                        "Your response contained invalid actions, so none of them were executed:\n- "
+                        + "\n- ".join(validation_errors)
+                        + f"\nValid tools are: {', '.join(repr(t) for t in self._VALID_TOOLS)}. "
+                        "Please provide a corrected set of actions."
+                    )
+                    continue
 
-                    if tool == "create_action_plan":
-                        # Create action plan tool - agent decides when task is complex
-                        goal = action_item.get("goal", self.user_goal)
-                        explain = action_item.get("explain", "")
-                        
-                        terminal.print_console(f"\nVaultAI> Creating action plan for: {goal}")
-                        if explain:
-                            terminal.print_console(f"Reason: {explain}")
-                        
-                        # Start timing plan creation
-                        plan_timing_id = self._start_timing(f"PLAN_CREATION_{goal[:50]}")
-                        
-                        # Check if plan already exists
-                        if self.plan_manager.steps:
-                            terminal.print_console("[WARN] A plan already exists. Clearing old plan.")
-                            self.plan_manager.clear()
-                        
-                        try:
-                            steps = self.plan_manager.create_plan_with_ai(goal)
-                            
-                            if steps:
-                                terminal.print_console(f"[OK] Created plan with {len(steps)} steps")
-                                self.plan_manager.display_plan()
-                                
-                                # In interactive mode, ask for plan acceptance
-                                if not terminal.auto_accept:
-                                    self._interactive_plan_acceptance()
-                                
-                                # Add plan to AI context - THIS IS CRITICAL FOR AI TO SEE THE PLAN
-                                plan_context = self.plan_manager.get_context_for_ai()
-                                self.context_manager.add_system_message(
-                                    f"Action plan created successfully. "
-                                    f"Execute steps sequentially and update the status of each step after completion.\n\n{plan_context}"
-                                )
-                                self.context_manager.add_user_message(
-                                    f"Action plan created with {len(steps)} steps. Begin execution with step 1."
-                                )
-                                self.logger.info(f"[PLAN ADDED TO CONTEXT] Dynamic plan with {len(steps)} steps added to AI context during execution")
-                                
-                                # End timing plan creation (success)
-                                self._end_timing(plan_timing_id, f"PLAN_CREATION_{goal[:50]}", True)
-                            else:
-                                terminal.print_console("[WARN] Failed to create action plan. Proceeding without plan.")
-                                self.context_manager.add_user_message(
-                                    "Failed to create action plan. You can proceed without a plan or try again. "
-                                    "For simple tasks, just execute commands directly."
-                                )
-                                
-                                # End timing plan creation (failed)
-                                self._end_timing(plan_timing_id, f"PLAN_CREATION_{goal[:50]}", False)
-                        except Exception as e:
-                            terminal.print_console(f"[ERROR] Failed to create action plan: {e}")
-                            self.context_manager.add_user_message(
-                                f"Failed to create action plan due to error: {e}. "
-                                "You can proceed without a plan for simple tasks."
-                            )
-                            
-                            # End timing plan creation (exception)
-                            self._end_timing(plan_timing_id, f"PLAN_CREATION_{goal[:50]}", False)
-                        continue
-
-                    elif tool == "finish":
-                        summary_text = action_item.get("summary", "Agent reported task finished.")
-                        goal_success = action_item.get("goal_success", False)
-                        if isinstance(goal_success, bool):
-                            self.goal_success = goal_success
-                        else:
-                            self.logger.warning(f"Invalid or missing 'goal_success' value in finish tool: {goal_success}. Expected a boolean. Defaulting to False. request_id={request_id}")
-                            self.goal_success = False
-                        
-                        # Check if plan exists and if all steps are completed before allowing finish
-                        if self.plan_manager.steps:
-                            progress = self.plan_manager.get_progress()
-                            if progress['pending'] > 0 or progress['in_progress'] > 0:
-                                incomplete_steps = progress['pending'] + progress['in_progress']
-                                terminal.print_console(f"\n[WARN] Agent tried to finish but {incomplete_steps} plan step(s) are still pending.")
-                                self.context_manager.add_user_message(
-                                    f"You tried to finish the task, but the action plan is not complete. "
-                                    f"You still have {incomplete_steps} step(s) pending or in progress. "
-                                    f"Please complete all plan steps before calling 'finish'. "
-                                    f"If a step cannot be completed, mark it as failed with a reason. "
-                                    f"Current plan status: {progress['completed']}/{progress['total']} completed."
-                                )
-                                continue
-                        # If no plan exists, allow finish without checking plan status
-
-                        should_gate_finish_with_critic = (
-                            self.goal_success
-                            and self.enable_critic_sub_agent
-                            and self.loop_critic_sub_agent
-                            and self.critic_sub_agent is not None
-                        )
-                        if (
-                            self.goal_success
-                            and self.enable_critic_sub_agent
-                            and self.critic_sub_agent is None
-                            and self.loop_critic_sub_agent
-                        ):
-                            self.logger.warning(
-                                "LOOP_CRITIC_SUB_AGENT is enabled but CriticSubAgent is unavailable; "
-                                "continuing without critic gate."
-                            )
-
-                        # --- CriticSubAgent: Correctness Score / optional finish gate ---
-                        if (
-                            self.goal_success
-                            and self.enable_critic_sub_agent
-                            and self.critic_sub_agent is not None
-                        ):
-                            try:
-                                # Pass command results to critic for better evaluation
-                                # Limit to last 5 results to avoid token overflow
-                                agent_results = self.command_results[-5:] if self.command_results else None
-                                critic_result = self.critic_sub_agent.run(
-                                    user_goal=self.user_goal,
-                                    agent_summary=summary_text,
-                                    agent_results=agent_results,
-                                )
-                                self.critic_rating = critic_result.get("rating", 0)
-                                self.critic_verdict = critic_result.get("verdict", "")
-                                self.critic_rationale = critic_result.get("rationale", "")
-                            except Exception as e:
-                                terminal.print_console(f"\n[WARN] Critic Sub-Agent encountered an error: {e}")
-                                self.logger.warning("CriticSubAgent.run failed: %s", e)
-                        # --- End CriticSubAgent ---
-
-                        if should_gate_finish_with_critic:
-                            critic_verdict = self.critic_verdict.strip()
-                            if not self._is_critic_verdict_acceptable(critic_verdict):
-                                terminal.print_console(
-                                    "\n[WARN] Finish blocked by Critic Sub-Agent verdict "
-                                    f"'{critic_verdict or 'Unknown'}'."
-                                )
-                                self.context_manager.add_user_message(
-                                    "Your 'finish' action was rejected by CriticSubAgent. "
-                                    f"Critic rating: {self.critic_rating}/10. "
-                                    f"Verdict: {critic_verdict or 'Unknown'}. "
-                                    f"Rationale: {self.critic_rationale or 'No rationale provided.'} "
-                                    "Please continue working and call 'finish' only after fully addressing "
-                                    "the user goal."
-                                )
-                                try:
-                                    self.logger.info(
-                                        "Finish rejected by critic verdict=%s rating=%s request_id=%s",
-                                        critic_verdict or "Unknown",
-                                        self.critic_rating,
-                                        request_id,
-                                    )
-                                except Exception:
-                                    pass
-                                continue
-
-                        # Track which model created the summary
-                        model_used = getattr(self.ai_handler, 'ai_engines', [getattr(self.ai_handler, 'ai_engine', 'unknown')])[0]
-                        self.summary_model_creator = model_used
-
-                        terminal.print_console(f"\nVaultAI> Agent finished its task.\nSummary: {summary_text}")
-                        self.summary = summary_text
-                        task_finished_successfully = True
-                        agent_should_stop_this_turn = True
-                        try:
-                            # Log finish along with the request id for traceability
-                            self.logger.info("Agent signaled finish with summary: %s; request_id=%s; model=%s", summary_text, request_id, model_used)
-                        except Exception:
-                            pass
-
-                        # Display model information in summary
-                        terminal.print_console(f"Summary created by: {model_used}")
-
-                        # --- FinishSubAgent: Deep Analysis ---
-                        # Ask user whether to run the deep analysis sub-agent
-                        if self.finish_sub_agent is not None and self.show_finish_sub_agent:
-                            run_analysis = self._get_user_input(
-                                "\nVaultAI> Run Deep Analysis Sub-Agent for a detailed session report? [y/N]: ",
-                                multiline=False
-                            ).lower().strip()
-
-                            if run_analysis == 'y':
-                                try:
-                                    self.finish_sub_agent.run(
-                                        user_goal=self.user_goal,
-                                        agent_summary=summary_text,
-                                        context_manager=self.context_manager,
-                                        plan_manager=self.plan_manager,
-                                        steps=self.steps,
-                                    )
-                                except Exception as e:
-                                    terminal.print_console(f"\n[WARN] Deep Analysis Sub-Agent encountered an error: {e}")
-                                    self.logger.warning("FinishSubAgent.run failed: %s", e)
-                            else:
-                                terminal.print_console("Deep Analysis skipped.")
-                        # --- End FinishSubAgent ---
-
-                        break 
-                    
-                    elif tool == "bash":
-                        command = action_item.get("command")
-                        timeout = action_item.get("timeout")
-                        explain = action_item.get("explain", "")
-                        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
-                            terminal.print_console(f"Invalid timeout value in bash action: {timeout}. Must be a positive number. Skipping.")
-                            self.context_manager.add_user_message(f"You provided an invalid timeout: {timeout} in {action_item}. Timeout must be a positive number. I am skipping it.")
-                            continue
-                        if not command:
-                            terminal.print_console(f"No command provided in bash action: {action_item}. Skipping.")
-                            self.context_manager.add_user_message(f"You provided a 'bash' tool action but no command: {action_item}. I am skipping it.")
-                            continue
-
-                        # Security: Validate command before execution
-                        if terminal.block_dangerous_commands:
-                            is_valid, reason = self.security_validator.validate_command(command)
-                            if not is_valid:
-                                terminal.print_console(f"Command validation failed: {reason}. Skipping.")
-                                self.context_manager.add_user_message(f"Command '{command}' failed security validation: {reason}. I am skipping it.")
-                                continue
-
-                        if not terminal.auto_accept:
-                            if self.terminal.auto_explain_command and explain:
-                                confirm_prompt_text = f"\nVaultAI> Agent suggests to run command: '{command}' which is intended to: {explain}. Execute? [y/N]: "
-                            else:
-                                confirm_prompt_text = f"\nVaultAI> Agent suggests to run command: '{command}'. Execute? [y/N]: "
-
-                            confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                            if confirm != 'y':
-                                justification = self._get_user_input(f"\nVaultAI> Provide justification for refusing the command and press Ctrl+S to submit.\n{self.input_text}>  ", multiline=True).strip()
-                                terminal.print_console(f"\nVaultAI> Command refused by user. Justification: {justification}\n")
-                                self.context_manager.add_user_message(f"User refused to execute command '{command}' with justification: {justification}. Based on this, what should be the next step?")
-                                continue
-
-                        terminal.print_console(f"\nVaultAI> Executing: {command}")
-                        try:
-                            self.logger.info("\nVaultAI> Executing bash command: %s; request_id=%s", command, request_id)
-                        except Exception:
-                            pass
-                        
-                        # Start timing command execution
-                        cmd_timing_id = self._start_timing(f"COMMAND_EXECUTION_{command[:50]}")
-                        
-                        out, code = "", 1
-                        if self.terminal.ssh_connection:
-                            remote = f"{self.terminal.user}@{self.terminal.host}" if self.terminal.user and self.terminal.host else self.terminal.host
-                            password = getattr(self.terminal, "ssh_password", None)
-                            out, code = self.terminal.execute_remote_pexpect(command, remote, password=password, timeout=timeout)
-                        else:
-                            out, code = self.terminal.execute_local(command, timeout=timeout) # Corrected method call
-                        
-                        # End timing command execution
-                        cmd_duration = self._end_timing(cmd_timing_id, f"COMMAND_EXECUTION_{command[:50]}", code == 0)
+                actions_to_process, skipped_actions = self._apply_field_checks(actions_to_process)
+                if skipped_actions:
+                    terminal.print_console(f"[WARN] Skipping {len(skipped_actions)} action(s) with invalid values.")
+                    self.context_manager.add_user_message(
+                        "I skipped these actions because of invalid values and ran the others:\n- "
+                        + "\n- ".join(skipped_actions)
+                    )
 
-                        self.steps.append(f"Step {len(self.steps) + 1}: executed '{command}' (code {code})")
-                        
-                        # Store command result for critic evaluation (compact version to save memory)
-                        out_str = out if isinstance(out, str) else str(out)
-
-                        self.command_results.append({
-                            "tool": "bash",
-                            "command": command,
-                            "code": int(code),
-                            "out": f"{summarize_generic_table(out_str)}",
-                        })
-                        
-                        #terminal.print_console(f"Result (exit code: {code}):\n{out}")
-                        terminal.print_console(f"\n{out}")
-                        try:
-                            self.logger.debug("Command result: code=%s, out_len=%s; request_id=%s", code, len(out) if isinstance(out, str) else 0, request_id)
-                        except Exception:
-                            pass
-
-                        # Check for SSH connection error (code 255)
-                        # Note: code 255 may also occur due to remote command failures or traps,
-                        # so we only stop for true connection issues when output indicates connection problems
-                        if self.terminal.ssh_connection and code == 255 and ("Connection refused" in out or "No route to host" in out or "Connection timed out" in out or "Permission denied" in out or "Operation timed out" in out):
-                            terminal.print_console(
-                                "[ERROR] SSH connection failed (host may be offline or unreachable). "
-                                "Agent is stopping."
-                            )
-                            self.summary = "Agent stopped: SSH connection failed (host offline or unreachable)."
+                self._prefetch_web_searches(actions_to_process)
+                try:
+                    self._prefetch_readonly_commands(actions_to_process)
+
+                    for action_item_idx, action_item in enumerate(actions_to_process):
+                        tool = action_item.get("tool")
+                        # Backward compatibility alias
+                        if tool == "analyze_data":
+                            tool = "analysis_data"
+                            action_item["tool"] = "analysis_data"
+                        elif tool == "final":
+                            tool = "finish"
+                            action_item["tool"] = "finish"
+                            if "summary" not in action_item and "answer" in action_item:
+                                action_item["summary"] = action_item.get("answer")
+                            if "goal_success" not in action_item:
+                                action_item["goal_success"] = True
+
+                        # Tools that read or replace the plan see all earlier progress
+                        if tool in ("create_action_plan", "finish", "update_plan_step"):
+                            self._flush_plan_updates()
+
+                        has_more_actions = action_item_idx < len(actions_to_process) - 1
+                        handler = self._TOOL_HANDLERS[tool]  # _validate_actions() rejected unknown tools
+                        result = handler(self, action_item, request_id, has_more_actions)
+
+                        if result is HandlerResult.FINISH:
+                            task_finished_successfully = True
                             agent_should_stop_this_turn = True
                             break
-                        elif self.terminal.ssh_connection and code == 255:
-                            # Likely a command failure misinterpreted as connection error, continue
-                            terminal.print_console(
-                                "[WARNING] Received exit code 255 from remote command, "
-                                "but no connection error detected. Treating as command failure."
-                            )
-
-                        # Build smart feedback based on exit code
-
-                        # Use output type detection if enabled, otherwise default to "text"
-                        if self.enable_output_type_detection:
-                            output_type = detect_output_type(out, command)
-                        else:
-                            output_type = "text"
-                        if output_type == "empty":
-                            original_feedback = (
-                                f"Command '{command}' executed with exit code {code} and no output.\n"
-                                f"The command {'succeeded' if code == 0 else 'failed'} with no output. "
-                                f"You can mark this step as {'completed' if code == 0 else 'failed'} and proceed to the next step."
-                            )
-                        elif output_type == "json":
-                            # pretty / truncate JSON output for feedback
-                            original_len = len(out)
-                            summarized_json_out = summarize_json(out)
-                            summarized_len = len(summarized_json_out)
-                            # Track summarize stats
-                            self.summarize_stats["json"]["original"] += original_len
-                            self.summarize_stats["json"]["summarized"] += summarized_len
-                            self.summarize_stats["json"]["count"] += 1
-                            self.summarize_stats["total_original"] += original_len
-                            self.summarize_stats["total_summarized"] += summarized_len
-                            self.summarize_stats["total_saved"] += (original_len - summarized_len)
-                            self.summarize_stats["total_count"] += 1
-                            self.logger.debug(f"JSON Command output from {original_len} chars to {summarized_len} chars for feedback (saved {original_len - summarized_len})")
-                            if code == 0:
-                                original_feedback = (
-                                    f"Command '{command}' executed successfully with exit code 0 and produced JSON output.\n"
-                                    f"Output:\n\n{summarized_json_out}\n\n"
-                                    "The command succeeded. You can mark this step as completed and proceed to the next step."
-                                )
-                            else:
-                                    original_feedback = (
-                                        f"Command '{command}' failed with exit code {code} but produced JSON output.\n"
-                                        f"Output:\n\n{summarized_json_out}\n\n"
-                                        f"The command failed. Analyze the error and decide:\n"
-                                        f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
-                                        f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
-                                        f"- SKIP: If this step is non-critical and you can proceed without it\n"
-                                        f"- FAIL: If this is a critical error that blocks progress\n"
-                                        f"What is your decision?"
-                                    )
-                        elif output_type == "stacktrace":
-                            original_len = len(out)
-                            summarized_stacktrace_out = summarize_stacktrace(out)
-                            summarized_len = len(summarized_stacktrace_out)
-                            # Track summarize stats
-                            self.summarize_stats["stacktrace"]["original"] += original_len
-                            self.summarize_stats["stacktrace"]["summarized"] += summarized_len
-                            self.summarize_stats["stacktrace"]["count"] += 1
-                            self.summarize_stats["total_original"] += original_len
-                            self.summarize_stats["total_summarized"] += summarized_len
-                            self.summarize_stats["total_saved"] += (original_len - summarized_len)
-                            self.summarize_stats["total_count"] += 1
-                            self.logger.debug(f"Stacktrace Command output from {original_len} chars to {summarized_len} chars for feedback (saved {original_len - summarized_len})")
-                            if code == 0:
-                                original_feedback = (
-                                    f"Command '{command}' executed successfully with exit code 0 but produced a stacktrace output.\n"
-                                    f"Output:\n\n{summarized_stacktrace_out}\n\n"
-                                    "The command succeeded but produced a stacktrace. Analyze the output to determine if there are any warnings or non-critical errors. You can mark this step as completed and proceed to the next step if the stacktrace does not indicate a critical issue."
-                                )
-                            else:
-                                original_feedback = (
-                                    f"Command '{command}' failed with exit code {code} and produced a stacktrace output.\n"
-                                    f"Output:\n\n{summarized_stacktrace_out}\n\n"
-                                    f"The command failed and produced a stacktrace. Analyze the stacktrace to identify the error. Based on the analysis, decide:\n"
-                                    f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
-                                    f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
-                                    f"- SKIP: If this step is non-critical and you can proceed without it\n"
-                                    f"- FAIL: If this is a critical error that blocks progress\n"
-                                    f"What is your decision?"
-                                )
-                        elif output_type == "log":
-                            if  should_compress_adaptive(out):
-                                compressed_out = self._compress_with_fallback(out, self.logger)
-                                self.logger.debug(f"Compressed command output from {len(out)} chars to {len(compressed_out)} chars for command: {command}")
-                                out = compressed_out
-                                text_for_feedback = f"Compressed Output:\n\n{out}\n\n"
-                            else:
-                                text_for_feedback = f"Output:\n\n{out}\n\n"
-                            if code == 0:
-                                original_feedback = (
-                                    f"Command '{command}' executed successfully with exit code 0 and produced log output.\n"
-                                    f"{text_for_feedback}"
-                                    "The command succeeded. You can mark this step as completed and proceed to the next step."
-                                )
-                            else:
-                                original_feedback = (
-                                    f"Command '{command}' failed with exit code {code} but produced log output.\n"
-                                    f"{text_for_feedback}"
-                                    f"The command failed. Analyze the log output to identify any error messages or warnings. Based on the analysis, decide:\n"
-                                    f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
-                                    f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
-                                    f"- SKIP: If this step is non-critical and you can proceed without it\n"
-                                    f"- FAIL: If this is a critical error that blocks progress\n"
-                                    f"What is your decision?"
-                                )
-                        elif output_type == "table":
-                            # Summarize table output using the new summarization functions
-                            try:
-                                original_len = len(out)
-                                summarized_output = summarize_table(out)
-                                summarized_len = len(summarized_output)
-                                # Track summarize stats
-                                self.summarize_stats["table"]["original"] += original_len
-                                self.summarize_stats["table"]["summarized"] += summarized_len
-                                self.summarize_stats["table"]["count"] += 1
-                                self.summarize_stats["total_original"] += original_len
-                                self.summarize_stats["total_summarized"] += summarized_len
-                                self.summarize_stats["total_saved"] += (original_len - summarized_len)
-                                self.summarize_stats["total_count"] += 1
-                                self.logger.debug(f"Table Command output from {original_len} chars to {summarized_len} chars for feedback (saved {original_len - summarized_len})")
-                                if code == 0:
-                                    original_feedback = (
-                                        f"Command '{command}' executed successfully with exit code 0 and produced table output.\n"
-                                        f"Summary:\n{summarized_output}\n"
-                                        "The command succeeded. You can mark this step as completed and proceed to the next step."
-                                    )
-                                else:
-                                    original_feedback = (
-                                        f"Command '{command}' failed with exit code {code} but produced table output.\n"
-                                        f"Summary:\n{summarized_output}\n"
-                                        f"The command failed. Analyze the table output to identify any error messages or warnings. Based on the analysis, decide:\n"
-                                        f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
-                                        f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
-                                        f"- SKIP: If this step is non-critical and you can proceed without it\n"
-                                        f"- FAIL: If this is a critical error that blocks progress\n"
-                                        f"What is your decision?"
-                                    )
-                            except Exception as e:
-                                # Fallback to original behavior if summarization fails
-                                self.logger.warning(f"Table summarization failed for command '{command}': {e}")
-                                if code == 0:
-                                    original_feedback = (
-                                        f"Command '{command}' executed successfully with exit code 0 and produced table output.\n"
-                                        f"Output:\n\n{out}\n\n"
-                                        "The command succeeded. You can mark this step as completed and proceed to the next step."
-                                    )
-                                else:
-                                    original_feedback = (
-                                        f"Command '{command}' failed with exit code {code} but produced table output.\n"
-                                        f"Output:\n\n{out}\n\n"
-                                        f"The command failed. Analyze the table output to identify any error messages or warnings. Based on the analysis, decide:\n"
-                                        f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
-                                        f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
-                                        f"- SKIP: If this step is non-critical and you can proceed without it\n"
-                                        f"- FAIL: If this is a critical error that blocks progress\n"
-                                        f"What is your decision?"
-                                    )
-                        elif output_type == "kv":
-                            original_len = len(out)
-                            summarize_kv_out = summarize_kv(out)
-                            summarized_len = len(summarize_kv_out)
-                            # Track summarize stats
-                            self.summarize_stats["kv"]["original"] += original_len
-                            self.summarize_stats["kv"]["summarized"] += summarized_len
-                            self.summarize_stats["kv"]["count"] += 1
-                            self.summarize_stats["total_original"] += original_len
-                            self.summarize_stats["total_summarized"] += summarized_len
-                            self.summarize_stats["total_saved"] += (original_len - summarized_len)
-                            self.summarize_stats["total_count"] += 1
-                            self.logger.debug(f"KV Command output from {original_len} chars to {summarized_len} chars for feedback (saved {original_len - summarized_len})")
-                            if code == 0:
-                                original_feedback = (
-                                    f"Command '{command}' executed successfully with exit code 0 and produced key-value output.\n"
-                                    f"Output:\n\n{summarize_kv_out}\n\n"
-                                    "The command succeeded. You can mark this step as completed and proceed to the next step."
-                                )
-                            else:
-                                original_feedback = (
-                                    f"Command '{command}' failed with exit code {code} but produced key-value output.\n"
-                                    f"Output:\n\n{summarize_kv_out}\n\n"
-                                    f"The command failed. Analyze the key-value output to identify any error messages or warnings. Based on the analysis, decide:\n"
-                                    f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
-                                    f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
-                                    f"- SKIP: If this step is non-critical and you can proceed without it\n"
-                                    f"- FAIL: If this is a critical error that blocks progress\n"
-                                    f"What is your decision?"
-                                )
-                        elif output_type == "single_line":
-                            if code == 0:
-                                original_feedback = (
-                                    f"Command '{command}' executed successfully with exit code 0 and produced single-line output.\n"
-                                    f"Output: {out}\n\n"
-                                    "The command succeeded. You can mark this step as completed and proceed to the next step."
-                                )
-                            else:
-                                original_feedback = (
-                                    f"Command '{command}' failed with exit code {code} but produced single-line output.\n"
-                                    f"Output: {out}\n\n"
-                                    f"The command failed. Analyze the output to identify any error messages or warnings. Based on the analysis, decide:\n"
-                                    f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
-                                    f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
-                                    f"- SKIP: If this step is non-critical and you can proceed without it\n"
-                                    f"- FAIL: If this is a critical error that blocks progress\n"
-                                    f"What is your decision?"
-                                )
-                        elif output_type == "text" or output_type == "unknown":
-                            # truncate if too long
-                            if code == 0:
-                                original_feedback = (
-                                    f"Command '{command}' executed successfully with exit code 0 and produced text output.\n"
-                                    f"Output:\n\n{out}\n\n"
-                                    "The command succeeded. You can mark this step as completed and proceed to the next step."
-                                )
-                            else:
-                                original_feedback = (
-                                    f"Command '{command}' failed with exit code {code} and produced text output.\n"
-                                    f"Output:\n\n{out}\n\n"
-                                    f"The command failed. Analyze the output to identify any error messages or warnings. Based on the analysis, decide:\n"
-                                    f"- RETRY: If it's a transient error (timeout, network, temporary), retry with same or modified command\n"
-                                    f"- FIX: If the command was wrong (bad syntax, missing args), fix and retry with corrected command\n"
-                                    f"- SKIP: If this step is non-critical and you can proceed without it\n"
-                                    f"- FAIL: If this is a critical error that blocks progress\n"
-                                    f"What is your decision?"
-                                )
-                                
-                        user_feedback_content = compress_prompt(original_feedback)
-                        self._log_prompt_filter_savings(original_feedback, user_feedback_content)
-
-                        if not agent_should_stop_this_turn:
-                            if len(actions_to_process) > 1 and action_item_idx < len(actions_to_process) - 1:
-                                user_feedback_content += "\nI will now proceed to the next action you provided."
-                        
-                        # Update plan progress first
-                        action_desc = f"Executed: {command} (exit code: {code})"
-                        self._update_plan_progress(action_desc, success=(code == 0))
-                        
-                        # Add plan status to feedback
-                        plan_status = self._get_plan_status_for_ai()
-                        user_feedback_content += f"\n\n{plan_status}"
-                        
-                        self.context_manager.add_user_message(user_feedback_content)
-
-                    elif tool == "analysis_data":
-                        explain = action_item.get("explain", "")
-                        is_valid, analysis_args, validation_error = self._validate_analysis_data_arguments(action_item)
-                        if not is_valid:
-                            self.logger.warning(
-                                "analysis_data validation failed: %s; action=%s; request_id=%s",
-                                validation_error,
-                                action_item,
-                                request_id,
-                            )
-                            terminal.print_console(
-                                f"[WARN] Invalid analysis_data action: {validation_error}. Skipping."
-                            )
-                            self.context_manager.add_user_message(
-                                f"You provided an invalid 'analysis_data' action: {validation_error}. "
-                                f"Action: {action_item}. I am skipping it."
-                            )
-                            self._update_plan_progress("analysis_data validation failed", success=False)
-                            continue
-
-                        analysis_type = analysis_args["type"]
-                        output_format = analysis_args["output_format"]
-                        self.logger.info(
-                            "analysis_data requested: type=%s format=%s request_id=%s",
-                            analysis_type,
-                            output_format,
-                            request_id,
-                        )
-                        requested_max_tokens = analysis_args["constraints"]["max_tokens"]
-                        max_tokens = requested_max_tokens
-                        # Some reasoning models may spend small budgets on hidden reasoning only.
-                        # Keep practical lower bounds so structured outputs are actually returned.
-                        if output_format == "json":
-                            json_min_tokens = 3000 if analysis_type == "calculate" else 1200
-                            if max_tokens < json_min_tokens:
-                                max_tokens = json_min_tokens
-                        elif output_format == "number" and max_tokens < 512:
-                            max_tokens = 512
-
-                        if not terminal.auto_accept:
-                            if self.terminal.auto_explain_command and explain:
-                                confirm_prompt_text = (
-                                    f"\nVaultAI> Agent suggests to run analysis_data "
-                                    f"(type='{analysis_type}', format='{output_format}') "
-                                    f"which is intended to: {explain}. Execute? [y/N]: "
-                                )
-                            else:
-                                confirm_prompt_text = (
-                                    f"\nVaultAI> Agent suggests to run analysis_data "
-                                    f"(type='{analysis_type}', format='{output_format}'). "
-                                    f"Execute? [y/N]: "
-                                )
-                            confirm = self._get_user_input(
-                                f"{confirm_prompt_text}", multiline=False
-                            ).lower().strip()
-                            if confirm != 'y':
-                                justification = self._get_user_input(
-                                    f"\nVaultAI> Provide justification for refusing analysis_data and press Ctrl+S to submit.\n{self.input_text}>  ",
-                                    multiline=True,
-                                ).strip()
-                                self.logger.info(
-                                    "analysis_data refused by user: type=%s format=%s justification=%s request_id=%s",
-                                    analysis_type,
-                                    output_format,
-                                    justification,
-                                    request_id,
-                                )
-                                terminal.print_console(
-                                    f"\nVaultAI> analysis_data refused by user. Justification: {justification}\n"
-                                )
-                                self.context_manager.add_user_message(
-                                    "User refused to execute analysis_data "
-                                    f"(type='{analysis_type}', format='{output_format}') "
-                                    f"with justification: {justification}. "
-                                    "Based on this, what should be the next step?"
-                                )
-                                continue
-
-                        terminal.print_console(
-                            f"\nVaultAI> Executing analysis_data: type={analysis_type}, "
-                            f"format={output_format}"
-                        )
-                        analysis_timing_id = self._start_timing(
-                            f"ANALYSIS_DATA_{analysis_type.upper()}"
-                        )
-
-                        request_format = "json" if output_format == "json" else "text"
-                        prompt_args = dict(analysis_args)
-                        prompt_constraints = dict(analysis_args.get("constraints", {}))
-                        prompt_constraints["max_tokens"] = max_tokens
-                        prompt_args["constraints"] = prompt_constraints
-                        analysis_system_prompt, analysis_user_prompt = self._build_analysis_data_prompts(
-                            prompt_args
-                        )
-                        analysis_result = self.ai_handler.send_request(
-                            system_prompt=analysis_system_prompt,
-                            user_prompt=analysis_user_prompt,
-                            request_format=request_format,
-                            operation=f"analysis_data_tool_{analysis_type}",
-                            max_tokens=max_tokens,
-                        )
-                        self.logger.debug(
-                            "analysis_data primary call done: type=%s format=%s has_result=%s request_id=%s",
-                            analysis_type,
-                            output_format,
-                            analysis_result is not None,
-                            request_id,
-                        )
-                        used_lightweight_fallback = False
-                        used_local_calculate_fallback = False
-
-                        self._end_timing(
-                            analysis_timing_id,
-                            f"ANALYSIS_DATA_{analysis_type.upper()}",
-                            analysis_result is not None,
-                        )
-
-                        if analysis_result is None:
-                            # Some models can consume the whole budget on hidden reasoning for large
-                            # calculate tasks and return empty output. Retry with a lighter text-only
-                            # variant to keep the workflow moving.
-                            if analysis_type == "calculate":
-                                self.logger.warning(
-                                    "analysis_data empty response on calculate, starting fallback flow; request_id=%s",
-                                    request_id,
-                                )
-                                terminal.print_console(
-                                    "[WARN] analysis_data returned no response for calculate; "
-                                    "trying lightweight text fallback."
-                                )
-                                lightweight_system = ""
-                                lightweight_user = (
-                                    "ROLE: precise data analysis assistant.\n"
-                                    "Return final answer directly without preamble.\n\n"
-                                    f"ANALYSIS_TYPE: {analysis_type}\n"
-                                    "OUTPUT_FORMAT: text\n"
-                                    f"PRECISION: {analysis_args['constraints'].get('precision', 'medium')}\n"
-                                    "MAX_TOKENS_BUDGET: 900\n"
-                                    f"INSTRUCTIONS: {analysis_args.get('instructions') or 'None'}\n"
-                                    f"CONTEXT: {analysis_args.get('context') or 'None'}\n"
-                                    f"INPUT:\n{analysis_args.get('input', '')}\n\n"
-                                    "OUTPUT RULE: Return concise final answer only. "
-                                    "No reasoning trace."
-                                )
-                                fallback_result = self.ai_handler.send_request(
-                                    system_prompt=lightweight_system,
-                                    user_prompt=lightweight_user,
-                                    request_format="text",
-                                    operation=f"analysis_data_tool_{analysis_type}_fallback_text",
-                                    max_tokens=900,
-                                )
-                                if fallback_result is not None:
-                                    analysis_result = fallback_result
-                                    used_lightweight_fallback = True
-                                    self.logger.info(
-                                        "analysis_data lightweight fallback succeeded: type=%s request_id=%s",
-                                        analysis_type,
-                                        request_id,
-                                    )
-                                else:
-                                    local_fallback = self._local_calculate_analysis_data(analysis_args)
-                                    if local_fallback is not None:
-                                        analysis_result = json.dumps(local_fallback, ensure_ascii=False)
-                                        used_local_calculate_fallback = True
-                                        self.logger.info(
-                                            "analysis_data local calculate fallback succeeded: type=%s request_id=%s",
-                                            analysis_type,
-                                            request_id,
-                                        )
-                            else:
-                                self.logger.warning(
-                                    "analysis_data empty response, starting lightweight fallback: type=%s request_id=%s",
-                                    analysis_type,
-                                    request_id,
-                                )
-                                terminal.print_console(
-                                    "[WARN] analysis_data returned no response; "
-                                    "trying lightweight text fallback."
-                                )
-                                lightweight_system = ""
-                                lightweight_user = (
-                                    "ROLE: precise data analysis assistant.\n"
-                                    "Return concise final answer only.\n\n"
-                                    f"ANALYSIS_TYPE: {analysis_type}\n"
-                                    "OUTPUT_FORMAT: text\n"
-                                    f"PRECISION: {analysis_args['constraints'].get('precision', 'medium')}\n"
-                                    "MAX_TOKENS_BUDGET: 700\n"
-                                    f"INSTRUCTIONS: {analysis_args.get('instructions') or 'None'}\n"
-                                    f"CONTEXT: {analysis_args.get('context') or 'None'}\n"
-                                    f"INPUT:\n{analysis_args.get('input', '')}\n\n"
-                                    "OUTPUT RULE: Return concise final answer only. "
-                                    "No reasoning trace."
-                                )
-                                fallback_result = self.ai_handler.send_request(
-                                    system_prompt=lightweight_system,
-                                    user_prompt=lightweight_user,
-                                    request_format="text",
-                                    operation=f"analysis_data_tool_{analysis_type}_fallback_text",
-                                    max_tokens=700,
-                                )
-                                if fallback_result is not None:
-                                    analysis_result = fallback_result
-                                    used_lightweight_fallback = True
-                                    self.logger.info(
-                                        "analysis_data lightweight fallback succeeded: type=%s request_id=%s",
-                                        analysis_type,
-                                        request_id,
-                                    )
-
-                        if analysis_result is None:
-                            self.logger.error(
-                                "analysis_data failed: no AI response after fallbacks; type=%s format=%s request_id=%s",
-                                analysis_type,
-                                output_format,
-                                request_id,
-                            )
-                            terminal.print_console(
-                                "[ERROR] analysis_data failed: no response from AI."
-                            )
-                            self._update_plan_progress(
-                                f"analysis_data failed: {analysis_type}", success=False
-                            )
-                            self.context_manager.add_user_message(
-                                f"analysis_data failed for type '{analysis_type}': no AI response."
-                            )
-                            continue
-
-                        raw_result = analysis_result if isinstance(analysis_result, str) else str(analysis_result)
-                        self.logger.debug(
-                            "analysis_data raw response stats: type=%s format=%s len=%d",
-                            analysis_type,
-                            output_format,
-                            len(raw_result),
-                        )
-                        result_for_context = raw_result
-                        result_for_display = raw_result
-                        number_fallback_note = ""
-                        strict_json_retry_used = False
-                        strict_json_fallback_used = False
-                        lightweight_json_wrap_used = False
-
-                        if output_format == "json":
-                            if used_lightweight_fallback:
-                                fallback_obj = {
-                                    "fallback": "analysis_data_calculate_lightweight_text",
-                                    "analysis_type": analysis_type,
-                                    "result_text": raw_result[:4000],
-                                }
-                                result_for_display = json.dumps(
-                                    fallback_obj, ensure_ascii=False, indent=2
-                                )
-                                result_for_context = json.dumps(
-                                    fallback_obj, ensure_ascii=False
-                                )
-                                lightweight_json_wrap_used = True
-                            try:
-                                if not used_lightweight_fallback:
-                                    parsed_json = json.loads(raw_result)
-                                    result_for_display = json.dumps(
-                                        parsed_json, ensure_ascii=False, indent=2
-                                    )
-                                    result_for_context = json.dumps(
-                                        parsed_json, ensure_ascii=False
-                                    )
-                            except Exception:
-                                self.logger.warning(
-                                    "analysis_data returned non-JSON output, retrying with strict JSON constraints. "
-                                    "type=%s len=%d request_id=%s",
-                                    analysis_type,
-                                    len(raw_result),
-                                    request_id,
-                                )
-                                strict_retry_prompt = (
-                                    f"{analysis_user_prompt}\n\n"
-                                    "CRITICAL OUTPUT CONSTRAINT:\n"
-                                    "Return ONLY valid JSON (object or array). Do NOT include any text, markdown, "
-                                    "code fences, explanations, or reasoning."
-                                )
-                                strict_retry_max_tokens = max(max_tokens, 1200)
-                                strict_retry_result = self.ai_handler.send_request(
-                                    system_prompt=analysis_system_prompt,
-                                    user_prompt=strict_retry_prompt,
-                                    request_format="text",
-                                    operation=f"analysis_data_tool_{analysis_type}_strict_json_retry",
-                                    max_tokens=strict_retry_max_tokens,
-                                )
-                                strict_json_retry_used = True
-
-                                if strict_retry_result is not None:
-                                    strict_raw = (
-                                        strict_retry_result
-                                        if isinstance(strict_retry_result, str)
-                                        else str(strict_retry_result)
-                                    )
-                                    try:
-                                        parsed_json = json.loads(strict_raw)
-                                        result_for_display = json.dumps(
-                                            parsed_json, ensure_ascii=False, indent=2
-                                        )
-                                        result_for_context = json.dumps(
-                                            parsed_json, ensure_ascii=False
-                                        )
-                                    except Exception:
-                                        strict_json_fallback_used = True
-                                        fallback_obj = {
-                                            "error": "analysis_data_invalid_json_response",
-                                            "analysis_type": analysis_type,
-                                            "output_format": output_format,
-                                            "raw_response": strict_raw[:1200],
-                                        }
-                                        result_for_display = json.dumps(
-                                            fallback_obj, ensure_ascii=False, indent=2
-                                        )
-                                        result_for_context = json.dumps(
-                                            fallback_obj, ensure_ascii=False
-                                        )
-                                else:
-                                    strict_json_fallback_used = True
-                                    fallback_obj = {
-                                        "error": "analysis_data_invalid_json_response",
-                                        "analysis_type": analysis_type,
-                                        "output_format": output_format,
-                                        "raw_response": raw_result[:1200],
-                                    }
-                                    result_for_display = json.dumps(
-                                        fallback_obj, ensure_ascii=False, indent=2
-                                    )
-                                    result_for_context = json.dumps(
-                                        fallback_obj, ensure_ascii=False
-                                    )
-                        elif output_format == "number":
-                            extracted_number = self._extract_first_number(raw_result)
-                            if extracted_number is None:
-                                number_fallback_note = (
-                                    "Expected numeric output but received non-numeric text. "
-                                    "Using raw response as fallback."
-                                )
-                            else:
-                                result_for_display = extracted_number
-                                result_for_context = extracted_number
-
-                        terminal.print_console(
-                            f"\n[OK] analysis_data completed (type={analysis_type}, format={output_format})."
-                        )
-                        terminal.print_console(f"\n{result_for_display}")
-                        if number_fallback_note:
-                            terminal.print_console(f"[WARN] {number_fallback_note}")
-                        if strict_json_fallback_used:
-                            terminal.print_console(
-                                "[WARN] analysis_data did not return valid JSON after strict retry. "
-                                "Stored fallback JSON object."
-                            )
-                        if lightweight_json_wrap_used:
-                            terminal.print_console(
-                                "[WARN] Wrapped lightweight text fallback into JSON object."
-                            )
-                        if used_lightweight_fallback:
-                            terminal.print_console(
-                                "[WARN] Used lightweight calculate fallback due to empty primary response."
-                            )
-                        if used_local_calculate_fallback:
-                            terminal.print_console(
-                                "[WARN] Used local calculate fallback due to repeated empty AI responses."
-                            )
-
-                        feedback_lines = [
-                            f"analysis_data completed successfully.",
-                            f"Type: {analysis_type}",
-                            f"Output format: {output_format}",
-                        ]
-                        if max_tokens != requested_max_tokens:
-                            feedback_lines.append(
-                                f"Adjusted max_tokens from {requested_max_tokens} to {max_tokens} to ensure usable output."
-                            )
-                        if number_fallback_note:
-                            feedback_lines.append(number_fallback_note)
-                        if strict_json_retry_used:
-                            feedback_lines.append(
-                                "A strict JSON retry was performed because the initial response was not valid JSON."
-                            )
-                        if strict_json_fallback_used:
-                            feedback_lines.append(
-                                "Strict JSON retry still produced invalid output; fallback JSON object was generated."
-                            )
-                        if lightweight_json_wrap_used:
-                            feedback_lines.append(
-                                "Lightweight text fallback output was wrapped into JSON for compatibility."
-                            )
-                        if used_lightweight_fallback:
-                            feedback_lines.append(
-                                "Primary calculate call returned empty output; lightweight text fallback was used."
-                            )
-                        if used_local_calculate_fallback:
-                            feedback_lines.append(
-                                "Both AI calculate attempts returned empty output; local calculate fallback was used."
-                            )
-                        feedback_lines.append(f"Result:\n{result_for_context}")
-                        analysis_feedback = "\n".join(feedback_lines)
-
-                        analysis_feedback_compact = compress_prompt(analysis_feedback)
-                        self._log_prompt_filter_savings(
-                            analysis_feedback, analysis_feedback_compact
-                        )
-                        self.context_manager.add_user_message(analysis_feedback_compact)
-                        self._update_plan_progress(
-                            f"analysis_data: {analysis_type} ({output_format})",
-                            success=True,
-                        )
-                        self.logger.info(
-                            "analysis_data completed: type=%s format=%s request_id=%s",
-                            analysis_type,
-                            output_format,
-                            request_id,
-                        )
-                        continue
-
-                    elif tool == "ask_user":
-                        # Block ask_user in autonomous mode
-                        if terminal.auto_accept:
-                            terminal.print_console("[WARN] Agent tried to use 'ask_user' in autonomous mode. Request rejected.")
-                            self.context_manager.add_user_message(
-                                "You tried to use the 'ask_user' tool, but you are running in AUTONOMOUS MODE. "
-                                "In autonomous mode, you must NOT ask the user questions. "
-                                "Instead, make decisions yourself based on available information and proceed with the best course of action. "
-                                "Use your best judgment and continue with the task."
-                            )
-                            continue
-                        
-                        # Normal ask_user handling in interactive mode
-                        question = action_item.get("question")
-                        if not question:
-                            terminal.print_console(f"No question provided in ask_user action: {action_item}. Skipping.")
-                            self.context_manager.add_user_message(f"You provided an 'ask_user' action but no question: {action_item}. I am skipping it.")
-                            continue
-                        
-                        terminal.print_console(f"Agent asks: {question}")
-                        user_answer = self._get_user_input("Your answer: ", multiline=True)
-                        self.context_manager.add_user_message(f"User answer to '{question}': {user_answer}")
-
-                        if not agent_should_stop_this_turn:
-                            if len(actions_to_process) > 1 and action_item_idx < len(actions_to_process) - 1:
-                                self.context_manager.add_user_message("I will now proceed to the next action you provided.")
-                    
-                    elif tool == "read_file":
-                        file_path = action_item.get("path")
-                        start_line = action_item.get("start_line")
-                        end_line = action_item.get("end_line")
-                        explain = action_item.get("explain", "")
-                        
-                        if not file_path:
-                            terminal.print_console(f"Missing 'path' in read_file action: {action_item}. Skipping.")
-                            self.context_manager.add_user_message(f"You provided a 'read_file' tool action but no 'path': {action_item}. I am skipping it.")
-                            continue
-                        
-                        if not terminal.auto_accept:
-                            line_info = ""
-                            if start_line or end_line:
-                                line_info = f" (lines {start_line or 'start'} to {end_line or 'end'})"
-                            confirm_prompt_text = f"\nVaultAI> Agent suggests to read file: '{file_path}'{line_info}. This is intended to: {explain}. Proceed? [y/N]: "
-                            confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                            if confirm != 'y':
-                                justification = self._get_user_input(f"\nVaultAI> Provide justification for refusing to read the file and press Ctrl+S to submit.\n{self.input_text}>  ", multiline=True).strip()
-                                terminal.print_console(f"\nVaultAI> File read refused by user. Justification: {justification}\n")
-                                self.context_manager.add_user_message(f"User refused to read file '{file_path}' with justification: {justification}. Based on this, what should be the next step?")
-                                continue
-                        
-                        # Start timing file read operation
-                        read_timing_id = self._start_timing(f"FILE_READ_{file_path}")
-                        
-                        result = self.file_operator.read_file(file_path, start_line or None, end_line or None, explain)
-                        if result.get("success"):
-                            # End timing file read operation
-                            self._end_timing(read_timing_id, f"FILE_READ_{file_path}", True)
-                            content = result.get("content", "")
-                            total_lines = result.get("total_lines", "unknown")
-                            lines_read = result.get("lines_count", 0)
-                            
-                            # Truncate very long content for context
-                            max_content_len = 10000
-                            if len(content) > max_content_len:
-                                content_display = content[:max_content_len] + f"\n... (truncated, {len(content)} total characters)"
-                            else:
-                                content_display = content
-                            
-                            terminal.print_console(f"\n[OK] File '{file_path}' read successfully ({lines_read} lines).")
-                            
-                            feedback = f"File '{file_path}' read successfully.\n"
-                            feedback += f"Total lines: {total_lines}, Lines read: {lines_read}\n\n"
-                            feedback += f"Content:\n```\n{content_display}\n```"
-                            
-                            self._update_plan_progress(f"Read file: {file_path}", success=True)
-                            self.context_manager.add_user_message(feedback)
-                        else:
-                            error = result.get("error", "Unknown error")
-                            terminal.print_console(f"\n[ERROR] Failed to read file '{file_path}': {error}")
-                            self._update_plan_progress(f"Failed to read file: {file_path}", success=False)
-                            self.context_manager.add_user_message(f"Failed to read file '{file_path}': {error}")
-                        continue
-
-                    elif tool == "write_file":
-                        file_path = action_item.get("path")
-                        explain = action_item.get("explain", "")
-                        file_content = action_item.get("content")
-                        if not file_path or file_content is None:
-                            terminal.print_console(f"Missing 'path' or 'content' in write_file action: {action_item}. Skipping.")
-                            self.context_manager.add_user_message(f"You provided a 'write_file' tool action but no 'path' or 'content': {action_item}. I am skipping it.")
-                            continue
-
-                        if not terminal.auto_accept:
-                            confirm_prompt_text = f"\nVaultAI> Agent suggests to write file: '{file_path}' which is intended to: {explain}. Proceed? [y/N]: "
-                            confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                            if confirm != 'y':
-                                justification = self._get_user_input(f"\nVaultAI> Provide justification for refusing to write the file and press Ctrl+S to submit.\n{self.input_text}>  ", multiline=True).strip()
-                                terminal.print_console(f"\nVaultAI> File write refused by user. Justification: {justification}\n")
-                                self.context_manager.add_user_message(f"User refused to write file '{file_path}' with justification: {justification}. Based on this, what should be the next step?")
-                                continue
-
-                        success = self.file_operator.write_file(file_path, file_content, explain)
-                        if success:
-                            self.context_manager.add_user_message(f"File '{file_path}' written successfully.")
-                            # Update plan progress
-                            self._update_plan_progress(f"Created file: {file_path}", success=True)
-                        else:
-                            self.context_manager.add_user_message(f"Failed to write file '{file_path}'.")
-                            self._update_plan_progress(f"Failed to create file: {file_path}", success=False)
-                        continue
-
-                    elif tool == "list_directory":
-                        dir_path = action_item.get("path") or action_item.get("command_or_path")
-                        recursive = action_item.get("recursive", False)
-                        pattern = action_item.get("pattern")
-                        explain = action_item.get("explain", "")
-                        
-                        if not dir_path:
-                            terminal.print_console(f"Missing 'path' in list_directory action: {action_item}. Skipping.")
-                            self.context_manager.add_user_message(f"You provided a 'list_directory' tool action but no 'path': {action_item}. I am skipping it.")
-                            continue
-                        
-                        if not terminal.auto_accept:
-                            pattern_info = f" (pattern: {pattern})" if pattern else ""
-                            recursive_info = " recursively" if recursive else ""
-                            confirm_prompt_text = f"\nVaultAI> Agent suggests to list directory: '{dir_path}'{recursive_info}{pattern_info}. This is intended to: {explain}. Proceed? [y/N]: "
-                            confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                            if confirm != 'y':
-                                justification = self._get_user_input(f"\nVaultAI> Provide justification for refusing and press Ctrl+S to submit.\n{self.input_text}>  ", multiline=True).strip()
-                                terminal.print_console(f"\nVaultAI> Directory listing refused by user. Justification: {justification}\n")
-                                self.context_manager.add_user_message(f"User refused to list directory '{dir_path}' with justification: {justification}. Based on this, what should be the next step?")
-                                continue
-                        
-                        result = self.file_operator.list_directory(dir_path, recursive, pattern or None, explain)
-                        if result.get("success"):
-                            entries = result.get("entries", [])
-                            total_count = result.get("total_count", 0)
-                            
-                            terminal.print_console(f"\n[OK] Directory '{dir_path}' listed ({total_count} entries).")
-                            
-                            # Format for display
-                            feedback = f"Directory '{dir_path}' contents ({total_count} entries):\n\n"
-                            
-                            # Limit entries in context to avoid token overflow
-                            max_entries = 100
-                            display_entries = entries[:max_entries]
-                            
-                            for entry in display_entries:
-                                entry_type = "📁" if entry["type"] == "directory" else "📄"
-                                size_info = f" ({entry.get('size', 0)} bytes)" if entry["type"] == "file" else ""
-                                feedback += f"{entry_type} {entry['name']}{size_info}\n"
-                            
-                            if len(entries) > max_entries:
-                                feedback += f"\n... and {len(entries) - max_entries} more entries"
-                            
-                            self._update_plan_progress(f"Listed directory: {dir_path}", success=True)
-                            self.context_manager.add_user_message(feedback)
-                        else:
-                            error = result.get("error", "Unknown error")
-                            terminal.print_console(f"\n[ERROR] Failed to list directory '{dir_path}': {error}")
-                            self._update_plan_progress(f"Failed to list directory: {dir_path}", success=False)
-                            self.context_manager.add_user_message(f"Failed to list directory '{dir_path}': {error}")
-                        continue
-
-                    elif tool == "copy_file":
-                        source = action_item.get("source")
-                        destination = action_item.get("destination")
-                        overwrite = action_item.get("overwrite", False)
-                        explain = action_item.get("explain", "")
-                        
-                        if not source or not destination:
-                            terminal.print_console(f"Missing 'source' or 'destination' in copy_file action: {action_item}. Skipping.")
-                            self.context_manager.add_user_message(f"You provided a 'copy_file' tool action but missing 'source' or 'destination': {action_item}. I am skipping it.")
-                            continue
-                        
-                        if not terminal.auto_accept:
-                            overwrite_info = " (overwrite)" if overwrite else ""
-                            confirm_prompt_text = f"\nVaultAI> Agent suggests to copy '{source}' to '{destination}'{overwrite_info}. This is intended to: {explain}. Proceed? [y/N]: "
-                            confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                            if confirm != 'y':
-                                justification = self._get_user_input(f"\nVaultAI> Provide justification for refusing and press Ctrl+S to submit.\n{self.input_text}>  ", multiline=True).strip()
-                                terminal.print_console(f"\nVaultAI> Copy operation refused by user. Justification: {justification}\n")
-                                self.context_manager.add_user_message(f"User refused to copy '{source}' to '{destination}' with justification: {justification}. Based on this, what should be the next step?")
-                                continue
-                        
-                        result = self.file_operator.copy_file(source, destination, overwrite, explain)
-                        if result.get("success"):
-                            terminal.print_console(f"\n[OK] Copied '{source}' to '{destination}'.")
-                            self._update_plan_progress(f"Copied: {source} -> {destination}", success=True)
-                            self.context_manager.add_user_message(f"Successfully copied '{source}' to '{destination}'.")
-                        else:
-                            error = result.get("error", "Unknown error")
-                            terminal.print_console(f"\n[ERROR] Failed to copy: {error}")
-                            self._update_plan_progress(f"Failed to copy: {source} -> {destination}", success=False)
-                            self.context_manager.add_user_message(f"Failed to copy '{source}' to '{destination}': {error}")
-                        continue
-
-                    elif tool == "delete_file":
-                        file_path = action_item.get("path")
-                        backup = action_item.get("backup", False)
-                        explain = action_item.get("explain", "")
-                        
-                        if not file_path:
-                            terminal.print_console(f"Missing 'path' in delete_file action: {action_item}. Skipping.")
-                            self.context_manager.add_user_message(f"You provided a 'delete_file' tool action but no 'path': {action_item}. I am skipping it.")
-                            continue
-                        
-                        if not terminal.auto_accept:
-                            backup_info = " (with backup)" if backup else ""
-                            confirm_prompt_text = f"\nVaultAI> Agent suggests to delete '{file_path}'{backup_info}. This is intended to: {explain}. Proceed? [y/N]: "
-                            confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                            if confirm != 'y':
-                                justification = self._get_user_input(f"\nVaultAI> Provide justification for refusing and press Ctrl+S to submit.\n{self.input_text}>  ", multiline=True).strip()
-                                terminal.print_console(f"\nVaultAI> Delete operation refused by user. Justification: {justification}\n")
-                                self.context_manager.add_user_message(f"User refused to delete '{file_path}' with justification: {justification}. Based on this, what should be the next step?")
-                                continue
-                        
-                        result = self.file_operator.delete_file(file_path, backup, explain)
-                        if result.get("success"):
-                            backup_path = result.get("backup_path")
-                            terminal.print_console(f"\n[OK] Deleted '{file_path}'.")
-                            if backup_path:
-                                terminal.print_console(f"Backup created: {backup_path}")
-                                self._update_plan_progress(f"Deleted: {file_path} (backup: {backup_path})", success=True)
-                                self.context_manager.add_user_message(f"Successfully deleted '{file_path}'. Backup created at: {backup_path}")
-                            else:
-                                self._update_plan_progress(f"Deleted: {file_path}", success=True)
-                                self.context_manager.add_user_message(f"Successfully deleted '{file_path}'.")
-                        else:
-                            error = result.get("error", "Unknown error")
-                            terminal.print_console(f"\n[ERROR] Failed to delete: {error}")
-                            self._update_plan_progress(f"Failed to delete: {file_path}", success=False)
-                            self.context_manager.add_user_message(f"Failed to delete '{file_path}': {error}")
-                        continue
-
-                    elif tool == "edit_file":
-                        file_path = action_item.get("path")
-                        action = action_item.get("action")
-                        search = action_item.get("search")
-                        replace = action_item.get("replace")
-                        line = action_item.get("line")
-                        explain = action_item.get("explain", "")
-
-                        if not file_path or not action:
-                            terminal.print_console(f"Missing 'path' or 'action' in edit_file action: {action_item}. Skipping.")
-                            self.context_manager.add_user_message(f"Missing 'path' or 'action' in edit_file action: {action_item}. Skipping.")
-                            continue
-
-                        if not terminal.auto_accept:
-                            if action == "replace" and search is not None and replace is not None:
-                                desc = f"replace '{search}' with '{replace}'"
-                            elif action == "insert_after" and search is not None and line is not None:
-                                desc = f"insert '{line}' after '{search}'"
-                            elif action == "insert_before" and search is not None and line is not None:
-                                desc = f"insert '{line}' before '{search}'"
-                            elif action == "delete_line" and search is not None:
-                                desc = f"delete lines containing '{search}'"
-                            else:
-                                desc = f"perform {action} action"
-                            confirm_prompt_text = f"\nVaultAI> Agent suggests to edit file '{file_path}' with action: {desc}. This is intended to: {explain}. Proceed? [y/N]: "
-                            confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                            if confirm != 'y':
-                                justification = self._get_user_input(f"\nVaultAI> Provide justification for refusing to edit the file and press Ctrl+S to submit.\n{self.input_text}>  ", multiline=True).strip()
-                                terminal.print_console(f"\nVaultAI> File edit refused by user. Justification: {justification}\n")
-                                self.context_manager.add_user_message(f"User refused to edit file '{file_path}' with justification: {justification}. Based on this, what should be the next step?")
-                                continue
-
-                        success = self.file_operator.edit_file(file_path, action, search, replace, line, explain)
-                        if success:
-                            self.context_manager.add_user_message(f"File '{file_path}' edited successfully.")
-                            # Update plan progress
-                            self._update_plan_progress(f"Edited file: {file_path} ({action})", success=True)
-                        else:
-                            self.context_manager.add_user_message(f"Failed to edit file '{file_path}'.")
-                            self._update_plan_progress(f"Failed to edit file: {file_path}", success=False)
-                        continue
-
-                    elif tool == "search_in_file":
-                        file_path = action_item.get("path")
-                        query = action_item.get("query")
-                        context_lines = action_item.get("context_lines", 3)
-                        max_results = action_item.get("max_results", 10)
-                        explain = action_item.get("explain", "")
-                        
-                        if not file_path or not query:
-                            terminal.print_console(f"Missing 'path' or 'query' in search_in_file action: {action_item}. Skipping.")
-                            self.context_manager.add_user_message(f"You provided a 'search_in_file' tool action but missing 'path' or 'query': {action_item}. I am skipping it.")
-                            continue
-                        
-                        if not terminal.auto_accept:
-                            confirm_prompt_text = f"\nVaultAI> Agent suggests to search in file '{file_path}' for '{query}'. This is intended to: {explain}. Proceed? [y/N]: "
-                            confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                            if confirm != 'y':
-                                justification = self._get_user_input(f"\nVaultAI> Provide justification for refusing and press Ctrl+S to submit.\n{self.input_text}>  ", multiline=True).strip()
-                                terminal.print_console(f"\nVaultAI> Search operation refused by user. Justification: {justification}\n")
-                                self.context_manager.add_user_message(f"User refused to search in file '{file_path}' with justification: {justification}. Based on this, what should be the next step?")
-                                continue
-                        
-                        # Start timing search operation
-                        search_timing_id = self._start_timing(f"FILE_SEARCH_{file_path}")
-                        
-                        result = self.file_operator.search_in_file(file_path, query, context_lines, max_results, explain)
-                        if result.get("success"):
-                            # End timing search operation
-                            self._end_timing(search_timing_id, f"FILE_SEARCH_{file_path}", True)
-                            matches = result.get("matches", [])
-                            total_matches = result.get("total_matches", 0)
-                            
-                            terminal.print_console(f"\n[OK] Search in '{file_path}' completed ({total_matches} matches found).")
-                            
-                            # Format search results for display
-                            feedback = f"Search results in '{file_path}' for '{query}':\n\n"
-                            feedback += f"Total matches: {total_matches}\n\n"
-                            
-                            if matches:
-                                for i, match in enumerate(matches, 1):
-                                    feedback += f"Match {i} (Line {match['line_number']}):\n"
-                                    feedback += f"  Content: {match['content']}\n"
-                                    if match.get('context_before'):
-                                        feedback += f"  Before: {match['context_before']}\n"
-                                    if match.get('context_after'):
-                                        feedback += f"  After: {match['context_after']}\n"
-                                    feedback += "\n"
-                            
-                            self._update_plan_progress(f"Search in file: {file_path} for '{query}'", success=True)
-                            self.context_manager.add_user_message(feedback)
-                        else:
-                            error = result.get("error", "Unknown error")
-                            terminal.print_console(f"\n[ERROR] Failed to search in file '{file_path}': {error}")
-                            self._update_plan_progress(f"Failed to search in file: {file_path}", success=False)
-                            self.context_manager.add_user_message(f"Failed to search in file '{file_path}': {error}")
-                        continue
-
-                    elif tool == "update_plan_step":
-                        step_number = action_item.get("step_number")
-                        status = action_item.get("status")
-                        result = action_item.get("result", "")
-                        
-                        # Validate parameters
-                        if step_number is None or status is None:
-                            terminal.print_console(f"Missing 'step_number' or 'status' in update_plan_step action: {action_item}. Skipping.")
-                            self.context_manager.add_user_message(f"You provided 'update_plan_step' but missing 'step_number' or 'status': {action_item}. I am skipping it.")
-                            continue
-                        
-                        # Validate status value
-                        valid_statuses = ["completed", "failed", "skipped", "in_progress"]
-                        if status not in valid_statuses:
-                            terminal.print_console(f"Invalid status '{status}' in update_plan_step. Valid: {valid_statuses}. Skipping.")
-                            self.context_manager.add_user_message(f"Invalid status '{status}'. Valid statuses are: {', '.join(valid_statuses)}. I am skipping it.")
-                            continue
-                        
-                        # Convert status string to StepStatus enum (already imported at module level)
-                        status_map = {
-                            "completed": StepStatus.COMPLETED,
-                            "failed": StepStatus.FAILED,
-                            "skipped": StepStatus.SKIPPED,
-                            "in_progress": StepStatus.IN_PROGRESS
-                        }
-                        step_status = status_map[status]
-                        
-                        # Check if plan exists before attempting to update
-                        if not self.plan_manager.steps:
-                            terminal.print_console(f"[WARN] No action plan exists. Cannot update step {step_number}.")
-                            self.context_manager.add_user_message(
-                                f"You tried to update plan step {step_number}, but no action plan exists. "
-                                f"Create a plan first using the 'create_action_plan' tool, or proceed without a plan."
-                            )
-                            continue
-                        
-                        # Update the plan step
-                        success = self.plan_manager.mark_step_status(step_number, step_status, result)
-                        if success:
-                            terminal.print_console(f"[OK] Plan step {step_number} marked as {status}")
-                            self.context_manager.add_user_message(f"Plan step {step_number} successfully marked as {status}. Result: {result}")
-                            # Display updated plan
-                            self.plan_manager.display_compact()
-                        else:
-                            terminal.print_console(f"[WARN] Failed to update plan step {step_number}. Step may not exist in the plan.")
-                            self.context_manager.add_user_message(f"Failed to update plan step {step_number}. Step may not exist in the plan.")
-                        continue
-
-                    elif tool == "web_search_agent":
-                        # Web search agent tool for internet research
-                        query = action_item.get("query")
-                        max_sources = action_item.get("max_sources", 5)
-                        deep_search = action_item.get("deep_search", True)
-                        explain = action_item.get("explain", "")
-                        
-                        if not query:
-                            terminal.print_console(f"No query provided in web_search_agent action: {action_item}. Skipping.")
-                            self.context_manager.add_user_message(f"You provided a 'web_search_agent' tool action but no query: {action_item}. I am skipping it.")
-                            continue
-                        
-                        # Check if WebSearchAgent is available
-                        if not WEB_SEARCH_AGENT_AVAILABLE:
-                            terminal.print_console("[ERROR] WebSearchAgent is not available. Please install required dependencies: pip install duckduckgo-search beautifulsoup4 lxml")
-                            self.context_manager.add_user_message(
-                                "The 'web_search_agent' tool is not available because required dependencies are missing. "
-                                "Install them with: pip install duckduckgo-search beautifulsoup4 lxml. "
-                                "Try an alternative approach to complete this step."
-                            )
-                            continue
-                        
-                        if not terminal.auto_accept:
-                            effective_engine = (
-                                self.web_search_agent.config.get("engine") if self.web_search_agent else "duckduckgo"
-                            )
-                            confirm_prompt_text = f"\nVaultAI> Agent suggests to search web for: '{query}' using {effective_engine}. This is intended to: {explain}. Proceed? [y/N]: "
-                            confirm = self._get_user_input(f"{confirm_prompt_text}", multiline=False).lower().strip()
-                            if confirm != 'y':
-                                justification = self._get_user_input(f"\nVaultAI> Provide justification for refusing the search and press Ctrl+S to submit.\n{self.input_text}>  ", multiline=True).strip()
-                                terminal.print_console(f"\nVaultAI> Web search refused by user. Justification: {justification}\n")
-                                self.context_manager.add_user_message(f"User refused to search for '{query}' with justification: {justification}. Based on this, what should be the next step?")
-                                continue
-                        
-                        terminal.print_console(f"\nVaultAI> Executing web search: {query}")
-                        try:
-                            effective_engine = (
-                                self.web_search_agent.config.get("engine") if self.web_search_agent else "duckduckgo"
-                            )
-                            self.logger.info("Executing web search: query='%s', engine=%s; request_id=%s", query, effective_engine, request_id)
-                        except Exception:
-                            pass
-                        
-                        # Start timing web search operation
-                        search_timing_id = self._start_timing(f"WEB_SEARCH_{query[:50]}")
-                        
-                        try:
-                            # Use singleton WebSearchAgent (initialized in __init__)
-                            search_result = self.web_search_agent.execute(
-                                query=query,
-                                max_sources=max_sources,
-                                deep_search=deep_search
-                            )
-                            
-                            if search_result.get('success'):
-                                # Build feedback message
-                                summary = search_result.get('summary', '')
-                                sources = search_result.get('sources', [])
-                                confidence = search_result.get('confidence', 0)
-                                iterations = search_result.get('iterations_used', 0)
-                                
-                                terminal.print_console(f"\n[OK] Web search completed (confidence: {confidence:.0%}, {len(sources)} sources, {iterations} iterations)")
-                                
-                                # Format results for AI context
-                                result_text = f"Web Search Results for: '{query}'\n\n"
-                                result_text += f"Summary:\n{summary}\n\n"
-                                result_text += f"Confidence: {confidence:.0%}\n"
-                                result_text += f"Sources found: {len(sources)}\n\n"
-                                
-                                if sources:
-                                    result_text += "Sources:\n"
-                                    for i, source in enumerate(sources[:5], 1):
-                                        result_text += f"{i}. {source.get('title', 'Untitled')}\n"
-                                        result_text += f"   URL: {source.get('url', '')}\n"
-                                        result_text += f"   Relevance: {source.get('relevance', 0):.0%}\n"
-                                        content = source.get('content', '')
-                                        if content:
-                                            result_text += f"   Content: {content[:500]}{'...' if len(content) > 500 else ''}\n"
-                                        result_text += "\n"
-                                
-                                # End timing web search operation
-                                self._end_timing(search_timing_id, f"WEB_SEARCH_{query[:50]}", True)
-                                
-                                # Update plan progress
-                                self._update_plan_progress(f"Web search: {query}", success=True)
-                                
-                                self.context_manager.add_user_message(result_text)
-                            else:
-                                # End timing web search operation (failed)
-                                self._end_timing(search_timing_id, f"WEB_SEARCH_{query[:50]}", False)
-                                
-                                error_msg = search_result.get('summary', 'Unknown error')
-                                terminal.print_console(f"\n[ERROR] Web search failed: {error_msg}")
-                                self._update_plan_progress(f"Web search failed: {query}", success=False)
-                                self.context_manager.add_user_message(f"Web search for '{query}' failed: {error_msg}. Try an alternative approach.")
-                                
-                        except Exception as e:
-                            import traceback
-                            error_msg = f"Web search exception: {e}\nStack trace: {traceback.format_exc()}"
-                            # End timing web search operation (exception)
-                            self._end_timing(search_timing_id, f"WEB_SEARCH_{query[:50]}", False)
-                            
-                            terminal.print_console(f"\n[ERROR] Web search exception: {e}")
-                            self.logger.error(error_msg)
-                            self._update_plan_progress(f"Web search error: {query}", success=False)
-                            self.context_manager.add_user_message(f"Web search for '{query}' encountered an error: {str(e)}. Try an alternative approach.")
-                        continue
-
-                    else: 
-                        terminal.print_console(f"AI response contained an invalid 'tool': '{tool}' in action: {action_item}.")
-                        user_feedback_invalid_tool = (
-                            f"Your response included an action with an invalid tool: '{tool}' in {action_item}. "
-                            f"Valid tools are: 'create_action_plan', 'bash', 'read_file', 'write_file', "
-                            f"'edit_file', 'list_directory', 'search_in_file', 'copy_file', 'delete_file', "
-                            f"'analysis_data', 'update_plan_step', 'ask_user', 'web_search_agent', and 'finish'. "
-                        )
-                        if len(actions_to_process) > 1 and action_item_idx < len(actions_to_process) - 1:
-                            user_feedback_invalid_tool += "I am skipping this invalid action and proceeding with the next ones if available."
-                            self.context_manager.add_user_message(user_feedback_invalid_tool)
-                            continue 
-                        else:
-                            user_feedback_invalid_tool += "I am stopping processing of your actions for this turn. Please provide a valid set of actions."
-                            self.context_manager.add_user_message(user_feedback_invalid_tool)
-                            agent_should_stop_this_turn = True 
-                            break 
+                        if result is HandlerResult.STOP:
+                            agent_should_stop_this_turn = True
+                            break
+                finally:
+                    # Drop results of prefetched commands the loop never reached
+                    self._prefetched_commands.clear()
+                self._flush_plan_updates()
                 
                 if agent_should_stop_this_turn:
                     break
@@ -3725,7 +4346,7 @@ class VaultAIAgentRunner:
 
                 # Optional continuation mode
                 terminal.console.print("\nVaultAI> Prompt your next goal and press [cyan]Ctrl+S[/] to start!")
-                user_input = self._get_user_input(f"{self.input_text}> ", multiline=True)
+                user_input = self._get_user_input(self._input_prompt, multiline=True)
                 new_instruction = terminal.process_input(user_input)
                 if not new_instruction or not new_instruction.strip():
                     keep_running = False
@@ -3743,7 +4364,8 @@ class VaultAIAgentRunner:
                 )
                 self.context_manager.add_user_message(f"New instruction: {new_instruction}")
 
-                self.steps = []
+                self.steps.clear()
+                self._step_counter = 0
                 self.command_results = []  # Reset command results for new task
                 self.summary = ""
                 self.critic_rating = 0
@@ -3759,6 +4381,8 @@ class VaultAIAgentRunner:
                 # If the loop broke for any other reason (error, user cancellation), stop.
                 keep_running = False
 
+        self.context_manager.close_transcript()
+
         # Display comprehensive performance summary at the end of each task
         if self.show_performance_summary and (
             self.timings
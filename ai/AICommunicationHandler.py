@@ -1,4 +1,7 @@
+import ast
+import hashlib
 import json
+import logging
 import time
 import re
 import random
@@ -7,6 +10,7 @@ import threading
 import queue
 import signal
 import sys
+from collections import OrderedDict
 from typing import Optional, Tuple
 
 # Import enhanced JSON validator
@@ -16,11 +20,85 @@ try:
 except ImportError:
     JSON_VALIDATOR_AVAILABLE = False
 
+# Patterns used by the fallback JSON extraction, compiled once at import
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*\n?([\s\S]*?)\n?```')
+
+_JSON_DECODER = json.JSONDecoder()
+
+# Maps every single quote to a double quote for the no-double-quotes fast path
+_SINGLE_TO_DOUBLE_QUOTE_TABLE = str.maketrans({"'": '"'})
+
+
+def single_to_double_quotes(text: str) -> str:
+    """Swap single-quoted string delimiters for double quotes, leaving "..." strings alone."""
+    if '"' not in text:
+        # Nothing to protect: one C-level pass instead of the scanner below
+        return text.translate(_SINGLE_TO_DOUBLE_QUOTE_TABLE)
+    out = []
+    quote = None
+    escaped = False
+    for ch in text:
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == quote:
+                quote = None
+                ch = '"'
+            elif ch == '"' and quote == "'":
+                ch = '\\"'
+        elif ch == '"' or ch == "'":
+            quote = ch
+            ch = '"'
+        out.append(ch)
+    return ''.join(out)
+
+
+# Shared sink for handlers created without a logger: nothing is emitted and,
+# with the level above CRITICAL, calls return before building a record
+_NULL_LOGGER = logging.getLogger("AICommunicationHandler.null")
+_NULL_LOGGER.addHandler(logging.NullHandler())
+_NULL_LOGGER.propagate = False
+_NULL_LOGGER.setLevel(logging.CRITICAL + 1)
+
 
 class AICommunicationHandler:
+    # Engine -> (swap terminal.api_key, ((terminal attribute, engine config key), ...)).
+    # The attributes are overridden from the engine config for one call and restored after.
+    _ENGINE_OVERRIDES = {
+        "openai": (True, (
+            ("default_model", "model"), ("default_temperature", "temperature"),
+        )),
+        "ollama": (False, (
+            ("ollama_model", "model"), ("ollama_temperature", "temperature"),
+        )),
+        "llama-cpp": (True, (
+            ("llama_cpp_model", "model"), ("llama_cpp_temperature", "temperature"),
+            ("llama_cpp_max_tokens", "max_tokens"), ("llama_cpp_url", "url"),
+        )),
+        "ollama-cloud": (True, (
+            ("ollama_cloud_model", "model"), ("ollama_cloud_temperature", "temperature"),
+        )),
+        "google": (True, (
+            ("gemini_model", "model"),
+        )),
+        "openrouter": (True, (
+            ("openrouter_model", "model"), ("openrouter_temperature", "temperature"),
+            ("openrouter_max_tokens", "max_tokens"),
+        )),
+        "groq": (True, (
+            ("groq_model", "model"), ("groq_temperature", "temperature"),
+            ("groq_max_tokens", "max_tokens"),
+        )),
+        "codex-cli": (False, (
+            ("codex_model", "model"),
+        )),
+    }
+
     def __init__(self, terminal, logger=None):
         self.terminal = terminal
-        self.logger = logger if logger else self._create_dummy_logger()
+        self.logger = logger if logger else _NULL_LOGGER
         
         # Initialize enhanced JSON validator if available
         self.json_validator = None
@@ -31,11 +109,32 @@ class AICommunicationHandler:
             except Exception as e:
                 self.logger.warning(f"AICommunicationHandler: Failed to initialize JSON validator: {e}")
         
+        # Engine name -> call(system_prompt, user_prompt, max_tokens, timeout, config)
+        self._engines = {
+            "ollama": self._call_ollama,
+            "llama-cpp": lambda s, u, mt, to, cfg: self.terminal.connect_to_llama_cpp(s, u, max_tokens=mt, timeout=to),
+            "ollama-cloud": lambda s, u, mt, to, cfg: self.terminal.connect_to_ollama_cloud(s, u, max_tokens=mt, timeout=to),
+            "google": lambda s, u, mt, to, cfg: self.terminal.connect_to_gemini(f"{s}\n{u}", max_tokens=mt, timeout=to),
+            "openai": lambda s, u, mt, to, cfg: self.terminal.connect_to_chatgpt(s, u, max_tokens=mt, timeout=to),
+            "openrouter": lambda s, u, mt, to, cfg: self.terminal.connect_to_openrouter(s, u, max_tokens=mt, timeout=to),
+            "groq": lambda s, u, mt, to, cfg: self.terminal.connect_to_groq(s, u, max_tokens=mt, timeout=to),
+            "codex-cli": self._call_codex_cli,
+        }
+
         # Multi-engine routing configuration
         self.ai_engines = getattr(terminal, 'ai_engines', [terminal.ai_engine])
         self.ai_engine_route = getattr(terminal, 'ai_engine_route', 'round-robin')
         self._round_robin_index = 0
         self._round_robin_lock = threading.Lock()
+        # Held for each request attempt: _call_single_engine swaps the API key and
+        # engine settings on the shared terminal, and _request_format_hint and the
+        # token usage records are instance state, so concurrent callers (e.g. the
+        # web search prefetch workers) must not interleave
+        self._request_lock = threading.Lock()
+
+        # Digest of (prompts, format, engines, max_tokens) -> processed reply, LRU order
+        self._response_cache = OrderedDict()
+        self._response_cache_lock = threading.Lock()
         
         # Log routing configuration
         if len(self.ai_engines) > 1:
@@ -55,6 +154,7 @@ class AICommunicationHandler:
             self.ai_api_max_retries = int(os.getenv("AI_API_MAX_RETRIES", "3"))
             self.ai_api_retry_delay = float(os.getenv("AI_API_RETRY_DELAY", "2"))
             self.ai_api_retry_backoff = float(os.getenv("AI_API_RETRY_BACKOFF", "2"))
+            self.ai_api_retry_max_delay = float(os.getenv("AI_API_RETRY_MAX_DELAY", "300"))
             
             # Load timeout buffer for main thread (should be 5-10 seconds more than worker thread timeout)
             self.ai_main_thread_timeout_buffer = int(os.getenv("AI_MAIN_THREAD_TIMEOUT_BUFFER", "5"))
@@ -71,6 +171,9 @@ class AICommunicationHandler:
             
             # Load fallback cycle configuration (how many times to cycle through all engines before giving up)
             self._max_fallback_cycles = int(os.getenv("AI_FALLBACK_MAX_CYCLES", "3"))
+
+            # Replies kept for verbatim-repeated prompts (0 disables the cache)
+            self.ai_response_cache_size = int(os.getenv("AI_RESPONSE_CACHE_SIZE", "64"))
             
             self.logger.debug(f"AI API timeout config loaded: timeout={self.ai_api_timeout}s, "
                              f"max_retries={self.ai_api_max_retries}, retry_delay={self.ai_api_retry_delay}s, "
@@ -83,9 +186,11 @@ class AICommunicationHandler:
             self.ai_api_max_retries = 3
             self.ai_api_retry_delay = 2
             self.ai_api_retry_backoff = 2
+            self.ai_api_retry_max_delay = 300
             self.ai_main_thread_timeout_buffer = 5
             self.use_timeout_api = True
             self._max_fallback_cycles = 3
+            self.ai_response_cache_size = 64
 
     def _get_next_engine(self) -> str:
         """
@@ -154,113 +259,54 @@ class AICommunicationHandler:
         call_max_tokens = max_tokens if max_tokens is not None else config.get('max_tokens')
         call_timeout = timeout if timeout is not None else self.ai_api_timeout
         
-        # Temporarily swap terminal's api_key and model settings for this call
+        # Temporarily swap terminal's api_key and per-engine settings for this call
         original_api_key = getattr(self.terminal, 'api_key', None)
-        original_model = None
-        original_temperature = None
-        
-        # Save original values based on engine type
-        if engine == "openai":
-            original_model = self.terminal.default_model
-            original_temperature = self.terminal.default_temperature
-            self.terminal.api_key = config.get('api_key') or self.terminal.api_key
-            self.terminal.default_model = config.get('model') or self.terminal.default_model
-            self.terminal.default_temperature = config.get('temperature', self.terminal.default_temperature)
-        elif engine == "ollama":
-            original_model = self.terminal.ollama_model
-            original_temperature = self.terminal.ollama_temperature
-            self.terminal.ollama_model = config.get('model') or self.terminal.ollama_model
-            self.terminal.ollama_temperature = config.get('temperature', self.terminal.ollama_temperature)
-        elif engine == "llama-cpp":
-            original_model = self.terminal.llama_cpp_model
-            original_temperature = self.terminal.llama_cpp_temperature
-            self.terminal.api_key = config.get('api_key') or self.terminal.api_key
-            self.terminal.llama_cpp_model = config.get('model') or self.terminal.llama_cpp_model
-            self.terminal.llama_cpp_temperature = config.get('temperature', self.terminal.llama_cpp_temperature)
-            self.terminal.llama_cpp_max_tokens = config.get('max_tokens', self.terminal.llama_cpp_max_tokens)
-            self.terminal.llama_cpp_url = config.get('url') or self.terminal.llama_cpp_url
-        elif engine == "ollama-cloud":
-            original_model = self.terminal.ollama_cloud_model
-            original_temperature = self.terminal.ollama_cloud_temperature
-            self.terminal.api_key = config.get('api_key') or self.terminal.api_key
-            self.terminal.ollama_cloud_model = config.get('model') or self.terminal.ollama_cloud_model
-            self.terminal.ollama_cloud_temperature = config.get('temperature', self.terminal.ollama_cloud_temperature)
-        elif engine == "google":
-            original_model = self.terminal.gemini_model
+        swaps_api_key, overrides = self._ENGINE_OVERRIDES.get(engine, (False, ()))
+        originals = {}
+        if swaps_api_key:
             self.terminal.api_key = config.get('api_key') or self.terminal.api_key
-            self.terminal.gemini_model = config.get('model') or self.terminal.gemini_model
-        elif engine == "openrouter":
-            original_model = self.terminal.openrouter_model
-            original_temperature = self.terminal.openrouter_temperature
-            self.terminal.api_key = config.get('api_key') or self.terminal.api_key
-            self.terminal.openrouter_model = config.get('model') or self.terminal.openrouter_model
-            self.terminal.openrouter_temperature = config.get('temperature', self.terminal.openrouter_temperature)
-            self.terminal.openrouter_max_tokens = config.get('max_tokens', self.terminal.openrouter_max_tokens)
-        elif engine == "groq":
-            original_model = self.terminal.groq_model
-            original_temperature = self.terminal.groq_temperature
-            self.terminal.api_key = config.get('api_key') or self.terminal.api_key
-            self.terminal.groq_model = config.get('model') or self.terminal.groq_model
-            self.terminal.groq_temperature = config.get('temperature', self.terminal.groq_temperature)
-            self.terminal.groq_max_tokens = config.get('max_tokens', self.terminal.groq_max_tokens)
-        elif engine == "codex-cli":
-            original_model = self.terminal.codex_model
-            self.terminal.codex_model = config.get('model') or self.terminal.codex_model
-        
+        for attr, key in overrides:
+            current = getattr(self.terminal, attr)
+            originals[attr] = current
+            if key in ('model', 'url'):
+                setattr(self.terminal, attr, config.get(key) or current)
+            else:
+                setattr(self.terminal, attr, config.get(key, current))
+
         try:
             # Make the actual API call
-            if engine == "ollama":
-                return self.terminal.connect_to_ollama(system_prompt, user_prompt, max_tokens=call_max_tokens, timeout=call_timeout)
-            elif engine == "llama-cpp":
-                return self.terminal.connect_to_llama_cpp(system_prompt, user_prompt, max_tokens=call_max_tokens, timeout=call_timeout)
-            elif engine == "ollama-cloud":
-                return self.terminal.connect_to_ollama_cloud(system_prompt, user_prompt, max_tokens=call_max_tokens, timeout=call_timeout)
-            elif engine == "google":
-                return self.terminal.connect_to_gemini(f"{system_prompt}\n{user_prompt}", max_tokens=call_max_tokens, timeout=call_timeout)
-            elif engine == "openai":
-                return self.terminal.connect_to_chatgpt(system_prompt, user_prompt, max_tokens=call_max_tokens, timeout=call_timeout)
-            elif engine == "openrouter":
-                return self.terminal.connect_to_openrouter(system_prompt, user_prompt, max_tokens=call_max_tokens, timeout=call_timeout)
-            elif engine == "groq":
-                return self.terminal.connect_to_groq(system_prompt, user_prompt, max_tokens=call_max_tokens, timeout=call_timeout)
-            elif engine == "codex-cli":
-                force_json = getattr(self, '_request_format_hint', 'json') == 'json'
-                return self.terminal.connect_to_codex_cli(
-                    system_prompt,
-                    user_prompt,
-                    model=config.get('model'),
-                    timeout=call_timeout,
-                    force_json=force_json,
-                )
-            else:
+            call = self._engines.get(engine)
+            if call is None:
                 raise ValueError(f"Unsupported AI engine: {engine}")
+            return call(system_prompt, user_prompt, call_max_tokens, call_timeout, config)
         finally:
             # Restore original values
             if original_api_key is not None:
                 self.terminal.api_key = original_api_key
-            if original_model is not None:
-                if engine == "openai":
-                    self.terminal.default_model = original_model
-                    self.terminal.default_temperature = original_temperature
-                elif engine == "ollama":
-                    self.terminal.ollama_model = original_model
-                    self.terminal.ollama_temperature = original_temperature
-                elif engine == "llama-cpp":
-                    self.terminal.llama_cpp_model = original_model
-                    self.terminal.llama_cpp_temperature = original_temperature
-                elif engine == "ollama-cloud":
-                    self.terminal.ollama_cloud_model = original_model
-                    self.terminal.ollama_cloud_temperature = original_temperature
-                elif engine == "google":
-                    self.terminal.gemini_model = original_model
-                elif engine == "openrouter":
-                    self.terminal.openrouter_model = original_model
-                    self.terminal.openrouter_temperature = original_temperature
-                elif engine == "groq":
-                    self.terminal.groq_model = original_model
-                    self.terminal.groq_temperature = original_temperature
-                elif engine == "codex-cli":
-                    self.terminal.codex_model = original_model
+            for attr, value in originals.items():
+                setattr(self.terminal, attr, value)
+
+    def _call_ollama(self, system_prompt: str, user_prompt: str, max_tokens: Optional[int],
+                     timeout: Optional[int], config: dict) -> Optional[str]:
+        """Call Ollama, streaming the reply when the terminal has streaming enabled."""
+        if getattr(self.terminal, 'ollama_stream', False):
+            return self._collect_streamed_response(
+                self.terminal.connect_to_ollama_stream(system_prompt, user_prompt, max_tokens=max_tokens, timeout=timeout),
+                stop_at_json=getattr(self, '_request_format_hint', 'json') == 'json',
+            )
+        return self.terminal.connect_to_ollama(system_prompt, user_prompt, max_tokens=max_tokens, timeout=timeout)
+
+    def _call_codex_cli(self, system_prompt: str, user_prompt: str, max_tokens: Optional[int],
+                        timeout: Optional[int], config: dict) -> Optional[str]:
+        """Call the Codex CLI, forcing JSON output unless the request asked for text."""
+        force_json = getattr(self, '_request_format_hint', 'json') == 'json'
+        return self.terminal.connect_to_codex_cli(
+            system_prompt,
+            user_prompt,
+            model=config.get('model'),
+            timeout=timeout,
+            force_json=force_json,
+        )
 
     def send_request(
         self,
@@ -291,6 +337,16 @@ class AICommunicationHandler:
         if max_attempts == 0:
             max_attempts = float('inf')  # No retry limit
         
+        cache_key = self._response_cache_key(system_prompt, user_prompt, request_format, max_tokens)
+        if cache_key is not None:
+            with self._response_cache_lock:
+                cached = self._response_cache.get(cache_key)
+                if cached is not None:
+                    self._response_cache.move_to_end(cache_key)
+            if cached is not None:
+                self.logger.debug("AI response cache hit: operation=%s", operation)
+                return cached
+
         # Calculate input tokens for tracking
         input_text = f"{system_prompt}\n{user_prompt}"
         input_tokens = self._estimate_tokens(input_text)
@@ -300,52 +356,54 @@ class AICommunicationHandler:
         
         for attempt in range(1, range_limit + 1):
             try:
-                # Use the selected API method based on configuration
-                self._request_format_hint = request_format
-                if self.use_timeout_api:
-                    self.logger.debug(f"Using timeout-enabled API call (attempt {attempt}/{max_attempts})")
-                    response, used_engine = self._call_ai_api_with_timeout(system_prompt, user_prompt, max_tokens=max_tokens)
-                else:
-                    self.logger.debug(f"Using legacy API call without timeout (attempt {attempt}/{max_attempts})")
-                    response, used_engine = self._call_ai_api(system_prompt, user_prompt, max_tokens=max_tokens)
+                # One request at a time: engine calls swap settings on the shared terminal
+                with self._request_lock:
+                    # Use the selected API method based on configuration
+                    self._request_format_hint = request_format
+                    if self.use_timeout_api:
+                        self.logger.debug(f"Using timeout-enabled API call (attempt {attempt}/{max_attempts})")
+                        response, used_engine = self._call_ai_api_with_timeout(system_prompt, user_prompt, max_tokens=max_tokens)
+                    else:
+                        self.logger.debug(f"Using legacy API call without timeout (attempt {attempt}/{max_attempts})")
+                        response, used_engine = self._call_ai_api(system_prompt, user_prompt, max_tokens=max_tokens)
                 
-                if not response:
-                    raise ValueError("Empty response from AI")
-
-                self.logger.debug(
-                    "AI response stats: operation=%s attempt=%s len=%d format=%s",
-                    operation,
-                    attempt,
-                    len(response),
-                    request_format,
-                )
+                    if not response:
+                        raise ValueError("Empty response from AI")
+
+                    self.logger.debug(
+                        "AI response stats: operation=%s attempt=%s len=%d format=%s",
+                        operation,
+                        attempt,
+                        len(response),
+                        request_format,
+                    )
                 
-                # Calculate output tokens
-                output_tokens = self._estimate_tokens(response)
+                    # Calculate output tokens
+                    output_tokens = self._estimate_tokens(response)
                 
-                # Track token usage with model information
-                self._track_token_usage(
-                    operation=operation,
-                    input_tokens=input_tokens,
-                    output_tokens=output_tokens,
-                    attempt=attempt,
-                    model=used_engine
-                )
+                    # Track token usage with model information
+                    self._track_token_usage(
+                        operation=operation,
+                        input_tokens=input_tokens,
+                        output_tokens=output_tokens,
+                        attempt=attempt,
+                        model=used_engine
+                    )
                 
-                if request_format == "json":
-                    processed = self._process_json_response(response)
-                    if processed is not None:
-                        return processed
-
-                    # Codex CLI sometimes returns plain text despite JSON instructions.
-                    # Try one targeted repair pass before failing/retrying.
-                    if used_engine == "codex-cli":
-                        repaired = self._repair_json_with_engine(response, used_engine, max_tokens=max_tokens)
-                        if repaired is not None:
-                            return repaired
-                    raise ValueError("Invalid JSON response")
+                    if request_format == "json":
+                        processed = self._process_json_response(response)
+                        if processed is not None:
+                            return self._remember_response(cache_key, processed)
+
+                        # Codex CLI sometimes returns plain text despite JSON instructions.
+                        # Try one targeted repair pass before failing/retrying.
+                        if used_engine == "codex-cli":
+                            repaired = self._repair_json_with_engine(response, used_engine, max_tokens=max_tokens)
+                            if repaired is not None:
+                                return self._remember_response(cache_key, repaired)
+                        raise ValueError("Invalid JSON response")
                 
-                return response
+                    return self._remember_response(cache_key, response)
             
             except Exception as e:
                 self._handle_retry_error(attempt, max_attempts, e)
@@ -358,12 +416,7 @@ class AICommunicationHandler:
                 should_retry = max_attempts == float('inf') or attempt < max_attempts
                 
                 if should_retry:
-                    # Calculate delay with exponential backoff
-                    delay = self.ai_api_retry_delay * (self.ai_api_retry_backoff ** (attempt - 1))
-                    # Add jitter to prevent thundering herd
-                    jitter = random.uniform(0, delay * 0.1)
-                    delay_with_jitter = delay + jitter
-                    
+                    delay_with_jitter = self._retry_delay(attempt)
                     self.logger.debug(f"Retrying in {delay_with_jitter:.2f} seconds...")
                     time.sleep(delay_with_jitter)
                 else:
@@ -371,6 +424,36 @@ class AICommunicationHandler:
         
         return None
 
+    def _response_cache_key(self, system_prompt: str, user_prompt: str, request_format: str,
+                            max_tokens: Optional[int]) -> Optional[bytes]:
+        """
+        Digest identifying a request for the response cache, or None when it must not be cached.
+
+        Caching is only safe when every routed engine samples greedily (temperature 0);
+        otherwise a repeated prompt is expected to produce a different reply.
+        """
+        if self.ai_response_cache_size <= 0:
+            return None
+        engine_models = getattr(self.terminal, 'engine_models', {})
+        for engine in self.ai_engines:
+            if engine_models.get(engine, {}).get('temperature') != 0:
+                return None
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (system_prompt, user_prompt, request_format, ",".join(self.ai_engines), str(max_tokens)):
+            digest.update(part.encode("utf-8", "surrogatepass"))
+            digest.update(b"\0")
+        return digest.digest()
+
+    def _remember_response(self, cache_key: Optional[bytes], response: str) -> str:
+        """Store a successfully processed reply under cache_key, evicting the least recently used."""
+        if cache_key is not None:
+            with self._response_cache_lock:
+                self._response_cache[cache_key] = response
+                self._response_cache.move_to_end(cache_key)
+                while len(self._response_cache) > self.ai_response_cache_size:
+                    self._response_cache.popitem(last=False)
+        return response
+
     def send_request_with_model(
         self,
         system_prompt: str,
@@ -410,47 +493,49 @@ class AICommunicationHandler:
         
         for attempt in range(1, range_limit + 1):
             try:
-                # Use the selected API method based on configuration
-                self._request_format_hint = request_format
-                if self.use_timeout_api:
-                    self.logger.debug(f"Using timeout-enabled API call (attempt {attempt}/{max_attempts})")
-                    response, used_engine = self._call_ai_api_with_timeout(system_prompt, user_prompt, max_tokens=max_tokens)
-                else:
-                    self.logger.debug(f"Using legacy API call without timeout (attempt {attempt}/{max_attempts})")
-                    response, used_engine = self._call_ai_api(system_prompt, user_prompt, max_tokens=max_tokens)
+                # One request at a time: engine calls swap settings on the shared terminal
+                with self._request_lock:
+                    # Use the selected API method based on configuration
+                    self._request_format_hint = request_format
+                    if self.use_timeout_api:
+                        self.logger.debug(f"Using timeout-enabled API call (attempt {attempt}/{max_attempts})")
+                        response, used_engine = self._call_ai_api_with_timeout(system_prompt, user_prompt, max_tokens=max_tokens)
+                    else:
+                        self.logger.debug(f"Using legacy API call without timeout (attempt {attempt}/{max_attempts})")
+                        response, used_engine = self._call_ai_api(system_prompt, user_prompt, max_tokens=max_tokens)
                 
-                if not response:
-                    raise ValueError("Empty response from AI")
-
-                self.logger.debug(
-                    "AI response stats: operation=%s attempt=%s len=%d format=%s",
-                    operation,
-                    attempt,
-                    len(response),
-                    request_format,
-                )
+                    if not response:
+                        raise ValueError("Empty response from AI")
+
+                    self.logger.debug(
+                        "AI response stats: operation=%s attempt=%s len=%d format=%s",
+                        operation,
+                        attempt,
+                        len(response),
+                        request_format,
+                    )
                 
-                # Calculate output tokens
-                output_tokens = self._estimate_tokens(response)
+                    # Calculate output tokens
+                    output_tokens = self._estimate_tokens(response)
                 
-                # Track token usage with model information
-                self._track_token_usage(
-                    operation=operation,
-                    input_tokens=input_tokens,
-                    output_tokens=output_tokens,
-                    attempt=attempt,
-                    model=used_engine
-                )
+                    # Track token usage with model information
+                    self._track_token_usage(
+                        operation=operation,
+                        input_tokens=input_tokens,
+                        output_tokens=output_tokens,
+                        attempt=attempt,
+                        model=used_engine
+                    )
                 
-                if request_format == "json":
-                    processed_response = self._process_json_response(response)
-                    if processed_response is None and used_engine == "codex-cli":
-                        processed_response = self._repair_json_with_engine(response, used_engine, max_tokens=max_tokens)
-                    if processed_response is None:
-                        raise ValueError("Invalid JSON response")
-                    return processed_response, used_engine
+                    if request_format == "json":
+                        processed_response = self._process_json_response(response)
+                        if processed_response is None and used_engine == "codex-cli":
+                            processed_response = self._repair_json_with_engine(response, used_engine, max_tokens=max_tokens)
+                        if processed_response is None:
+                            raise ValueError("Invalid JSON response")
+                        return processed_response, used_engine
                 
-                return response, used_engine
+                    return response, used_engine
             
             except Exception as e:
                 self._handle_retry_error(attempt, max_attempts, e)
@@ -463,12 +548,7 @@ class AICommunicationHandler:
                 should_retry = max_attempts == float('inf') or attempt < max_attempts
                 
                 if should_retry:
-                    # Calculate delay with exponential backoff
-                    delay = self.ai_api_retry_delay * (self.ai_api_retry_backoff ** (attempt - 1))
-                    # Add jitter to prevent thundering herd
-                    jitter = random.uniform(0, delay * 0.1)
-                    delay_with_jitter = delay + jitter
-                    
+                    delay_with_jitter = self._retry_delay(attempt)
                     self.logger.debug(f"Retrying in {delay_with_jitter:.2f} seconds...")
                     time.sleep(delay_with_jitter)
                 else:
@@ -497,6 +577,68 @@ class AICommunicationHandler:
             self.logger.debug(f"JSON repair with engine failed: {e}")
             return None
 
+    def _collect_streamed_response(self, chunks, stop_at_json: bool = True) -> Optional[str]:
+        """
+        Accumulate a streamed completion. With stop_at_json, stop reading once it
+        holds a complete top-level JSON value and the next chunk confirms nothing
+        but whitespace follows it, so trailing format=json padding is never waited
+        for. Anything after the value (e.g. a second action object) turns the
+        cut-off off and the whole reply is read.
+
+        Errors raised by the stream (dropped connection, HTTP error) propagate, so
+        a partial reply is never mistaken for a complete one.
+
+        Returns the JSON text, or the whole stripped text if the stream ended
+        without a cut-off, or None if nothing was received.
+        """
+        parts = []
+        value_end = None  # end offset of a complete value awaiting confirmation
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                if not stop_at_json:
+                    continue
+                if value_end is not None:
+                    text = ''.join(parts).lstrip()
+                    if text[value_end:].strip():
+                        stop_at_json = False  # more content follows the value
+                        continue
+                    self.logger.debug("Streamed JSON complete after %d chars, closing stream", value_end)
+                    return text[:value_end]
+                # A value can only have just completed if this chunk closed a bracket
+                if '}' not in chunk and ']' not in chunk:
+                    continue
+                text = ''.join(parts).lstrip()
+                if not text or text[0] not in '{[':
+                    continue
+                try:
+                    _, end = _JSON_DECODER.raw_decode(text)
+                except ValueError:
+                    continue
+                if text[end:].strip():
+                    stop_at_json = False
+                else:
+                    value_end = end
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        text = ''.join(parts).strip()
+        return text or None
+
+    def _retry_delay(self, attempt: int) -> float:
+        """
+        Seconds to wait before the next attempt: exponential backoff with 10% jitter,
+        capped at AI_API_RETRY_MAX_DELAY so unlimited retries cannot grow the wait
+        without bound.
+        """
+        delay = min(
+            self.ai_api_retry_delay * (self.ai_api_retry_backoff ** (attempt - 1)),
+            self.ai_api_retry_max_delay,
+        )
+        # Add jitter to prevent thundering herd
+        return delay + random.uniform(0, delay * 0.1)
+
     def _is_retryable_error(self, error: Exception) -> bool:
         """Return False for deterministic request/auth/model errors."""
         text = str(error).lower()
@@ -755,6 +897,15 @@ class AICommunicationHandler:
         - Streaming JSON repair (for incomplete responses)
         - Aggressive JSON extraction
         """
+        # Fast path: most replies are already clean JSON, skip the strategy chain
+        stripped = response.strip() if response else ""
+        if stripped[:1] in ("{", "["):
+            try:
+                json.loads(stripped)
+                return stripped
+            except ValueError:
+                pass
+
         # Try enhanced validator first if available
         if self.json_validator:
             try:
@@ -768,6 +919,18 @@ class AICommunicationHandler:
                 self.logger.debug(f"Enhanced validator exception: {e}")
         
         # Fallback to original parsing strategies
+        fixed_cache = {}
+
+        def fix_single_quotes(text: str) -> str:
+            # Strategies often extract the same span; fix each text only once
+            fixed = fixed_cache.get(text)
+            if fixed is None:
+                fixed = self._python_literal_to_json(text)
+                if fixed is None:
+                    fixed = self._fix_single_quotes(text)
+                fixed_cache[text] = fixed
+            return fixed
+
         try:
             # Strategy 1: Try to parse the entire response as-is
             try:
@@ -777,14 +940,14 @@ class AICommunicationHandler:
                 pass
 
             # Strategy 2: Extract from markdown code blocks
-            code_block_match = re.search(r'```(?:json)?\s*\n?([\s\S]*?)\n?```', response)
+            code_block_match = _CODE_BLOCK_RE.search(response)
             if code_block_match:
                 extracted = code_block_match.group(1).strip()
                 try:
                     json.loads(extracted)
                     return extracted
                 except json.JSONDecodeError:
-                    fixed = self._fix_single_quotes(extracted)
+                    fixed = fix_single_quotes(extracted)
                     try:
                         json.loads(fixed)
                         return fixed
@@ -798,7 +961,7 @@ class AICommunicationHandler:
                     json.loads(json_obj)
                     return json_obj
                 except json.JSONDecodeError:
-                    fixed = self._fix_single_quotes(json_obj)
+                    fixed = fix_single_quotes(json_obj)
                     try:
                         json.loads(fixed)
                         return fixed
@@ -812,7 +975,7 @@ class AICommunicationHandler:
                     json.loads(json_arr)
                     return json_arr
                 except json.JSONDecodeError:
-                    fixed = self._fix_single_quotes(json_arr)
+                    fixed = fix_single_quotes(json_arr)
                     try:
                         json.loads(fixed)
                         return fixed
@@ -821,7 +984,16 @@ class AICommunicationHandler:
 
             # Strategy 5: Line-by-line NDJSON parsing - collect ALL valid JSON lines
             valid_objects = []
-            for line in response.split('\n'):
+            if '\n' not in response:
+                # Single line: the as-is parse already failed in strategy 1
+                lines = []
+                try:
+                    valid_objects.append(json.loads(fix_single_quotes(response.strip())))
+                except json.JSONDecodeError:
+                    pass
+            else:
+                lines = response.split('\n')
+            for line in lines:
                 line = line.strip()
                 if not line:
                     continue
@@ -829,7 +1001,7 @@ class AICommunicationHandler:
                     obj = json.loads(line)
                     valid_objects.append(obj)
                 except json.JSONDecodeError:
-                    fixed = self._fix_single_quotes(line)
+                    fixed = fix_single_quotes(line)
                     try:
                         obj = json.loads(fixed)
                         valid_objects.append(obj)
@@ -856,6 +1028,15 @@ class AICommunicationHandler:
         if start_idx == -1:
             return None
 
+        # Fast path: let the C JSON decoder find where the value ends
+        try:
+            _, end_idx = _JSON_DECODER.raw_decode(text, start_idx)
+            return text[start_idx:end_idx]
+        except ValueError:
+            pass
+
+        # Not valid JSON as-is (e.g. single quotes): balance brackets so the
+        # caller can still attempt a repair on the extracted span
         depth = 0
         in_string = False
         escape_next = False
@@ -887,19 +1068,29 @@ class AICommunicationHandler:
 
         return None
 
+    def _python_literal_to_json(self, text: str) -> Optional[str]:
+        """
+        Re-serialize a Python dict/list literal ('quotes', True, None) as JSON.
+        Returns None if the text is not such a literal.
+        """
+        try:
+            obj = ast.literal_eval(text.strip())
+        except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+            return None
+        if not isinstance(obj, (dict, list)):
+            return None
+        try:
+            return json.dumps(obj, ensure_ascii=False)
+        except (TypeError, ValueError):
+            # e.g. tuple keys or sets, which have no JSON form
+            return None
+
     def _fix_single_quotes(self, text: str) -> str:
         """
         Convert Python-style single-quoted dict syntax to valid JSON.
         Best-effort fix for common AI response formatting issues.
         """
-        result = text
-        # Handle keys: 'key': -> "key":
-        result = re.sub(r"'([^']+)'(\s*:)", r'"\1"\2', result)
-        # Handle string values: : 'value' -> : "value"
-        result = re.sub(r":\s*'([^']*)'", r': "\1"', result)
-        # Handle remaining single-quoted strings
-        result = re.sub(r"'([^']+)'", r'"\1"', result)
-        return result
+        return single_to_double_quotes(text)
 
     def _handle_retry_error(self, attempt: int, max_attempts: float, error: Exception):
         """Log and handle retry errors"""
@@ -911,16 +1102,6 @@ class AICommunicationHandler:
         else:
             print(f"AICommunicationHandler: {error_msg}")
 
-    def _create_dummy_logger(self):
-        """Fallback logger if none provided"""
-        class DummyLogger:
-            def log(self, *args, **kwargs): pass
-            def debug(self, *args, **kwargs): pass
-            def info(self, *args, **kwargs): pass
-            def warning(self, *args, **kwargs): pass
-            def error(self, *args, **kwargs): pass
-        return DummyLogger()
-
     def _estimate_tokens(self, text: str) -> int:
         """
         Estimate token count for text using a simple approximation.
@@ -1,16 +1,62 @@
+import hashlib
+import io
 import json
+import os
 import re
+import sys
+import time
 import logging
-from collections import deque
-from typing import List, Dict, Any, Optional
+from collections import deque, OrderedDict
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 from datetime import datetime
 
+# Optional fast JSON serializer (falls back to the stdlib json module)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+_ROLE_SYSTEM = sys.intern("system")
+_ROLE_USER = sys.intern("user")
+_ROLE_ASSISTANT = sys.intern("assistant")
+
+# Headers of the synthesized system messages
+_CONVERSATION_MEMORY_HEADER = "[Conversation memory]\n"
+_STATE_HEADER = "[Persistent agent state]\n"
+
+# Fenced code blocks stripped from AI-written summaries
+_CODE_FENCE_RE = re.compile(r"```.*?```", re.S)
+# First line of a message, starting at its first non-whitespace character
+_FIRST_LINE_RE = re.compile(r"\S[^\n]*")
+
+
+def _dumps_sorted(data: Any) -> str:
+    """
+    Serialize data to compact JSON with sorted keys (non-ASCII kept as is), using orjson when available.
+    Values JSON cannot represent are written as their str(); orjson also stringifies non-str keys.
+    """
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(
+                data, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+            ).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+
 
 class ContextManager:
     """
     High-performance context manager with sliding window + rolling summary.
     """
 
+    # AI summaries memoized by content digest; entries kept
+    SUMMARY_CACHE_SIZE = 128
+    # Bullet lines kept by the heuristic (no-AI) summary
+    HEURISTIC_SUMMARY_LINES = 20
+
     def __init__(
         self,
         window_size: int = 20,
@@ -19,47 +65,146 @@ class ContextManager:
         summary_char_limit: int = 5000,
         min_messages_before_summary: int = 3,
         max_context_history: int = 1000,
+        max_window_tokens: int = 0,
+        transcript_path: Optional[str] = None,
+        summary_chunk_size: int = 0,
     ):
         self.window_size = window_size
+        # Token budget for the verbatim window (0 = unbounded); see maybe_compact()
+        self.max_window_tokens = max_window_tokens
+        self._active_window = window_size
         self.summary_char_limit = summary_char_limit
+        # Max messages folded into the summary per summarizer call (0 = whole backlog at once)
+        self.summary_chunk_size = summary_chunk_size
         self.runner = runner
         self.logger = logger or logging.getLogger("ContextManager")
+        self.refresh_log_level()
         self._min_messages_before_summary = min_messages_before_summary
 
-        # Context with automatic pruning
-        self.context: deque[Dict[str, str]] = deque(maxlen=max_context_history)
+        # Context with automatic pruning, stored as parallel deques (role, content)
+        # instead of one dict per message; dicts are only built at the API boundary.
+        # Every added message takes the next monotonic id (transcript records and
+        # the window cache key); ids are never reused after eviction or rollback.
+        self._roles: deque[str] = deque(maxlen=max_context_history)
+        self._contents: deque[str] = deque(maxlen=max_context_history)
+        self._next_message_id: int = 0
         self.request_history: deque[Dict[str, Any]] = deque(maxlen=max_context_history)
 
+        # Cold tier: full transcript written through to JSONL on disk (optional).
+        # The window is the hot tier and the rolling summary the warm tier.
+        self.transcript_path = transcript_path
+        self._transcript_file = None
+
         # Rolling summary state
         self._rolling_summary: Optional[str] = None
+        # "[Conversation memory]" message text, rebuilt only when the summary changes
+        self._rolling_summary_message: Optional[str] = None
         self._summary_upto_index: int = 2
+        # AI summaries keyed by a blake2b digest of (system prompt, summarized text)
+        self._ai_summary_cache: "OrderedDict[bytes, str]" = OrderedDict()
 
-        # Metrics
-        self._summary_metrics = {
-            "initial_summaries": 0,
-            "update_summaries": 0,
-            "total_messages_summarized": 0,
-            "truncation_count": 0,
-            "frequent_truncation_alerts": 0,
-        }
-        self._last_truncation_warning: Optional[datetime] = None
+        # Last built window (without the state message) and the context version it reflects
+        self._window_cache_key: Optional[Tuple[int, int, int]] = None
+        self._window_cache: List[Tuple[str, str]] = []
+
+        # Metrics, kept as plain int attributes (the hot paths only increment them);
+        # get_summary_metrics() assembles the dict on demand
+        self.reset_summary_metrics()
 
     # ------------------------------------------------------------------
     # Message handling
     # ------------------------------------------------------------------
 
+    @property
+    def context(self) -> Tuple[Dict[str, str], ...]:
+        """
+        Snapshot of the stored messages as role/content dicts.
+
+        A tuple, so code that still appends to or pops from it fails loudly
+        instead of silently editing a copy; use add_message()/truncate_to().
+        """
+        return tuple(
+            {"role": role, "content": content} for role, content in zip(self._roles, self._contents)
+        )
+
+    def get_context_length(self) -> int:
+        return len(self._roles)
+
     def add_message(self, role: str, content: str) -> None:
-        self.context.append({"role": role, "content": content})
-        self._safe_log("debug", "Added %s message. Context size=%s", role, len(self.context))
+        self._roles.append(sys.intern(role))
+        self._contents.append(content)
+        if self.transcript_path:
+            self._write_transcript(self._next_message_id, role, content)
+        self._next_message_id += 1
+        if self._debug:
+            self.logger.debug("Added %s message. Context size=%s", role, len(self._roles))
+        if self.max_window_tokens:
+            self.maybe_compact()
+
+    def add_messages(self, messages: Iterable[Tuple[str, str]]) -> None:
+        """
+        Append several (role, content) messages at once, e.g. a replayed log.
+
+        Same result as calling add_message for each pair, but the deques are
+        extended in bulk and the window is compacted and logged once at the end.
+        """
+        items = [(sys.intern(role), content) for role, content in messages]
+        if not items:
+            return
+        first_id = self._next_message_id
+        self._roles.extend([role for role, _ in items])
+        self._contents.extend([content for _, content in items])
+        self._next_message_id = first_id + len(items)
+        if self.transcript_path:
+            for offset, (role, content) in enumerate(items):
+                self._write_transcript(first_id + offset, role, content)
+        if self._debug:
+            self.logger.debug("Added %s messages. Context size=%s", len(items), len(self._roles))
+        if self.max_window_tokens:
+            self.maybe_compact()
+
+    def maybe_compact(self) -> int:
+        """
+        Shrink the verbatim window so it fits max_window_tokens.
+
+        Walks back from the newest message, estimating tokens as len(text) // 4,
+        and keeps as many messages (up to window_size, at least 2) as fit the
+        budget. Messages pushed out of the window are folded into the rolling
+        summary the next time the sliding window is built, so the prompt stays
+        bounded even when individual command outputs are large.
+
+        Returns:
+            int: Number of messages kept verbatim.
+        """
+        budget = self.max_window_tokens
+        if not budget:
+            self._active_window = self.window_size
+            return self._active_window
+        contents = self._contents
+        limit = min(self.window_size, max(len(contents) - 2, 0))
+        kept = 0
+        used = 0
+        while kept < limit:
+            used += len(contents[-1 - kept]) // 4
+            if used > budget and kept >= 2:
+                break
+            kept += 1
+        if kept < limit:
+            if self._debug:
+                self.logger.debug("Compacting window to %s messages; token budget=%s", kept, budget)
+            self._active_window = kept
+        else:
+            self._active_window = self.window_size
+        return self._active_window
 
     def add_system_message(self, content: str) -> None:
-        self.add_message("system", content)
+        self.add_message(_ROLE_SYSTEM, content)
 
     def add_user_message(self, content: str) -> None:
-        self.add_message("user", content)
+        self.add_message(_ROLE_USER, content)
 
     def add_assistant_message(self, content: str) -> None:
-        self.add_message("assistant", content)
+        self.add_message(_ROLE_ASSISTANT, content)
 
     # ------------------------------------------------------------------
     # Sliding window
@@ -69,59 +214,113 @@ class ContextManager:
         self,
         state: Optional[Dict[str, Any]] = None,
     ) -> List[Dict[str, str]]:
-        context_len = len(self.context)
-        max_len = 2 + self.window_size
-
-        if context_len <= max_len:
-            working = list(self.context)
-            self._inject_state(working, state)
-            return working
-
-        initial = list(self.context)[:2]
-        recent = list(self.context)[-self.window_size:]
-
-        summary_end_index = context_len - self.window_size
-        new_messages = list(self.context)[self._summary_upto_index:summary_end_index]
+        return [
+            {"role": role, "content": content}
+            for role, content in self.iter_sliding_window_context(state)
+        ]
 
-        working = initial
-
-        if len(new_messages) >= self._min_messages_before_summary:
-            self._update_rolling_summary(new_messages)
-            self._summary_upto_index = summary_end_index
-
-        if self._rolling_summary:
-            working.append({
-                "role": "system",
-                "content": "[Conversation memory]\n" + self._rolling_summary,
-            })
-
-        working.extend(recent)
-        self._inject_state(working, state)
-        return working
+    def iter_sliding_window_context(
+        self,
+        state: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[Tuple[str, str]]:
+        """
+        Yield (role, content) pairs in prompt order without building message dicts:
+        system + goal, rolling summary, the last window_size messages, then state.
+        The rolling summary is refreshed before the first message is yielded, and
+        the window is reused as is until a message is added or removed.
+        """
+        roles = self._roles
+        contents = self._contents
+        context_len = len(roles)
+        window_size = self._active_window
+        max_len = 2 + window_size
+
+        # Nothing was added or removed since the last build: reuse its messages.
+        # The id counter changes on every add, the length on every removal.
+        cache_key = (self._next_message_id, context_len, window_size)
+        if cache_key == self._window_cache_key:
+            yield from self._window_cache
+        elif context_len <= max_len:
+            window = list(zip(roles, contents))
+            self._window_cache_key, self._window_cache = cache_key, window
+            yield from window
+        else:
+            summary_end_index = context_len - window_size
+            if summary_end_index - self._summary_upto_index >= self._min_messages_before_summary:
+                self._fold_into_summary(self._summary_upto_index, summary_end_index)
+                self._summary_upto_index = summary_end_index
+
+            # Snapshot the slices up front so callers may mutate context while iterating.
+            # Index the deques near their ends instead of islice-walking from the left,
+            # which would step over every stored message to reach the window.
+            # The final size is known, so fill a preallocated list instead of growing one.
+            summary_message = self._rolling_summary_message
+            offset = 3 if summary_message else 2
+            window = [None] * (offset + window_size)
+            window[0] = (roles[0], contents[0])
+            window[1] = (roles[1], contents[1])
+            if summary_message:
+                # Assistant role: the prompt renderer drops system messages, and the
+                # summary is the only trace of turns that left the window
+                window[2] = (_ROLE_ASSISTANT, summary_message)
+            for i in range(window_size):
+                index = summary_end_index + i
+                window[offset + i] = (roles[index], contents[index])
+            self._window_cache_key, self._window_cache = cache_key, window
+            yield from window
+
+        state_message = self._state_message(state)
+        if state_message is not None:
+            yield state_message["role"], state_message["content"]
+
+    def _messages_between(self, start: int, stop: int) -> List[Dict[str, str]]:
+        return [
+            {"role": role, "content": content}
+            for role, content in zip(islice(self._roles, start, stop), islice(self._contents, start, stop))
+        ]
 
     # ------------------------------------------------------------------
     # Rolling summary logic
     # ------------------------------------------------------------------
 
+    def _fold_into_summary(self, start: int, stop: int) -> None:
+        """
+        Fold messages [start, stop) into the rolling summary.
+
+        With summary_chunk_size set, a large backlog (e.g. after the window was
+        compacted) is folded in chunks of that many messages, so each summarizer
+        call gets a bounded input.
+        """
+        chunk = self.summary_chunk_size or (stop - start)
+        while start < stop:
+            end = min(start + chunk, stop)
+            self._update_rolling_summary(self._messages_between(start, end))
+            start = end
+
     def _update_rolling_summary(self, new_messages: List[Dict[str, str]]) -> None:
         try:
             if self._rolling_summary:
                 summary = self._summarize_update(self._rolling_summary, new_messages)
-                self._summary_metrics["update_summaries"] += 1
+                self._update_summaries += 1
             else:
                 summary = self._summarize_initial(new_messages)
-                self._summary_metrics["initial_summaries"] += 1
+                self._initial_summaries += 1
 
-            self._summary_metrics["total_messages_summarized"] += len(new_messages)
+            self._total_messages_summarized += len(new_messages)
 
             if len(summary) > self.summary_char_limit:
                 summary = summary[-self.summary_char_limit:]
                 self._handle_truncation()
 
-            self._rolling_summary = summary
-            self._safe_log("debug", "Rolling summary length=%s", len(summary))
-        except Exception:
-            self._safe_log("exception", "Failed to update rolling summary")
+            self._set_rolling_summary(summary)
+            if self._debug:
+                self.logger.debug("Rolling summary length=%s", len(summary))
+        except Exception as exc:
+            self._log_failure("Failed to update rolling summary", exc)
+
+    def _set_rolling_summary(self, summary: Optional[str]) -> None:
+        self._rolling_summary = summary
+        self._rolling_summary_message = _CONVERSATION_MEMORY_HEADER + summary if summary else None
 
     def _summarize_initial(self, messages: List[Dict[str, str]]) -> str:
         return self._summarize(
@@ -162,9 +361,31 @@ class ContextManager:
     ) -> str:
         if self.runner:
             try:
-                joined = "\n".join(
-                    f"{m['role']}: {m['content'][:800]}" for m in messages
-                )
+                out = io.StringIO()
+                write = out.write
+                sep = ""
+                for m in messages:
+                    content = m.get("content", "")
+                    write(sep)
+                    write(m.get("role", ""))
+                    write(": ")
+                    # Slicing copies the string, so only do it for long messages
+                    write(content if len(content) <= 800 else content[:800])
+                    sep = "\n"
+                joined = out.getvalue()
+
+                cache_key = hashlib.blake2b(
+                    (system_prompt + "\x00" + joined).encode("utf-8", "surrogatepass"),
+                    digest_size=16,
+                ).digest()
+                cached = self._ai_summary_cache.get(cache_key)
+                if cached is not None:
+                    self._ai_summary_cache.move_to_end(cache_key)
+                    self._summary_content_cache_hits += 1
+                    if self._debug:
+                        self.logger.debug("Reused AI summary for identical summarization input")
+                    return cached
+
                 ai_reply = self.runner._get_ai_reply_with_retry(
                     self.runner.terminal,
                     system_prompt,
@@ -172,56 +393,74 @@ class ContextManager:
                     retries=1,
                 )
                 if ai_reply:
-                    return re.sub(r"```.*?```", "", ai_reply, flags=re.S).strip()
-            except Exception:
-                self._safe_log("exception", "AI summarization failed")
-
-        # heuristic fallback
+                    summary = _CODE_FENCE_RE.sub("", ai_reply).strip()
+                    self._ai_summary_cache[cache_key] = summary
+                    if len(self._ai_summary_cache) > self.SUMMARY_CACHE_SIZE:
+                        self._ai_summary_cache.popitem(last=False)
+                    return summary
+            except Exception as exc:
+                self._log_failure("AI summarization failed", exc)
+
+        # heuristic fallback: first non-blank line of each message, at most
+        # HEURISTIC_SUMMARY_LINES of them, without copying whole contents
         bullets = []
         for m in messages:
-            line = m.get("content", "").strip().splitlines()[0]
-            if line:
-                bullets.append(f"- {line}")
-        return "\n".join(bullets[:20])
+            match = _FIRST_LINE_RE.search(m.get("content", ""))
+            if match:
+                bullets.append("- " + match.group().rstrip())
+                if len(bullets) == self.HEURISTIC_SUMMARY_LINES:
+                    break
+        return "\n".join(bullets)
 
     # ------------------------------------------------------------------
     # Utilities
     # ------------------------------------------------------------------
 
-    def _inject_state(
-        self,
-        working: List[Dict[str, str]],
-        state: Optional[Dict[str, Any]],
-    ) -> None:
+    def _state_message(self, state: Optional[Dict[str, Any]]) -> Optional[Dict[str, str]]:
         if not state:
-            return
+            return None
         try:
-            content = json.dumps(state, ensure_ascii=False, sort_keys=True)
+            content = _dumps_sorted(state)
         except Exception:
             content = str(state)
-        working.append({
-            "role": "system",
-            "content": "[Persistent agent state]\n" + content,
-        })
+        return {
+            "role": _ROLE_SYSTEM,
+            "content": _STATE_HEADER + content,
+        }
 
     def _handle_truncation(self) -> None:
-        self._summary_metrics["truncation_count"] += 1
-        now = datetime.now()
+        self._truncation_count += 1
+        now = time.monotonic()
         if (
-            self._last_truncation_warning
-            and (now - self._last_truncation_warning).total_seconds() < 3600
+            self._last_truncation_warning is not None
+            and now - self._last_truncation_warning < 3600.0
         ):
-            self._summary_metrics["frequent_truncation_alerts"] += 1
+            self._frequent_truncation_alerts += 1
             self._safe_log("warning", "Frequent summary truncation detected")
         self._last_truncation_warning = now
 
+    def refresh_log_level(self) -> None:
+        """Re-read whether the logger emits DEBUG; debug calls are skipped outright when it does not."""
+        self._debug = self.logger.isEnabledFor(logging.DEBUG)
+
+    def _log_failure(self, msg: str, exc: Exception) -> None:
+        """
+        Report a recoverable failure: a one-line warning normally, the full
+        traceback only when DEBUG logging is on. Summarizer failures come in
+        bursts when the AI backend times out, and formatting a traceback for
+        each one delays the fallback.
+        """
+        if self._debug:
+            self._safe_log("exception", msg)
+        else:
+            self._safe_log("warning", "%s: %s", msg, exc)
+
     def _safe_log(self, level: str, msg: str, *args) -> None:
         try:
             getattr(self.logger, level)(msg, *args)
         except Exception as exc:
             if level in ("error", "critical", "exception"):
                 try:
-                    import sys
                     rendered = msg % args if args else msg
                     print(
                         f"[ContextManager:{level}] {rendered} (logging fallback: {exc})",
@@ -250,7 +489,8 @@ class ContextManager:
             "ai_reply_json_string": ai_reply_json_string
         }
         self.request_history.append(request_entry)
-        self._safe_log("debug", "Recorded request; request_id=%s; step=%s", request_id, step_count)
+        if self._debug:
+            self.logger.debug("Recorded request; request_id=%s; step=%s", request_id, step_count)
 
     def remove_last_n_messages(self, n: int) -> None:
         """
@@ -260,11 +500,86 @@ class ContextManager:
         Args:
             n: Number of messages to remove from the end
         """
+        self.truncate_to(len(self._roles) - n)
+
+    def truncate_to(self, n: int) -> None:
+        """
+        Drop messages from the end of context until at most n remain.
+        Lets callers roll back to a length snapshot in one call.
+
+        Args:
+            n: Number of messages to keep
+        """
+        roles = self._roles
+        pop_role = roles.pop
+        pop_content = self._contents.pop
         removed = 0
-        for _ in range(min(n, len(self.context))):
-            self.context.pop()
+        while len(roles) > max(n, 0):
+            pop_role()
+            pop_content()
             removed += 1
-        self._safe_log("debug", "Removed last %s messages from context; remaining=%s", removed, len(self.context))
+        # A rollback can make room again, so re-derive the budgeted window
+        self.maybe_compact()
+        if self._debug:
+            self.logger.debug("Removed last %s messages from context; remaining=%s", removed, len(roles))
+
+    # ------------------------------------------------------------------
+    # Transcript (cold tier)
+    # ------------------------------------------------------------------
+
+    def _write_transcript(self, message_id: int, role: str, content: str) -> None:
+        try:
+            if self._transcript_file is None:
+                directory = os.path.dirname(self.transcript_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # Line-buffered so every message reaches disk even if the agent is killed
+                self._transcript_file = open(self.transcript_path, "a", encoding="utf-8", buffering=1)
+            self._transcript_file.write(json.dumps(
+                {"id": message_id, "ts": datetime.now().isoformat(), "role": role, "content": content},
+                ensure_ascii=False,
+            ) + "\n")
+        except Exception:
+            self._safe_log("exception", "Failed to write transcript to %s; disabling it", self.transcript_path)
+            self.transcript_path = None
+
+    def load_transcript(
+        self,
+        first_id: Optional[int] = None,
+        last_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Read messages back from the on-disk transcript, e.g. ones that were
+        already folded into the rolling summary.
+
+        Args:
+            first_id: Smallest message id to return (inclusive)
+            last_id: Largest message id to return (inclusive)
+        """
+        if not self.transcript_path or not os.path.exists(self.transcript_path):
+            return []
+        messages = []
+        with open(self.transcript_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                message_id = entry.get("id", -1)
+                if first_id is not None and message_id < first_id:
+                    continue
+                if last_id is not None and message_id > last_id:
+                    break
+                messages.append(entry)
+        return messages
+
+    def close_transcript(self) -> None:
+        if self._transcript_file is not None:
+            try:
+                self._transcript_file.close()
+            except Exception:
+                pass
+            self._transcript_file = None
 
     def cleanup_request_history(self, max_entries: Optional[int] = None) -> None:
         """
@@ -272,33 +587,51 @@ class ContextManager:
         Keeps only the most recent entries.
         """
         if max_entries is not None:
-            # Zmień maxlen deque tymczasowo
             old_maxlen = self.request_history.maxlen
-            self.request_history = deque(list(self.request_history)[-max_entries:], maxlen=max_entries)
-            self._safe_log(
-                "debug",
-                "Cleaned up request_history; kept %s most recent entries (was maxlen=%s)",
-                max_entries, old_maxlen
-            )
+            if max_entries == old_maxlen:
+                # The deque already evicts oldest entries on append
+                return
+            # Zmień maxlen deque tymczasowo
+            history = self.request_history
+            start = max(len(history) - max_entries, 0)
+            self.request_history = deque(islice(history, start, None), maxlen=max_entries)
+            if self._debug:
+                self.logger.debug(
+                    "Cleaned up request_history; kept %s most recent entries (was maxlen=%s)",
+                    max_entries, old_maxlen
+                )
         else:
             self.request_history.clear()
 
     def clear_context(self) -> None:
-        self.context.clear()
-        self._rolling_summary = None
+        self._roles.clear()
+        self._contents.clear()
+        self._active_window = self.window_size
+        self._set_rolling_summary(None)
         self._summary_upto_index = 2
+        self._window_cache_key = None
         self.reset_summary_metrics()
 
     def clear_request_history(self) -> None:
         self.request_history.clear()
 
     def reset_summary_metrics(self) -> None:
-        for k in self._summary_metrics:
-            self._summary_metrics[k] = 0
-        self._last_truncation_warning = None
+        self._initial_summaries = 0
+        self._update_summaries = 0
+        self._total_messages_summarized = 0
+        self._truncation_count = 0
+        self._frequent_truncation_alerts = 0
+        self._summary_content_cache_hits = 0
+        # time.monotonic() of the last truncation
+        self._last_truncation_warning: Optional[float] = None
 
     def get_summary_metrics(self) -> Dict[str, Any]:
         return {
-            **self._summary_metrics,
+            "initial_summaries": self._initial_summaries,
+            "update_summaries": self._update_summaries,
+            "total_messages_summarized": self._total_messages_summarized,
+            "truncation_count": self._truncation_count,
+            "frequent_truncation_alerts": self._frequent_truncation_alerts,
+            "summary_content_cache_hits": self._summary_content_cache_hits,
             "current_summary_length": len(self._rolling_summary) if self._rolling_summary else 0,
         }
@@ -68,6 +68,11 @@ class FileOperator:
     def _scp_target(self, remote: str, path: str) -> str:
         return f"{remote}:{self._q(path)}"
 
+    def _ssh_options(self) -> list:
+        # Share the terminal's multiplexed SSH connection when it provides one
+        options = getattr(self.terminal, "ssh_multiplex_options", None)
+        return options() if callable(options) else []
+
     def write_file(self, file_path, content, explain=""):
         """
         Write file content to the specified path, handling both local and remote operations.
@@ -128,7 +133,7 @@ class FileOperator:
             self.terminal.execute_remote_pexpect(rm_tmp_cmd, remote, password=password)
 
             scp_cmd = (
-                ["scp"]
+                ["scp"] + self._ssh_options()
                 + (["-P", str(self.terminal.port)] if self.terminal.port else [])
                 + [tmpf_path, self._scp_target(remote, remote_tmp_path)]
             )
@@ -256,7 +261,7 @@ class FileOperator:
 
                 # Get remote file
                 scp_get = (
-                    ["scp"]
+                    ["scp"] + self._ssh_options()
                     + (["-P", str(self.terminal.port)] if self.terminal.port else [])
                     + [self._scp_target(remote, file_path), local_tmp_path]
                 )
@@ -275,7 +280,7 @@ class FileOperator:
 
                     # Send back edited file directly to target location
                     scp_put = (
-                        ["scp"]
+                        ["scp"] + self._ssh_options()
                         + (["-P", str(self.terminal.port)] if self.terminal.port else [])
                         + [local_tmp_path, self._scp_target(remote, file_path)]
                     )
@@ -215,10 +215,7 @@ class FinishSubAgent:
 
         # Collect conversation history from context manager
         try:
-            all_messages = list(getattr(context_manager, '_messages', []))
-            if not all_messages:
-                # Try alternative attribute names
-                all_messages = list(getattr(context_manager, 'messages', []))
+            all_messages = getattr(context_manager, 'context', ())
 
             for msg in all_messages:
                 role = msg.get("role", "")
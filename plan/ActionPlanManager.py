@@ -8,7 +8,7 @@ import json
 import os
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from dataclasses import dataclass, field, asdict
 from rich.console import Console
 from rich.table import Table
@@ -246,6 +246,46 @@ class ActionPlanManager:
             self.logger.warning(f"[ActionPlanManager] Step {step_number} does not exist")
         return False
 
+    def mark_steps_bulk(self, updates: List[Tuple[int, StepStatus, Optional[str]]]) -> int:
+        """
+        Change the status of several plan steps in one pass.
+        
+        Args:
+            updates: List of (step_number, status, result) tuples, applied in order
+            
+        Returns:
+            Number of steps updated
+        """
+        if not updates:
+            return 0
+        
+        steps_by_number = {step.number: step for step in self.steps}
+        now = datetime.now().isoformat()
+        updated = 0
+        
+        for step_number, status, result in updates:
+            step = steps_by_number.get(step_number)
+            if step is None:
+                if self.logger:
+                    self.logger.warning(f"[ActionPlanManager] Step {step_number} does not exist")
+                continue
+            
+            step.status = status
+            if status == StepStatus.IN_PROGRESS:
+                step.timestamp_start = now
+            elif status in [StepStatus.COMPLETED, StepStatus.FAILED, StepStatus.SKIPPED]:
+                step.timestamp_end = now
+            
+            if result:
+                step.result = result
+            updated += 1
+        
+        if updated:
+            self.updated_at = now
+            if self.logger:
+                self.logger.info(f"[ActionPlanManager] Bulk update of {updated} step(s)")
+        return updated
+
     def mark_step_done(self, step_number: int, result: Optional[str] = None) -> bool:
         """Mark step as completed."""
         return self.mark_step_status(step_number, StepStatus.COMPLETED, result)
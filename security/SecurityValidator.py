@@ -2,8 +2,16 @@ import os
 import re
 import shlex
 import unicodedata
+from collections import OrderedDict
 from urllib.parse import unquote
-from typing import Set, List, Tuple
+from typing import Set, List, Tuple, Optional
+
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    hyperscan = None
+    HYPERSCAN_AVAILABLE = False
 
 class SecurityValidator:
     """
@@ -17,6 +25,9 @@ class SecurityValidator:
     - Managing allowed paths for file operations
     """
 
+    # Maximum number of command verdicts memoized by validate_command()
+    VALIDATION_CACHE_SIZE = 2048
+
     def __init__(self, dangerous_commands: Set[str] = None, allowed_paths: List[str] = None):
         """
         Initialize the SecurityValidator with optional custom dangerous commands and allowed paths.
@@ -43,6 +54,7 @@ class SecurityValidator:
         # Allowed paths for file operations
         self.allowed_paths = allowed_paths or ['/tmp', '/var/tmp', '/home', '/usr/local', '/opt']
         self._dangerous_regexes = self._build_dangerous_regexes(self.dangerous_commands)
+        self._hs_db = self._build_hyperscan_db(self._dangerous_regexes)
         self._chain_split_re = re.compile(r'\s*(?:&&|\|\||;|\n)\s*')
         self._blocked_paths = (
             "/proc",
@@ -51,6 +63,8 @@ class SecurityValidator:
             "/etc/shadow",
             "/root/.ssh",
         )
+        # Command string -> (is_valid, reason); cleared whenever the rules change
+        self._validation_cache: "OrderedDict[str, Tuple[bool, str]]" = OrderedDict()
 
     def validate_command(self, command: str) -> Tuple[bool, str]:
         """
@@ -65,6 +79,19 @@ class SecurityValidator:
         if not command or not isinstance(command, str):
             return False, "Command must be a non-empty string"
 
+        cache = self._validation_cache
+        cached = cache.get(command)
+        if cached is not None:
+            cache.move_to_end(command)
+            return cached
+
+        result = self._validate_command_uncached(command)
+        cache[command] = result
+        if len(cache) > self.VALIDATION_CACHE_SIZE:
+            cache.popitem(last=False)
+        return result
+
+    def _validate_command_uncached(self, command: str) -> Tuple[bool, str]:
         normalized = self._normalize_command(command)
         if not normalized:
             return False, "Command must be a non-empty string"
@@ -131,6 +158,8 @@ class SecurityValidator:
         if command_pattern and isinstance(command_pattern, str):
             self.dangerous_commands.add(command_pattern)
             self._dangerous_regexes = self._build_dangerous_regexes(self.dangerous_commands)
+            self._hs_db = self._build_hyperscan_db(self._dangerous_regexes)
+            self._validation_cache.clear()
 
     def remove_dangerous_command(self, command_pattern: str):
         """
@@ -142,6 +171,8 @@ class SecurityValidator:
         if command_pattern in self.dangerous_commands:
             self.dangerous_commands.remove(command_pattern)
             self._dangerous_regexes = self._build_dangerous_regexes(self.dangerous_commands)
+            self._hs_db = self._build_hyperscan_db(self._dangerous_regexes)
+            self._validation_cache.clear()
 
     def add_allowed_path(self, path: str):
         """
@@ -185,10 +216,45 @@ class SecurityValidator:
                 regexes.append(re.compile(escaped))
         return regexes
 
-    def _validate_segment(self, segment: str) -> Tuple[bool, str]:
+    def _build_hyperscan_db(self, regexes: List[re.Pattern]) -> Optional["hyperscan.Database"]:
+        """Compile the dangerous regexes into one Hyperscan database, or None to use re."""
+        if not HYPERSCAN_AVAILABLE or not regexes:
+            return None
+        try:
+            db = hyperscan.Database()
+            db.compile(
+                expressions=[regex.pattern.encode("utf-8") for regex in regexes],
+                ids=list(range(len(regexes))),
+                flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(regexes),
+            )
+            return db
+        except Exception:
+            # Pattern syntax Hyperscan cannot handle; keep the re fallback
+            return None
+
+    def _find_dangerous_regex(self, segment: str) -> Optional[re.Pattern]:
+        """Return the first dangerous regex (in list order) that matches segment."""
+        if self._hs_db is not None:
+            matched_ids: List[int] = []
+
+            def on_match(pattern_id, start, end, flags, context):
+                matched_ids.append(pattern_id)
+
+            try:
+                self._hs_db.scan(segment.encode("utf-8"), match_event_handler=on_match)
+                return self._dangerous_regexes[min(matched_ids)] if matched_ids else None
+            except Exception:
+                pass
+
         for regex in self._dangerous_regexes:
             if regex.search(segment):
-                return False, f"Command contains dangerous pattern: '{regex.pattern}'"
+                return regex
+        return None
+
+    def _validate_segment(self, segment: str) -> Tuple[bool, str]:
+        regex = self._find_dangerous_regex(segment)
+        if regex is not None:
+            return False, f"Command contains dangerous pattern: '{regex.pattern}'"
 
         try:
             tokens = shlex.split(segment)
@@ -1,11 +1,15 @@
 import requests
+from requests.adapters import HTTPAdapter
+import json
 import logging
 import os
 import subprocess
 import sys
 import random
 import argparse
+import atexit
 import shutil
+import stat
 import tempfile
 from dotenv import load_dotenv
 from openai import OpenAI
@@ -274,6 +278,8 @@ class term_agent:
         self.ollama_url = self.engine_models["ollama"]["url"]
         self.ollama_model = self.engine_models["ollama"]["model"]
         self.ollama_temperature = self.engine_models["ollama"]["temperature"]
+        # Stream Ollama completions so the reply can be cut off once a full JSON object has arrived
+        self.ollama_stream = True if os.getenv("OLLAMA_STREAM", "true").lower() == "true" else False
         self.llama_cpp_url = self.engine_models["llama-cpp"]["url"]
         self.llama_cpp_model = self.engine_models["llama-cpp"]["model"]
         self.llama_cpp_temperature = self.engine_models["llama-cpp"]["temperature"]
@@ -290,6 +296,10 @@ class term_agent:
         self.codex_model = self.engine_models["codex-cli"]["model"]
         self.codex_command = self.engine_models["codex-cli"]["command"]
         self.ssh_remote_timeout = int(os.getenv("SSH_REMOTE_TIMEOUT", "120"));
+        # OpenSSH connection multiplexing: keep the master connection alive this long
+        # after the last command (e.g. "60s", "10m"); "no"/"0"/empty disables it
+        self.ssh_control_persist = os.getenv("SSH_CONTROL_PERSIST", "60s").strip()
+        self._ssh_control_dir = None  # set once the private socket directory is verified
         self.local_command_timeout = int(os.getenv("LOCAL_COMMAND_TIMEOUT", "300"))
         # AI API timeout and retry configuration
         self.ai_api_timeout = int(os.getenv("AI_API_TIMEOUT", "120"))
@@ -320,6 +330,116 @@ class term_agent:
         # Workspace directory - defaults to pwd or override from .env
         self.workspace = os.getenv("WORKSPACE_DIR", "") or os.getcwd()
 
+        # SDK clients reused across requests so their HTTP connection pools
+        # (keep-alive, TLS sessions) survive between agent steps
+        self._api_clients = {}
+        # Shared HTTP session for the plain-HTTP engines (Ollama, llama.cpp) and
+        # their health probes, so each request reuses a pooled keep-alive connection
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+        # Optional CPU pinning for latency-sensitive runs, e.g. VAULTAI_CPU=2 or VAULTAI_CPU=2,3
+        self.apply_cpu_affinity(os.getenv("VAULTAI_CPU", ""))
+
+    def apply_cpu_affinity(self, cpu_spec):
+        """
+        Pin the agent process to the given CPUs (Linux only).
+
+        Args:
+            cpu_spec: Comma-separated CPU ids and ranges, e.g. "2", "2,3" or "2-3"
+        """
+        cpu_spec = (cpu_spec or "").strip()
+        if not cpu_spec:
+            return
+        if not hasattr(os, "sched_setaffinity"):
+            self.logger.warning("VAULTAI_CPU is set but CPU affinity is not supported on this platform.")
+            return
+        try:
+            cpus = set()
+            for part in cpu_spec.split(","):
+                part = part.strip()
+                if "-" in part:
+                    first, last = part.split("-", 1)
+                    cpus.update(range(int(first), int(last) + 1))
+                elif part:
+                    cpus.add(int(part))
+            os.sched_setaffinity(0, cpus)
+            self.logger.info(f"Pinned agent process to CPU(s): {sorted(cpus)}")
+        except (ValueError, OSError) as e:
+            self.logger.warning(f"Invalid VAULTAI_CPU value '{cpu_spec}': {e}")
+
+    def ssh_multiplex_options(self):
+        """
+        Return ssh/scp options that share one authenticated connection per host.
+
+        The first ssh call becomes the ControlMaster; later ssh and scp calls to
+        the same user@host:port reuse its socket and skip the TCP and
+        authentication handshakes. Returns [] when SSH_CONTROL_PERSIST disables it
+        or no private socket directory is available.
+        """
+        persist = self.ssh_control_persist
+        if not persist or persist.lower() in ("no", "0", "false", "off"):
+            return []
+        control_dir = self._ssh_control_directory()
+        if control_dir is None:
+            return []
+        return [
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPersist={persist}",
+            # %C is a hash of local host, remote host, port and user: short enough for socket paths
+            "-o", f"ControlPath={os.path.join(control_dir, 'cm-%C')}",
+        ]
+
+    def _ssh_control_directory(self):
+        """
+        Per-process directory for ControlMaster sockets under ~/.ssh.
+
+        Anyone who can create or write to the socket directory can hijack the
+        shared sessions, so it is only used if it is a real directory owned by
+        this user with no group/other permissions. Masters left running by
+        ControlPersist are shut down by close_ssh_masters() at exit.
+        """
+        if self._ssh_control_dir is not None:
+            return self._ssh_control_dir
+        ssh_dir = os.path.join(os.path.expanduser("~"), ".ssh")
+        control_dir = os.path.join(ssh_dir, f"vaultai-cm-{os.getpid()}")
+        try:
+            os.makedirs(ssh_dir, mode=0o700, exist_ok=True)
+            os.makedirs(control_dir, mode=0o700, exist_ok=True)
+            for path in (ssh_dir, control_dir):
+                st = os.lstat(path)
+                if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+                    raise PermissionError(f"{path} must be a directory owned by the current user with mode 0700")
+        except OSError as e:
+            self.logger.warning(f"SSH connection sharing disabled, unsafe or unusable socket directory: {e}")
+            return None
+        self._ssh_control_dir = control_dir
+        atexit.register(self.close_ssh_masters)
+        return control_dir
+
+    def close_ssh_masters(self):
+        """Stop the ControlMaster processes this agent started and remove their socket directory."""
+        control_dir = self._ssh_control_dir
+        if control_dir is None:
+            return
+        self._ssh_control_dir = None
+        try:
+            sockets = os.listdir(control_dir)
+        except OSError:
+            sockets = []
+        for name in sockets:
+            # The ControlPath is literal here, so the destination is only a placeholder
+            try:
+                subprocess.run(
+                    ["ssh", "-o", f"ControlPath={os.path.join(control_dir, name)}", "-O", "exit", "vaultai-master"],
+                    capture_output=True, timeout=5,
+                )
+            except (OSError, subprocess.SubprocessError) as e:
+                self.logger.debug(f"Failed to stop SSH master {name}: {e}")
+        shutil.rmtree(control_dir, ignore_errors=True)
+
     def _validate_openai_auth_configuration(self):
         if self.openai_auth_mode == "oauth":
             if not os.getenv("OPENAI_OAUTH_CLIENT_ID", "").strip():
@@ -553,6 +673,18 @@ class term_agent:
     
     # --- Gemini Function ---
 
+    def _get_api_client(self, key, factory):
+        """
+        Return the cached API client for key, creating it with factory() on first use.
+        key should include every constructor argument (engine, API key, timeout, ...)
+        so a changed setting yields a fresh client.
+        """
+        client = self._api_clients.get(key)
+        if client is None:
+            client = factory()
+            self._api_clients[key] = client
+        return client
+
     def connect_to_gemini(self, prompt, model=None, max_tokens=None, temperature=None, format='json', timeout=None):
         """
         Send a prompt to Google Gemini and return the response as a string.
@@ -567,7 +699,10 @@ class term_agent:
             timeout = self.ai_api_timeout
 
         try:
-            client = genai.Client(api_key=self.api_key)
+            client = self._get_api_client(
+                ("gemini", self.api_key),
+                lambda: genai.Client(api_key=self.api_key),
+            )
             if format == 'json':
                 response = client.models.generate_content(
                     model=model,
@@ -624,7 +759,10 @@ class term_agent:
 
         
         api_key = self.get_engine_api_key("openai", interactive=False, required=True)
-        client = OpenAI(api_key=api_key, timeout=timeout)
+        client = self._get_api_client(
+            ("openai", api_key, timeout),
+            lambda: OpenAI(api_key=api_key, timeout=timeout),
+        )
         try:
             if format == 'json':
                 response = client.chat.completions.create(
@@ -689,7 +827,7 @@ class term_agent:
             payload["format"] = "json"
 
         try:
-            resp = requests.post(ollama_url, json=payload, timeout=timeout)
+            resp = self.http.post(ollama_url, json=payload, timeout=timeout)
             resp.raise_for_status()
             response_text = resp.text.strip()
             self.logger.info(f"Ollama prompt: {full_prompt}")
@@ -722,6 +860,67 @@ class term_agent:
             self.print_console(f"Ollama connection error: {e}")
             return None
 
+    def connect_to_ollama_stream(self, system_prompt, prompt, model=None, max_tokens=None, temperature=None, ollama_url=None, format="json", timeout=None):
+        """
+        Stream a prompt to Ollama API, yielding response text chunks as they arrive.
+        Closing the generator early closes the HTTP response and stops the generation.
+        """
+        if model is None:
+            model = self.ollama_model
+        if max_tokens is None:
+            max_tokens = self.default_max_tokens
+        if temperature is None:
+            temperature = self.ollama_temperature
+        if ollama_url is None:
+            ollama_url = self.ollama_url
+        if timeout is None:
+            timeout = self.ai_api_timeout
+
+        full_prompt = f"{system_prompt}\n\n{prompt}"
+
+        payload = {
+            "model": model,
+            "prompt": full_prompt,
+            "stream": True,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens
+            }
+        }
+
+        if format == "json":
+            payload["format"] = "json"
+
+        self.logger.info(f"Ollama prompt: {full_prompt}")
+        done = False
+        try:
+            with self.http.post(ollama_url, json=payload, timeout=timeout, stream=True) as resp:
+                resp.raise_for_status()
+                for line in resp.iter_lines():
+                    if not line:
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except ValueError as e:
+                        self.logger.error(f"Failed to parse Ollama stream chunk: {e}")
+                        continue
+                    # /api/generate streams 'response', /api/chat streams 'message.content'
+                    chunk = event.get("response")
+                    if chunk is None and isinstance(event.get("message"), dict):
+                        chunk = event["message"].get("content")
+                    if chunk:
+                        yield chunk
+                    if event.get("done"):
+                        done = True
+                        break
+            if not done:
+                raise ConnectionError("Ollama stream ended before the final 'done' event")
+        except Exception as e:
+            # Re-raise so the caller retries instead of using a truncated reply
+            self.logger.error(f"Ollama connection error: {e}")
+            self.print_console(f"Ollama connection error: {e}")
+            raise
+
     def _normalize_llama_cpp_chat_url(self, url: str) -> str:
         base = (url or "").strip()
         if not base:
@@ -767,12 +966,12 @@ class term_agent:
             headers["Authorization"] = f"Bearer {api_key}"
 
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
+            resp = self.http.post(url, headers=headers, json=payload, timeout=timeout)
             if resp.status_code >= 400 and format == 'json':
                 # Some llama.cpp builds may not support response_format.
                 # Retry once without response_format, rely on prompt instructions for JSON.
                 payload.pop("response_format", None)
-                resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
+                resp = self.http.post(url, headers=headers, json=payload, timeout=timeout)
             resp.raise_for_status()
             data = resp.json()
             message = data.get("choices", [{}])[0].get("message", {})
@@ -807,10 +1006,13 @@ class term_agent:
 
 
         try:
-            client = ollama.Client(
-                host="https://ollama.com",
-                headers={'Authorization': f'Bearer {self.api_key}'},
-                timeout=timeout
+            client = self._get_api_client(
+                ("ollama-cloud", self.api_key, timeout),
+                lambda: ollama.Client(
+                    host="https://ollama.com",
+                    headers={'Authorization': f'Bearer {self.api_key}'},
+                    timeout=timeout
+                ),
             )
             # Compose the prompt with system message for context
             full_prompt = f"{system_prompt}\n\n{prompt}"
@@ -903,10 +1105,13 @@ class term_agent:
             timeout = self.ai_api_timeout
             
         # OpenRouter uses the same API format as OpenAI
-        client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://openrouter.ai/api/v1",
-            timeout=timeout
+        client = self._get_api_client(
+            ("openrouter", self.api_key, timeout),
+            lambda: OpenAI(
+                api_key=self.api_key,
+                base_url="https://openrouter.ai/api/v1",
+                timeout=timeout
+            ),
         )
 
         try:
@@ -979,7 +1184,10 @@ class term_agent:
             return None
 
         try:
-            client = Groq(api_key=self.api_key, timeout=timeout)
+            client = self._get_api_client(
+                ("groq", self.api_key, timeout),
+                lambda: Groq(api_key=self.api_key, timeout=timeout),
+            )
             
             full_prompt = f"{role_system_content}\n\n{prompt}"
 
@@ -1108,7 +1316,7 @@ class term_agent:
                 return 1, '', str(e)
         else:
             self.logger.info(f"Running remote command: {command} on {remote}")
-            ssh_command = ["ssh", remote, command]
+            ssh_command = ["ssh", *self.ssh_multiplex_options(), remote, command]
             try:
                 result = subprocess.run(ssh_command, capture_output=True, text=True)
                 self.logger.debug(f"Remote command output: {result.stdout}")
@@ -1142,9 +1350,10 @@ class term_agent:
                 text=True,
                 timeout=timeout
             )
-            self.logger.debug(f"Local command output: {result.stdout}")
+            # Lazy %-formatting: stdout can be large and debug is usually disabled
+            self.logger.debug("Local command output: %s", result.stdout)
             if result.stderr:
-                self.logger.warning(f"Local command stderr: {result.stderr}")
+                self.logger.warning("Local command stderr: %s", result.stderr)
             return result.stdout, result.returncode
         except subprocess.TimeoutExpired as e:
             self.logger.error(f"Local command timed out after {timeout}s: {command}")
@@ -1169,7 +1378,7 @@ class term_agent:
         marker = "__EXITCODE:"
         command = command.replace("'", "'\\''")
         command_with_exit = f"{command}; echo {marker}$?__"
-        ssh_cmd_parts = ["ssh"]
+        ssh_cmd_parts = ["ssh", *self.ssh_multiplex_options()]
         if self.port:
             ssh_cmd_parts.extend(["-p", str(self.port)])
         ssh_cmd_parts.append(remote)
@@ -1277,7 +1486,7 @@ class term_agent:
                 return False, f"OpenAI API unavailable: {e}", self.default_model
         elif self.ai_engine == "ollama":
             try:
-                resp = requests.get(self.ollama_url.replace("/api/generate", ""), timeout=5)
+                resp = self.http.get(self.ollama_url.replace("/api/generate", ""), timeout=5)
                 if resp.status_code == 200:
                     return True, "Ollama API is online.", self.ollama_model
                 else:
@@ -1300,7 +1509,7 @@ class term_agent:
                 }
                 if self.llama_cpp_model:
                     probe_payload["model"] = self.llama_cpp_model
-                resp = requests.post(url, headers=headers, json=probe_payload, timeout=5)
+                resp = self.http.post(url, headers=headers, json=probe_payload, timeout=5)
                 if resp.status_code < 400:
                     return True, "llama.cpp API is online.", self.llama_cpp_model
                 return False, f"llama.cpp API unavailable: HTTP {resp.status_code}", self.llama_cpp_model
@@ -1404,7 +1613,7 @@ class term_agent:
                         
                 elif engine == "ollama":
                     try:
-                        resp = requests.get(self.engine_models[engine]["url"].replace("/api/generate", ""), timeout=5)
+                        resp = self.http.get(self.engine_models[engine]["url"].replace("/api/generate", ""), timeout=5)
                         if resp.status_code == 200:
                             engine_status[engine] = {
                                 "status": "online",
@@ -1438,7 +1647,7 @@ class term_agent:
                         }
                         if self.engine_models[engine].get("model"):
                             probe_payload["model"] = self.engine_models[engine]["model"]
-                        resp = requests.post(url, headers=headers, json=probe_payload, timeout=5)
+                        resp = self.http.post(url, headers=headers, json=probe_payload, timeout=5)
                         if resp.status_code < 400:
                             engine_status[engine] = {
                                 "status": "online",
@@ -1,10 +1,28 @@
-from prompt_toolkit import prompt
+from prompt_toolkit import PromptSession
+from prompt_toolkit.history import DummyHistory
 from prompt_toolkit.key_binding import KeyBindings
 
 class UserInteractionHandler:
     def __init__(self, terminal):
         self.terminal = terminal
         self.key_bindings = self.terminal.create_keybindings()
+        # multiline flag -> PromptSession, built on first use and reused for every later prompt.
+        # Sessions keep no history: one session serves goals, answers and y/N
+        # confirmations alike, and a confirmation must never recall earlier input.
+        self._sessions = {}
+
+    def _get_session(self, multiline: bool) -> PromptSession:
+        session = self._sessions.get(multiline)
+        if session is None:
+            session = PromptSession(
+                multiline=multiline,
+                prompt_continuation=(lambda width, line_number, is_soft_wrap: "... ") if multiline else None,
+                enable_system_prompt=True,
+                key_bindings=self.key_bindings,
+                history=DummyHistory(),
+            )
+            self._sessions[multiline] = session
+        return session
 
     def _get_user_input(self, prompt_text: str, multiline: bool = False) -> str:
         """
@@ -14,13 +32,7 @@ class UserInteractionHandler:
         Returns the entered text (empty string on cancel/EOF).
         """
         try:
-            user_input = prompt(
-                prompt_text,
-                multiline=multiline,
-                prompt_continuation=(lambda width, line_number, is_soft_wrap: "... ") if multiline else None,
-                enable_system_prompt=True,
-                key_bindings=self.key_bindings,
-            )
+            user_input = self._get_session(multiline).prompt(prompt_text)
             return user_input
         except (EOFError, KeyboardInterrupt):
             return ""